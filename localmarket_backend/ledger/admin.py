@@ -1,22 +1,83 @@
+from django import forms
 from django.contrib import admin
-from .models import Account, JournalEntry, LedgerEntry, AccountBalance
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from .models import (
+    Account, JournalEntry, LedgerEntry, AccountBalance, AccountBalanceSlot, AccountingPeriod, BalanceCheckpoint,
+    VendorBalance, Product, StockMovement, StockLevel, WebhookEvent, BankStatementImport, BankStatementLine,
+    Subscription, BillingRun, BillingRunFailure
+)
+from .money import SumCents, from_cents, to_cents
+from .search import search_journals, search_lines
+
+# Below this many rows an exact COUNT(*) is cheap enough
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def estimate_row_count(model):
+    """
+    Approximate row count for a model's table from database statistics.
+    
+    Returns None when the backend has no cheap estimate.
+    """
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        elif connection.vendor == 'mysql':
+            cursor.execute(
+                "SELECT table_rows FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s", [table]
+            )
+        elif connection.vendor == 'sqlite':
+            # Highest rowid: an upper bound read from the end of the b-tree
+            cursor.execute(f'SELECT MAX(rowid) FROM "{table}"')
+        else:
+            return None
+        row = cursor.fetchone()
+    if not row or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses table statistics instead of COUNT(*) for unfiltered
+    changelists of large tables.
+    """
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimate_row_count(self.object_list.model)
+            if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
 
 
 class LedgerEntryInline(admin.TabularInline):
     model = LedgerEntry
     extra = 2
-    fields = ('account', 'debit', 'credit', 'description')
+    fields = ('account', 'debit', 'credit', 'description', 'vendor_id', 'market', 'event', 'category')
     readonly_fields = ()
+    autocomplete_fields = ['account']
 
 
 @admin.register(Account)
 class AccountAdmin(admin.ModelAdmin):
-    list_display = ['account_number', 'account_name', 'account_type', 'normal_balance', 'is_active', 'get_balance']
-    list_filter = ['account_type', 'is_active', 'normal_balance']
+    list_display = ['account_number', 'account_name', 'account_type', 'parent', 'normal_balance', 'is_active', 'counter_slots', 'get_balance']
+    list_filter = ['account_type', 'is_active', 'normal_balance', 'depth']
     search_fields = ['account_number', 'account_name']
     ordering = ['account_number']
+    list_select_related = ['balance', 'parent']
+    autocomplete_fields = ['parent']
+    readonly_fields = ['path', 'depth']
     
     def get_balance(self, obj):
+        if obj.counter_slots:
+            from .services import get_account_balance
+            return f"${get_account_balance(obj):,.2f}"  # Includes the unfolded slots
         try:
             if hasattr(obj, 'balance') and obj.balance:
                 return f"${obj.balance.net_balance:,.2f}"
@@ -26,15 +87,45 @@ class AccountAdmin(admin.ModelAdmin):
     get_balance.short_description = 'Balance'
 
 
+class JournalEntryAdminForm(forms.ModelForm):
+    class Meta:
+        model = JournalEntry
+        fields = '__all__'
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        # Journals in a closed period are frozen, and none can be moved into one
+        from .periods import closed_through
+        last_closed = closed_through()
+        if last_closed is not None:
+            dates = [cleaned_data.get('date')]
+            if self.instance.pk:
+                dates.append(self.initial.get('date'))
+            if any(value is not None and value <= last_closed for value in dates):
+                raise forms.ValidationError(
+                    f"The period is closed through {last_closed}; reopen it to change this journal"
+                )
+        return cleaned_data
+
+
 @admin.register(JournalEntry)
 class JournalEntryAdmin(admin.ModelAdmin):
+    form = JournalEntryAdminForm
     list_display = ['entry_number', 'date', 'description', 'reference_type', 'reference_id', 'status', 'get_total_debits', 'get_total_credits']
     list_filter = ['status', 'reference_type', 'date']
     search_fields = ['description', 'reference_id', 'entry_number']
-    readonly_fields = ['entry_number', 'created_at', 'updated_at']
+    search_help_text = 'Words in the journal or line descriptions, references or vendor IDs, or an entry number'
+    readonly_fields = ['entry_number', 'amount', 'reverses', 'refunded_amount', 'created_at', 'updated_at']
     inlines = [LedgerEntryInline]
     date_hierarchy = 'date'
     
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of LIKE scans; an entry number looks up the key
+        results = search_journals(queryset, search_term)
+        if search_term.strip().isdigit():
+            results |= queryset.filter(entry_number=int(search_term))
+        return results, False
+    
     fieldsets = (
         (None, {
             'fields': ('entry_number', 'date', 'description', 'status')
@@ -43,27 +134,49 @@ class JournalEntryAdmin(admin.ModelAdmin):
             'fields': ('reference_type', 'reference_id'),
             'description': 'Link to external systems (orders, payments, etc.)'
         }),
+        ('Refunds', {
+            'fields': ('amount', 'reverses', 'refunded_amount'),
+            'classes': ('collapse',)
+        }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at'),
             'classes': ('collapse',)
         }),
     )
     
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # Totals computed in the changelist query instead of two queries per row
+        return super().get_queryset(request).annotate(
+            debit_cents=SumCents('ledger_entries__debit'),
+            credit_cents=SumCents('ledger_entries__credit')
+        )
+    
     def get_total_debits(self, obj):
-        return f"${obj.total_debits:,.2f}"
+        return f"${from_cents(obj.debit_cents):,.2f}"
     get_total_debits.short_description = 'Total Debits'
+    get_total_debits.admin_order_field = 'debit_cents'
     
     def get_total_credits(self, obj):
-        return f"${obj.total_credits:,.2f}"
+        return f"${from_cents(obj.credit_cents):,.2f}"
     get_total_credits.short_description = 'Total Credits'
+    get_total_credits.admin_order_field = 'credit_cents'
+    
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None:
+            from .periods import closed_through
+            last_closed = closed_through()
+            if last_closed is not None and obj.date <= last_closed:
+                return False
+        return super().has_delete_permission(request, obj)
     
     def save_model(self, request, obj, form, change):
-        # Auto-post entry if status is posted
+        # Remember the status before saving; balances are updated in save_related
+        # once the inline ledger entries have been written
+        obj._previous_status = form.initial.get('status') if change else None
         super().save_model(request, obj, form, change)
-        if obj.status == 'posted' and not change:
-            # Update balances when posting
-            from .services import update_all_balances
-            update_all_balances()
     
     def save_formset(self, request, form, formset, change):
         # Validate debits = credits when saving inline entries
@@ -75,17 +188,211 @@ class JournalEntryAdmin(admin.ModelAdmin):
             from django.core.exceptions import ValidationError
             raise ValidationError(f"Debits ({total_debits}) must equal credits ({total_credits})")
         
+        # Track every account and vendor whose balance this save can change
+        touched = getattr(form.instance, '_touched_account_ids', set())
+        vendors = getattr(form.instance, '_touched_vendor_ids', set())
+        for obj in formset.deleted_objects:
+            touched.add(obj.account_id)
+            vendors.add(obj.vendor_id)
+            obj.delete()
         for instance in instances:
+            touched.add(instance.account_id)
+            vendors.add(instance.vendor_id)
             instance.save()
+        for inline_form in formset.initial_forms:
+            if 'account' in inline_form.changed_data:
+                touched.add(inline_form.initial.get('account'))  # Line moved off this account
+            if 'vendor_id' in inline_form.changed_data:
+                vendors.add(inline_form.initial.get('vendor_id'))
+        form.instance._touched_account_ids = touched
+        form.instance._touched_vendor_ids = vendors
         formset.save_m2m()
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        obj = form.instance
+        
+        # Keep the journal total used by refund eligibility checks current
+        amount = obj.ledger_entries.aggregate(total=SumCents('debit'))['total']
+        if to_cents(obj.amount) != amount:
+            obj.amount = from_cents(amount)
+            obj.save(update_fields=['amount'])
+        
+        # Update balances for the accounts and vendors this journal touches,
+        # and tell feed consumers about the edit
+        from .services import journal_changed
+        journal_changed(
+            obj,
+            getattr(obj, '_previous_status', None),
+            getattr(obj, '_touched_account_ids', set()),
+            getattr(obj, '_touched_vendor_ids', set()),
+            edited=bool(form.changed_data)
+        )
+    
+    def delete_model(self, request, obj):
+        from .services import delete_journal
+        delete_journal(obj)
+    
+    def delete_queryset(self, request, queryset):
+        # One at a time, so each deleted journal updates balances and the feed
+        from .periods import closed_through
+        from .services import delete_journal
+        last_closed = closed_through()
+        if last_closed is not None:
+            closed = queryset.filter(date__lte=last_closed).count()
+            if closed:
+                self.message_user(request, f'{closed} journal(s) in closed periods were kept.', level='warning')
+            queryset = queryset.filter(date__gt=last_closed)
+        for obj in queryset:
+            delete_journal(obj)
+
+
+class AccountSubsetFilter(admin.SimpleListFilter):
+    """
+    Filter by account, offering only the few accounts get_accounts() returns
+    instead of the whole chart
+    """
+    title = 'account'
+    parameter_name = 'account'
+    
+    def get_accounts(self):
+        raise NotImplementedError
+    
+    def lookups(self, request, model_admin):
+        return [
+            (account.id, f'{account.account_number} {account.account_name}')
+            for account in self.get_accounts().order_by('account_number')
+        ]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(account_id=self.value())
+        return queryset
+
+
+class ShardedAccountFilter(AccountSubsetFilter):
+    def get_accounts(self):
+        return Account.objects.filter(counter_slots__gt=0)
+
+
+class StatementAccountFilter(AccountSubsetFilter):
+    def get_accounts(self):
+        return Account.objects.filter(id__in=BankStatementImport.objects.values('account_id'))
+
+
+class ProductCategoryFilter(admin.SimpleListFilter):
+    """
+    Line category, with choices read from the product catalog rather than a
+    DISTINCT over every ledger line
+    """
+    title = 'category'
+    parameter_name = 'category'
+    
+    def lookups(self, request, model_admin):
+        categories = Product.objects.exclude(category='').values_list('category', flat=True).distinct()
+        return [(category, category) for category in categories.order_by('category')]
+    
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category=self.value())
+        return queryset
+
+
+class LedgerEntryAdminForm(forms.ModelForm):
+    class Meta:
+        model = LedgerEntry
+        fields = '__all__'
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        # Lines of journals in a closed period are frozen, and none can be moved into one
+        from .periods import closed_through
+        last_closed = closed_through()
+        if last_closed is not None:
+            journal_ids = {self.initial.get('journal_entry')} if self.instance.pk else set()
+            if cleaned_data.get('journal_entry') is not None:
+                journal_ids.add(cleaned_data['journal_entry'].pk)
+            if JournalEntry.objects.filter(pk__in=journal_ids - {None}, date__lte=last_closed).exists():
+                raise forms.ValidationError(
+                    f"The period is closed through {last_closed}; reopen it to change this journal's lines"
+                )
+        return cleaned_data
+
+
+def _in_closed_period(journal_entry):
+    from .periods import closed_through
+    last_closed = closed_through()
+    return last_closed is not None and journal_entry.date <= last_closed
 
 
 @admin.register(LedgerEntry)
 class LedgerEntryAdmin(admin.ModelAdmin):
-    list_display = ['id', 'journal_entry', 'account', 'debit', 'credit', 'description']
-    list_filter = ['account', 'journal_entry__date']
+    form = LedgerEntryAdminForm
+    list_display = ['id', 'journal_entry', 'account', 'debit', 'credit', 'description', 'vendor_id', 'market', 'event', 'category']
+    list_filter = ['account__account_type', 'journal_entry__date', ProductCategoryFilter]
     search_fields = ['description', 'account__account_name', 'journal_entry__entry_number']
+    search_help_text = 'Words in the line or journal descriptions, references or vendor IDs, or an entry number'
     readonly_fields = []
+    list_select_related = ['journal_entry', 'account']
+    autocomplete_fields = ['account']
+    raw_id_fields = ['journal_entry']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index instead of LIKE scans; an entry number looks up its lines
+        results = search_lines(queryset, search_term)
+        if search_term.strip().isdigit():
+            results |= queryset.filter(journal_entry_id=int(search_term))
+        return results, False
+    
+    def has_change_permission(self, request, obj=None):
+        if obj is not None and _in_closed_period(obj.journal_entry):
+            return False
+        return super().has_change_permission(request, obj)
+    
+    def has_delete_permission(self, request, obj=None):
+        if obj is not None and _in_closed_period(obj.journal_entry):
+            return False
+        return super().has_delete_permission(request, obj)
+    
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        # A line moved to another account or vendor changes both old and new
+        from .services import journal_changed
+        journal_changed(
+            obj.journal_entry,
+            obj.journal_entry.status,
+            {obj.account_id, form.initial.get('account')} - {None},
+            {obj.vendor_id, form.initial.get('vendor_id')}
+        )
+    
+    def delete_model(self, request, obj):
+        from .services import journal_changed
+        journal = obj.journal_entry
+        super().delete_model(request, obj)
+        journal_changed(journal, journal.status, {obj.account_id}, {obj.vendor_id})
+    
+    def delete_queryset(self, request, queryset):
+        from .periods import closed_through
+        from .services import journal_changed
+        last_closed = closed_through()
+        if last_closed is not None:
+            closed = queryset.filter(journal_entry__date__lte=last_closed).count()
+            if closed:
+                self.message_user(request, f'{closed} line(s) in closed periods were kept.', level='warning')
+            queryset = queryset.filter(journal_entry__date__gt=last_closed)
+        lines = list(queryset.select_related('journal_entry'))
+        super().delete_queryset(request, queryset)
+        journals = {line.journal_entry_id: line.journal_entry for line in lines}
+        for journal_id, journal in journals.items():
+            touched = [line for line in lines if line.journal_entry_id == journal_id]
+            journal_changed(
+                journal,
+                journal.status,
+                {line.account_id for line in touched},
+                {line.vendor_id for line in touched}
+            )
 
 
 @admin.register(AccountBalance)
@@ -97,3 +404,203 @@ class AccountBalanceAdmin(admin.ModelAdmin):
     
     def has_add_permission(self, request):
         return False  # Balances are auto-generated
+
+
+@admin.register(AccountBalanceSlot)
+class AccountBalanceSlotAdmin(admin.ModelAdmin):
+    list_display = ['account', 'slot', 'debit_total', 'credit_total', 'last_updated']
+    list_filter = [ShardedAccountFilter]
+    list_select_related = ['account']
+    readonly_fields = ['account', 'slot', 'debit_total', 'credit_total', 'last_updated']
+    actions = ['compact_slots']
+    
+    def has_add_permission(self, request):
+        return False  # Slots are created by postings
+    
+    @admin.action(description='Fold slots into the account balance')
+    def compact_slots(self, request, queryset):
+        from .services import compact_balance_slots
+        accounts = Account.objects.filter(balance_slots__in=queryset).distinct()
+        folded = sum(compact_balance_slots(account) for account in accounts)
+        self.message_user(request, f'{folded} slot(s) folded.')
+
+
+@admin.register(AccountingPeriod)
+class AccountingPeriodAdmin(admin.ModelAdmin):
+    list_display = ['__str__', 'start', 'end', 'closing_entry', 'closed_at', 'archived_at']
+    readonly_fields = ['start', 'end', 'closing_entry', 'closed_at', 'archived_at']
+    raw_id_fields = ['closing_entry']
+    actions = ['reopen_latest']
+    
+    def has_add_permission(self, request):
+        return False  # Closed with manage.py close_period or the API
+    
+    def has_delete_permission(self, request, obj=None):
+        return False  # Use the reopen action, which also removes the closing journal
+    
+    @admin.action(description='Reopen the latest closed period')
+    def reopen_latest(self, request, queryset):
+        from .periods import reopen_latest_period
+        try:
+            period = reopen_latest_period()
+        except ValueError as e:
+            self.message_user(request, str(e), level='error')
+            return
+        self.message_user(request, f'{period} reopened.')
+
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ['account', 'as_of_date', 'debit_total', 'credit_total']
+    list_filter = ['as_of_date', 'account__account_type']
+    search_fields = ['account__account_name', 'account__account_number']
+    list_select_related = ['account']
+    readonly_fields = ['period', 'account', 'as_of_date', 'debit_total', 'credit_total']
+    
+    def has_add_permission(self, request):
+        return False  # Written when a period is closed
+
+
+@admin.register(VendorBalance)
+class VendorBalanceAdmin(admin.ModelAdmin):
+    list_display = ['vendor_id', 'account', 'debit_total', 'credit_total', 'net_balance', 'last_updated']
+    list_filter = ['account__account_type']
+    search_fields = ['vendor_id']
+    list_select_related = ['account']
+    readonly_fields = ['last_updated']
+    
+    def has_add_permission(self, request):
+        return False  # Balances are auto-generated
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ['slug', 'name', 'vendor_id', 'category', 'price', 'is_active']
+    list_filter = ['is_active', 'category']
+    search_fields = ['slug', 'name', 'vendor_id']
+    prepopulated_fields = {'slug': ('name',)}
+    ordering = ['name']
+
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ['id', 'product', 'movement_type', 'date', 'quantity', 'unit_cost', 'total_cost', 'journal_entry']
+    list_filter = ['movement_type', 'date']
+    search_fields = ['product__slug', 'product__name', 'description']
+    raw_id_fields = ['product', 'journal_entry']
+    
+    def has_change_permission(self, request, obj=None):
+        return False  # Movements are recorded through services to keep StockLevel in sync
+    
+    def has_add_permission(self, request):
+        return False
+
+
+@admin.register(StockLevel)
+class StockLevelAdmin(admin.ModelAdmin):
+    list_display = ['product', 'quantity_on_hand', 'inventory_value', 'quantity_sold', 'cogs_total', 'last_updated']
+    search_fields = ['product__slug', 'product__name']
+    readonly_fields = ['last_updated']
+    
+    def has_add_permission(self, request):
+        return False  # Stock levels are auto-generated
+
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['id', 'event_id', 'event_type', 'status', 'journal_entry', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type']
+    search_fields = ['event_id']
+    raw_id_fields = ['journal_entry']
+    readonly_fields = ['event_id', 'event_type', 'payload', 'journal_entry', 'received_at', 'processed_at']
+    actions = ['retry_events']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False  # Events arrive through the webhook
+    
+    @admin.action(description='Retry selected failed events')
+    def retry_events(self, request, queryset):
+        from .webhooks import schedule_processing
+        count = queryset.filter(status='failed').update(status='pending', error='')
+        schedule_processing()
+        self.message_user(request, f'{count} event(s) queued for posting.')
+
+
+@admin.register(BankStatementImport)
+class BankStatementImportAdmin(admin.ModelAdmin):
+    list_display = ['id', 'account', 'filename', 'line_count', 'imported_at']
+    list_filter = [StatementAccountFilter]
+    readonly_fields = ['account', 'filename', 'line_count', 'imported_at']
+    
+    def has_add_permission(self, request):
+        return False  # Imported with manage.py reconcile_bank or the API
+
+
+@admin.register(BankStatementLine)
+class BankStatementLineAdmin(admin.ModelAdmin):
+    list_display = ['id', 'account', 'date', 'amount', 'description', 'reference', 'status', 'match_method', 'matched_entry']
+    list_filter = ['status', 'match_method', StatementAccountFilter]
+    search_fields = ['description', 'reference']
+    list_select_related = ['account']
+    raw_id_fields = ['statement_import', 'matched_entry']
+    readonly_fields = ['statement_import', 'account', 'date', 'amount', 'description', 'reference', 'fingerprint']
+    date_hierarchy = 'date'
+    actions = ['unmatch_lines']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def save_model(self, request, obj, form, change):
+        # Manual matches keep the ledger line's reconciled flag in step
+        previous = form.initial.get('matched_entry')
+        if 'matched_entry' in form.changed_data:
+            if previous:
+                LedgerEntry.objects.filter(id=previous).update(reconciled=False)
+            if obj.matched_entry_id:
+                obj.status, obj.match_method = 'matched', 'manual'
+                LedgerEntry.objects.filter(id=obj.matched_entry_id).update(reconciled=True)
+            else:
+                obj.status, obj.match_method = 'unmatched', ''
+        super().save_model(request, obj, form, change)
+    
+    @admin.action(description='Unmatch selected lines')
+    def unmatch_lines(self, request, queryset):
+        from .reconciliation import unmatch
+        lines = list(queryset.filter(status='matched'))
+        for line in lines:
+            unmatch(line)
+        self.message_user(request, f'{len(lines)} line(s) unmatched.')
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(admin.ModelAdmin):
+    list_display = ['subscription_id', 'amount', 'interval_months', 'status', 'next_billing_date', 'last_billed_date']
+    list_filter = ['status', 'interval_months']
+    search_fields = ['subscription_id']
+    readonly_fields = ['last_billed_date', 'created_at', 'updated_at']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class BillingRunFailureInline(admin.TabularInline):
+    model = BillingRunFailure
+    fields = ('subscription', 'error', 'created_at')
+    readonly_fields = ('subscription', 'error', 'created_at')
+    extra = 0
+    can_delete = False
+
+
+@admin.register(BillingRun)
+class BillingRunAdmin(admin.ModelAdmin):
+    list_display = ['run_date', 'status', 'chunks', 'posted', 'failed', 'amount', 'started_at', 'finished_at']
+    list_filter = ['status']
+    readonly_fields = ['run_date', 'status', 'checkpoint', 'chunks', 'posted', 'failed', 'amount', 'started_at',
+                       'finished_at']
+    inlines = [BillingRunFailureInline]
+    
+    def has_add_permission(self, request):
+        return False  # Runs are started by manage.py run_billing
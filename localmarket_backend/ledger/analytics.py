@@ -0,0 +1,593 @@
+"""
+Vectorized ledger analytics (optional: needs numpy)
+
+LedgerSnapshot holds every posted ledger line, live and archived, as
+contiguous NumPy column arrays: journal entry number, date (days since
+1970-01-01), account id, debit and credit cents, and dictionary codes for
+the line tags and the journal's reference type. Ad-hoc analysis then runs
+on boolean masks and np.bincount over integer keys instead of ORM loops.
+
+The columns are cached on disk under LEDGER_ANALYTICS_DIR as raw files.
+They are opened with np.memmap, so a fresh process starts without reading
+them. refresh() appends the journals posted since the last entry number and
+follows the outbox feed (feed.py) to notice anything else. It rebuilds when
+a journal is edited or unposted, when a journal commits out of entry-number
+order, or when a period has been archived since the last refresh.
+
+Sums are computed in float64 by np.bincount and rounded back to int cents.
+They are exact while each group total stays under 2**53 cents.
+"""
+import json
+import os
+import sys
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+from django.db.models import Max
+
+from . import archive, feed
+from .models import Account, JournalEntry, LedgerEntry, LedgerEvent
+
+try:
+    import numpy as np
+except ImportError:  # Optional dependency
+    np = None
+
+SNAPSHOT_FORMAT = 1
+META_NAME = 'meta.json'
+FETCH_SIZE = 100_000
+DENSE_GROUP_LIMIT = 1 << 22  # Group combinations summed in dense arrays
+EPOCH = date(1970, 1, 1)
+CLOSING_REFERENCE_TYPE = 'period_close'
+
+# Column name -> dtype
+COLUMNS = {
+    'entry': 'int64',
+    'date': 'int32',
+    'account': 'int32',
+    'debit': 'int64',
+    'credit': 'int64',
+    'vendor_id': 'int32',
+    'market': 'int32',
+    'event': 'int32',
+    'category': 'int32',
+    'reference_type': 'int32',
+}
+TEXT_COLUMNS = ('vendor_id', 'market', 'event', 'category', 'reference_type')
+TIME_BUCKETS = ('date', 'week', 'month', 'quarter', 'year')
+GROUP_KEYS = ('account', 'account_type') + TEXT_COLUMNS + TIME_BUCKETS
+
+
+def _require_numpy():
+    if np is None:
+        raise ImproperlyConfigured('ledger.analytics needs numpy: pip install numpy')
+
+
+def _days(value):
+    if isinstance(value, str):
+        value = date.fromisoformat(value)
+    return (value - EPOCH).days
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'LEDGER_ANALYTICS_DIR', Path(settings.BASE_DIR) / 'analytics'))
+
+
+class LedgerSnapshot:
+    """
+    Posted ledger lines as NumPy columns, with vectorized aggregations.
+
+    Typical use:
+        snapshot = LedgerSnapshot.open()   # loads the cache and refreshes it
+        snapshot.trial_balance(date(2026, 6, 30))
+        snapshot.group_totals(['market', 'month'], account_type='Revenue')
+    """
+
+    def __init__(self, path=None):
+        _require_numpy()
+        self.path = Path(path) if path is not None else snapshot_dir()
+        self.meta = None
+        self.columns = {}
+
+    @classmethod
+    def open(cls, path=None, refresh=True):
+        snapshot = cls(path)
+        snapshot.load()
+        if refresh:
+            snapshot.refresh()
+        return snapshot
+
+    # Cache files
+
+    def load(self):
+        """Map the cached columns, or start empty when there is no cache."""
+        try:
+            with open(self.path / META_NAME, encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            meta = None
+        if meta is None or meta.get('format') != SNAPSHOT_FORMAT or meta.get('byteorder') != _byteorder():
+            self._reset()
+            return
+        self.meta = meta
+        self._map_columns()
+
+    def _reset(self):
+        self.meta = {
+            'format': SNAPSHOT_FORMAT,
+            'byteorder': _byteorder(),
+            'rows': 0,
+            'last_entry': 0,
+            'sequence': 0,
+            'archived_through': None,
+            'dictionaries': {name: [''] for name in TEXT_COLUMNS},
+        }
+        self.columns = {name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}
+
+    def _map_columns(self):
+        rows = self.meta['rows']
+        self.__dict__.pop('_type_codes', None)  # Accounts may have been added
+        self.columns = {}
+        for name, dtype in COLUMNS.items():
+            if rows:
+                self.columns[name] = np.memmap(self.path / f'{name}.bin', dtype=dtype, mode='r', shape=(rows,))
+            else:
+                self.columns[name] = np.zeros(0, dtype=dtype)
+
+    def _write_meta(self):
+        temporary = self.path / f'{META_NAME}.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path / META_NAME)
+
+    def _append(self, chunk, truncate=False):
+        """Append encoded rows ({column: array}) to the column files."""
+        self.path.mkdir(parents=True, exist_ok=True)
+        rows = self.meta['rows']
+        for name, dtype in COLUMNS.items():
+            with open(self.path / f'{name}.bin', 'wb' if truncate else 'r+b' if rows else 'wb') as f:
+                # Drop anything past the recorded rows (an interrupted append)
+                f.truncate(rows * np.dtype(dtype).itemsize)
+                f.seek(0, os.SEEK_END)
+                f.write(np.ascontiguousarray(chunk[name], dtype=dtype).tobytes())
+        self.meta['rows'] = rows + len(chunk['entry'])
+
+    # Building and refreshing
+
+    def _encode_text(self, name, values):
+        dictionary = self.meta['dictionaries'][name]
+        codes = self._codes.setdefault(name, {value: code for code, value in enumerate(dictionary)})
+        encoded = np.empty(len(values), dtype=COLUMNS[name])
+        for index, value in enumerate(values):
+            value = value or ''
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(dictionary)
+                dictionary.append(value)
+            encoded[index] = code
+        return encoded
+
+    def _line_query(self, after_entry):
+        """Posted lines of journals after an entry number, in entry order: raw SQL, int cents."""
+        quote = connection.ops.quote_name
+        line, journal = LedgerEntry._meta, JournalEntry._meta
+        columns = [
+            (journal, 'entry_number'), (journal, 'date'), (line, 'account'), (line, 'debit'), (line, 'credit'),
+            (line, 'vendor_id'), (line, 'market'), (line, 'event'), (line, 'category'), (journal, 'reference_type'),
+        ]
+        select = ', '.join(
+            f'{quote(meta.db_table)}.{quote(meta.get_field(name).column)}' for meta, name in columns
+        )
+        sql = (
+            f'SELECT {select} FROM {quote(line.db_table)} '
+            f'INNER JOIN {quote(journal.db_table)} ON {quote(line.db_table)}.{quote(line.get_field("journal_entry").column)}'
+            f' = {quote(journal.db_table)}.{quote(journal.pk.column)} '
+            f'WHERE {quote(journal.db_table)}.{quote(journal.get_field("status").column)} = %s '
+            f'AND {quote(journal.db_table)}.{quote(journal.pk.column)} > %s '
+            f'ORDER BY {quote(journal.db_table)}.{quote(journal.pk.column)}, {quote(line.db_table)}.{quote(line.pk.column)}'
+        )
+        return sql, ['posted', after_entry]
+
+    def _append_database_lines(self, after_entry):
+        sql, params = self._line_query(after_entry)
+        appended = 0
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(FETCH_SIZE)
+                if not rows:
+                    break
+                fields = list(zip(*rows))
+                chunk = {
+                    'entry': np.fromiter(fields[0], dtype='int64', count=len(rows)),
+                    'date': np.fromiter((_days(value) for value in fields[1]), dtype='int32', count=len(rows)),
+                    'account': np.fromiter(fields[2], dtype='int32', count=len(rows)),
+                    'debit': np.fromiter(fields[3], dtype='int64', count=len(rows)),
+                    'credit': np.fromiter(fields[4], dtype='int64', count=len(rows)),
+                }
+                for offset, name in enumerate(TEXT_COLUMNS, start=5):
+                    chunk[name] = self._encode_text(name, fields[offset])
+                self._append(chunk)
+                self.meta['last_entry'] = max(self.meta['last_entry'], int(chunk['entry'][-1]))
+                appended += len(rows)
+        return appended
+
+    def _append_archived_lines(self):
+        appended = 0
+        for period in archive.archived_periods():
+            with archive.open_archive(period) as period_archive:
+                def column(table, name):
+                    # Copied, so no buffer outlives the archive's memory maps
+                    return np.array(period_archive.column(table, name), dtype='int64')
+
+                statuses = period_archive.dictionary('lines', 'status')
+                posted = column('lines', 'status') == (statuses.index('posted') if 'posted' in statuses else -1)
+                owners = column('lines', 'journal_entry')
+
+                # Entry-number order, like the database lines
+                keep = np.flatnonzero(posted)
+                keep = keep[np.argsort(owners[keep], kind='stable')]
+                chunk = {
+                    'entry': owners[keep],
+                    'date': column('lines', 'date')[keep],
+                    'account': column('lines', 'account')[keep],
+                    'debit': column('lines', 'debit')[keep],
+                    'credit': column('lines', 'credit')[keep],
+                }
+                for name in TEXT_COLUMNS[:-1]:
+                    codes = self._encode_text(name, period_archive.dictionary('lines', name))
+                    chunk[name] = codes[column('lines', name)[keep]]
+
+                # The reference type lives on the journal
+                entries = column('journals', 'entry_number')
+                order = np.argsort(entries)
+                journal_index = order[np.searchsorted(entries, chunk['entry'], sorter=order)]
+                codes = self._encode_text('reference_type', period_archive.dictionary('journals', 'reference_type'))
+                chunk['reference_type'] = codes[column('journals', 'reference_type')[journal_index]]
+
+                self._append(chunk)
+                if len(keep):
+                    self.meta['last_entry'] = max(self.meta['last_entry'], int(chunk['entry'].max()))
+                appended += len(keep)
+        return appended
+
+    def rebuild(self):
+        """Rebuild the cache from the archive and the database."""
+        self._reset()
+        self._codes = {}
+        self._append({name: np.zeros(0, dtype=dtype) for name, dtype in COLUMNS.items()}, truncate=True)
+        self.meta['sequence'] = LedgerEvent.objects.aggregate(last=Max('sequence'))['last'] or 0
+        self.meta['archived_through'] = _iso(archive.archived_through())
+        self._append_archived_lines()
+        # Journals kept out of the archive (e.g. reversed later) are still in
+        # the database, so read every live journal
+        self._append_database_lines(0)
+        self._write_meta()
+        self._map_columns()
+        return self.meta['rows']
+
+    def refresh(self):
+        """
+        Bring the cache up to date.
+
+        Returns:
+            Number of lines appended, or None if the cache was rebuilt
+        """
+        self._codes = {}
+        if self.meta['rows'] == 0 and self.meta['sequence'] == 0:
+            self.rebuild()
+            return None
+        if _iso(archive.archived_through()) != self.meta['archived_through']:
+            self.rebuild()
+            return None
+
+        # Events first: any journal they name has committed, so its lines are
+        # visible to the line query below
+        known = None
+        sequence = self.meta['sequence']
+        while True:
+            events = feed.get_events(sequence, feed.FEED_MAX_PAGE_SIZE)
+            if not events:
+                break
+            for event in events:
+                entry_number = event.payload.get('entry_number')
+                if event.event_type != 'journal.posted':
+                    self.rebuild()
+                    return None
+                if entry_number <= self.meta['last_entry']:
+                    if known is None:
+                        known = np.unique(self.columns['entry'])
+                    position = np.searchsorted(known, entry_number)
+                    if position == len(known) or known[position] != entry_number:
+                        self.rebuild()  # Committed after a higher entry number
+                        return None
+            sequence = events[-1].sequence
+
+        appended = self._append_database_lines(self.meta['last_entry'])
+        self.meta['sequence'] = sequence
+        self._write_meta()
+        self._map_columns()
+        return appended
+
+    # Aggregation
+
+    @property
+    def rows(self):
+        return self.meta['rows']
+
+    def _account_types(self):
+        if not hasattr(self, '_type_codes'):
+            types = [account_type for account_type, _ in Account.ACCOUNT_TYPES]
+            accounts = list(Account.objects.values_list('id', 'account_type'))
+            lookup = np.full(max((account_id for account_id, _ in accounts), default=0) + 1, -1, dtype='int32')
+            for account_id, account_type in accounts:
+                lookup[account_id] = types.index(account_type)
+            self._type_codes = (types, lookup)
+        return self._type_codes
+
+    def mask(self, date_from=None, date_to=None, account_type=None, accounts=None, closing_entries=True,
+             **dimensions):
+        """
+        Boolean mask of the lines matching the filters.
+
+        Args:
+            date_from, date_to: Optional journal date range (inclusive)
+            account_type: Optional account type, e.g. 'Revenue'
+            accounts: Optional list of account ids
+            closing_entries: Include period closing journals (False for
+                activity figures such as the P&L)
+            dimensions: Tag filters, e.g. market='north'
+        """
+        mask = np.ones(self.rows, dtype=bool)
+        dates = self.columns['date']
+        if date_from is not None:
+            mask &= dates >= _days(date_from)
+        if date_to is not None:
+            mask &= dates <= _days(date_to)
+        if account_type is not None:
+            types, lookup = self._account_types()
+            mask &= lookup[self.columns['account']] == types.index(account_type)
+        if accounts is not None:
+            mask &= np.isin(self.columns['account'], list(accounts))
+        if not closing_entries:
+            closing = self._code('reference_type', CLOSING_REFERENCE_TYPE)
+            if closing is not None:
+                mask &= self.columns['reference_type'] != closing
+        for name, value in dimensions.items():
+            code = self._code(name, value)
+            if code is None:
+                return np.zeros(self.rows, dtype=bool)
+            mask &= self.columns[name] == code
+        return mask
+
+    def _code(self, name, value):
+        if name not in TEXT_COLUMNS:
+            raise ValueError(f'Unknown dimension: {name}')
+        dictionary = self.meta['dictionaries'][name]
+        return dictionary.index(value) if value in dictionary else None
+
+    def _key(self, name, mask):
+        """(codes, labels) of a group key for the masked lines; codes are 0..len(labels)-1."""
+        if name == 'account':
+            accounts = self.columns['account'][mask]
+            numbers = dict(Account.objects.values_list('id', 'account_number'))
+            size = int(accounts.max()) + 1 if len(accounts) else 0
+            return accounts, [numbers.get(account_id) for account_id in range(size)]
+        if name == 'account_type':
+            types, lookup = self._account_types()
+            return lookup[self.columns['account'][mask]], types
+        if name in TEXT_COLUMNS:
+            return self.columns[name][mask], list(self.meta['dictionaries'][name])
+        if name in TIME_BUCKETS:
+            buckets = _bucket(self.columns['date'][mask], name)
+            low = int(buckets.min()) if len(buckets) else 0
+            high = int(buckets.max()) if len(buckets) else -1
+            return buckets - low, [_bucket_label(value, name) for value in range(low, high + 1)]
+        raise ValueError(f'Unknown group key: {name}')
+
+    def group_totals(self, by, closing_entries=False, **filters):
+        """
+        Debit/credit totals grouped by any combination of GROUP_KEYS.
+
+        Args:
+            by: List of keys, e.g. ['vendor_id', 'month']
+            closing_entries: Include period closing journals (like
+                pivot_totals(), left out by default)
+            filters: See mask()
+
+        Returns:
+            List of dicts with the key values plus debits, credits and net
+            (credits - debits) in cents, sorted by key; groups without
+            lines are left out. The same shape as services.pivot_totals().
+        """
+        unknown = [name for name in by if name not in GROUP_KEYS]
+        if unknown:
+            raise ValueError(f"Unknown group key(s): {', '.join(unknown)}")
+        mask = self.mask(closing_entries=closing_entries, **filters)
+        keys = [self._key(name, mask) for name in by]
+        if keys:
+            shape = tuple(max(len(labels), 1) for _, labels in keys)
+            flat = np.ravel_multi_index([codes for codes, _ in keys], shape)
+            size = int(np.prod(shape, dtype='int64'))
+            groups = None
+            if size > max(DENSE_GROUP_LIMIT, len(flat)):
+                # Too many possible groups for dense arrays: number the ones present
+                groups, flat = np.unique(flat, return_inverse=True)
+                size = len(groups)
+        else:
+            flat, size, groups = np.zeros(int(mask.sum()), dtype='int64'), 1, None
+        debits = _sum_by(flat, self.columns['debit'][mask], size)
+        credits = _sum_by(flat, self.columns['credit'][mask], size)
+        present = np.flatnonzero(np.bincount(flat, minlength=size)) if keys else np.zeros(1, dtype='int64')
+
+        result = []
+        for position in present.tolist():
+            row = {}
+            if keys:
+                group = position if groups is None else int(groups[position])
+                for name, (_, labels), index in zip(by, keys, np.unravel_index(group, shape)):
+                    row[name] = labels[index]
+            row['debits'] = int(debits[position])
+            row['credits'] = int(credits[position])
+            row['net'] = row['credits'] - row['debits']
+            result.append(row)
+        result.sort(key=lambda row: tuple(row[name] for name in by))
+        return result
+
+    def account_totals(self, **filters):
+        """Totals per account id (like services.account_totals_cents)."""
+        mask = self.mask(**filters)
+        accounts = self.columns['account'][mask]
+        size = int(accounts.max()) + 1 if len(accounts) else 0
+        debits = _sum_by(accounts, self.columns['debit'][mask], size)
+        credits = _sum_by(accounts, self.columns['credit'][mask], size)
+        return {
+            account_id: (int(debits[account_id]), int(credits[account_id]))
+            for account_id in np.flatnonzero(np.bincount(accounts, minlength=size)).tolist()
+            if (debits[account_id], credits[account_id]) != (0, 0)
+        }
+
+    def trial_balance(self, as_of_date=None):
+        """Cumulative totals per account id through a date."""
+        return self.account_totals(date_to=as_of_date)
+
+    def profit_and_loss(self, date_from=None, date_to=None, bucket='month'):
+        """
+        Revenue, expenses and net income per time bucket, in cents.
+
+        Closing journals are left out, as in the P&L report.
+        """
+        rows = self.group_totals([bucket, 'account_type'], date_from=date_from, date_to=date_to)
+        periods = {}
+        for row in rows:
+            figures = periods.setdefault(row[bucket], {'revenue': 0, 'expenses': 0})
+            if row['account_type'] == 'Revenue':
+                figures['revenue'] += row['net']
+            elif row['account_type'] == 'Expense':
+                figures['expenses'] -= row['net']
+        return [
+            {bucket: label, **figures, 'net_income': figures['revenue'] - figures['expenses']}
+            for label, figures in sorted(periods.items())
+        ]
+
+    def cohort_totals(self, entity='vendor_id', bucket='month', **filters):
+        """
+        Net totals by cohort (the bucket an entity first appears in) and bucket.
+
+        Cohorts are assigned from all lines tagged with the entity; filters
+        (see mask()) then pick the lines that are summed, e.g.
+        account_type='Revenue'.
+
+        Returns:
+            List of dicts {cohort, <bucket>, entities, net} sorted by cohort
+            and bucket, net in cents
+        """
+        if entity not in TEXT_COLUMNS:
+            raise ValueError(f'Unknown entity: {entity}')
+        codes = self.columns[entity]
+        buckets = _bucket(self.columns['date'], bucket)
+        tagged = codes != 0  # Code 0 is the blank tag
+        first = np.full(len(self.meta['dictionaries'][entity]), np.iinfo('int64').max, dtype='int64')
+        np.minimum.at(first, codes[tagged], buckets[tagged])
+
+        mask = self.mask(**filters) & tagged
+        cohort = first[codes[mask]]
+        period = buckets[mask]
+        low = int(min(cohort.min(), period.min())) if mask.any() else 0
+        span = int(max(cohort.max(), period.max())) - low + 1 if mask.any() else 1
+        flat = (cohort - low) * span + (period - low)
+        net = _sum_by(flat, self.columns['credit'][mask], span * span) - _sum_by(flat, self.columns['debit'][mask], span * span)
+        # Distinct (group, entity) pairs, then entities per group
+        size = len(first)
+        pairs = np.unique(flat * size + codes[mask])
+        entities = np.bincount(pairs // size, minlength=span * span)
+        return [
+            {
+                'cohort': _bucket_label(low + position // span, bucket),
+                bucket: _bucket_label(low + position % span, bucket),
+                'entities': int(entities[position]),
+                'net': int(net[position]),
+            }
+            for position in np.flatnonzero(entities)
+        ]
+
+    def distribution(self, by='vendor_id', percentiles=(10, 25, 50, 75, 90), **filters):
+        """
+        Spread of per-entity totals, e.g. vendor payouts.
+
+        Args:
+            by: Tag column whose values are the entities (blank tags skipped)
+            filters: See mask(); e.g. accounts=[payables.id],
+                reference_type='payment' for payouts
+
+        Returns:
+            Dict with count, total, mean, min, max and the percentiles of
+            the entities' debits - credits, in cents
+        """
+        mask = self.mask(**filters) & (self.columns[by] != 0)
+        codes = self.columns[by][mask]
+        size = len(self.meta['dictionaries'][by])
+        amounts = _sum_by(codes, self.columns['debit'][mask], size) - _sum_by(codes, self.columns['credit'][mask], size)
+        amounts = amounts[np.bincount(codes, minlength=size) > 0]
+        if not len(amounts):
+            return {'count': 0, 'total': 0, 'mean': 0, 'min': 0, 'max': 0, 'percentiles': {}}
+        return {
+            'count': len(amounts),
+            'total': int(amounts.sum()),
+            'mean': float(amounts.mean()),
+            'min': int(amounts.min()),
+            'max': int(amounts.max()),
+            'percentiles': {
+                str(percentile): float(value)
+                for percentile, value in zip(percentiles, np.percentile(amounts, percentiles))
+            },
+        }
+
+
+def _byteorder():
+    return sys.byteorder
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def _sum_by(keys, values, size):
+    """Integer sums of values per key 0..size-1 (float64 bincount, exact below 2**53)."""
+    if size == 0:
+        return np.zeros(0, dtype='int64')
+    return np.rint(np.bincount(keys, weights=values, minlength=size)).astype('int64')
+
+
+def _bucket(days, name):
+    """Bucket numbers of day numbers: dates, weeks (from Monday), months, quarters or years since 1970."""
+    days = np.asarray(days, dtype='int64')
+    if name == 'date':
+        return days
+    if name == 'week':
+        return (days + 3) // 7  # 1970-01-01 was a Thursday
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype('int64')
+    if name == 'month':
+        return months
+    if name == 'quarter':
+        return months // 3
+    if name == 'year':
+        return months // 12
+    raise ValueError(f'Unknown time bucket: {name}')
+
+
+def _bucket_label(value, name):
+    if name == 'date':
+        return (EPOCH + timedelta(days=value)).isoformat()
+    if name == 'week':
+        return (EPOCH + timedelta(days=value * 7 - 3)).isoformat()  # The Monday
+    if name == 'month':
+        return f'{1970 + value // 12:04d}-{value % 12 + 1:02d}'
+    if name == 'quarter':
+        return f'{1970 + value // 4:04d}-Q{value % 4 + 1}'
+    return f'{1970 + value:04d}'
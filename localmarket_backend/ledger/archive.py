@@ -0,0 +1,675 @@
+"""
+Columnar archive of closed periods
+
+Archiving a closed month moves its journals and ledger lines out of the
+database into LEDGER_ARCHIVE_DIR/<YYYY-MM>/, one file per field:
+
+- Each column file is a flat array of native integers (array module
+  typecodes, narrowed to the smallest width that fits). A column can be
+  memory-mapped and indexed in place, without parsing.
+- Text fields are dictionary-encoded: the column holds codes, and the
+  distinct values are stored once in a zlib-compressed JSON list.
+- Dates are days since 1970-01-01, money is integer cents, timestamps are
+  microseconds since the epoch (UTC) and missing references are 0.
+- manifest.json lists the columns with their SHA-256, plus the per-account
+  and per-vendor totals of the posted lines. It is written last, so a
+  directory without one is an unfinished archive.
+
+Lines are sorted by journal date, so a date range is two bisects on the
+date column. Balances and account reports of archived months come from the
+period checkpoints. Dates inside an archived month, dimension filters,
+pivots and the audit/export read path scan the archive.
+
+Some rows stay in the database: closing journals, and journals reversed by
+a journal dated after the period (the reversal still points at them).
+Stock movements also stay, with their journal link cleared. Bank statement
+lines keep their match status, and the archive records the statement line
+each archived ledger line was matched to.
+"""
+import bisect
+import csv
+import hashlib
+import json
+import mmap
+import os
+import sys
+import zlib
+from array import array
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import (
+    Account, AccountingPeriod, BankStatementLine, JournalEntry, LedgerEntry, LedgerEvent,
+    StockMovement, WebhookEvent
+)
+from .money import from_cents, to_cents
+
+ARCHIVE_FORMAT = 1
+MANIFEST_NAME = 'manifest.json'
+DELETE_BATCH_SIZE = 900  # Stays under SQLite's bound-parameter limit
+INT_TYPECODES = ('b', 'h', 'i', 'q')  # 1, 2, 4 and 8 byte signed integers
+EPOCH = date(1970, 1, 1)
+EPOCH_DATETIME = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+# (column, ORM lookup, kind) per table. Kinds: int, ref (0 = None), bool,
+# money (cents), date (days), time (microseconds), str (dictionary codes)
+JOURNAL_COLUMNS = (
+    ('entry_number', 'entry_number', 'int'),
+    ('date', 'date', 'date'),
+    ('description', 'description', 'str'),
+    ('reference_type', 'reference_type', 'str'),
+    ('reference_id', 'reference_id', 'str'),
+    ('status', 'status', 'str'),
+    ('amount', 'amount', 'money'),
+    ('reverses', 'reverses_id', 'ref'),
+    ('refunded_amount', 'refunded_amount', 'money'),
+    ('created_at', 'created_at', 'time'),
+    ('updated_at', 'updated_at', 'time'),
+)
+LINE_COLUMNS = (
+    ('id', 'id', 'int'),
+    ('journal_entry', 'journal_entry_id', 'int'),
+    ('date', 'journal_entry__date', 'date'),
+    ('status', 'journal_entry__status', 'str'),
+    ('account', 'account_id', 'int'),
+    ('debit', 'debit', 'money'),
+    ('credit', 'credit', 'money'),
+    ('description', 'description', 'str'),
+    ('vendor_id', 'vendor_id', 'str'),
+    ('market', 'market', 'str'),
+    ('event', 'event', 'str'),
+    ('category', 'category', 'str'),
+    ('reconciled', 'reconciled', 'bool'),
+    ('statement_line', 'statement_line__id', 'ref'),
+)
+TABLES = {'journals': JOURNAL_COLUMNS, 'lines': LINE_COLUMNS}
+
+
+def archive_dir():
+    return Path(getattr(settings, 'LEDGER_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive'))
+
+
+def period_path(period):
+    return archive_dir() / str(period)
+
+
+def archived_through():
+    """Last day of the latest archived period, or None if nothing is archived."""
+    return AccountingPeriod.objects.filter(archived_at__isnull=False).aggregate(end=Max('end'))['end']
+
+
+def archived_periods(date_from=None, date_to=None):
+    """
+    Archived periods holding lines dated in [date_from, date_to], oldest first.
+
+    The first period also holds everything before its start (the first close
+    rolls all history).
+    """
+    periods = AccountingPeriod.objects.filter(archived_at__isnull=False).order_by('start')
+    return [
+        period for index, period in enumerate(periods)
+        if (date_from is None or period.end >= date_from)
+        and (date_to is None or index == 0 or period.start <= date_to)
+    ]
+
+
+def open_archive(period):
+    """
+    Open a period's archive for reading.
+
+    Raises:
+        FileNotFoundError: If the period has no complete archive on disk
+    """
+    return PeriodArchive(period_path(period))
+
+
+# Encoding
+
+def _encode(kind, value):
+    if kind == 'money':
+        return to_cents(value)
+    if kind == 'date':
+        return (value - EPOCH).days
+    if kind == 'time':
+        if value is None:
+            return 0
+        if timezone.is_naive(value):
+            value = timezone.make_aware(value, dt_timezone.utc)
+        return (value - EPOCH_DATETIME) // timedelta(microseconds=1)
+    if kind == 'bool':
+        return int(bool(value))
+    return int(value or 0)  # int, ref
+
+
+def _decode(kind, value):
+    if kind == 'money':
+        return from_cents(value)
+    if kind == 'date':
+        return EPOCH + timedelta(days=value)
+    if kind == 'time':
+        return EPOCH_DATETIME + timedelta(microseconds=value) if value else None
+    if kind == 'bool':
+        return bool(value)
+    if kind == 'ref':
+        return value or None
+    return value
+
+
+def _typecode(values):
+    """Narrowest signed array typecode that holds every value."""
+    low, high = min(values, default=0), max(values, default=0)
+    for typecode in INT_TYPECODES:
+        limit = 1 << (array(typecode).itemsize * 8 - 1)
+        if -limit <= low and high < limit:
+            return typecode
+    raise ValueError(f'Column values out of 64-bit range: {low}..{high}')
+
+
+def _write_file(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_table(path, table, rows):
+    """Write rows (tuples in TABLES[table] order) as column files; returns the column manifest."""
+    columns = {}
+    for index, (name, _, kind) in enumerate(TABLES[table]):
+        entry = {'kind': kind}
+        if kind == 'str':
+            codes, values = {}, []
+            encoded = []
+            for row in rows:
+                code = codes.get(row[index])
+                if code is None:
+                    code = codes[row[index]] = len(values)
+                    values.append(row[index])
+                encoded.append(code)
+            entry['dictionary'] = f'{table}.{name}.dict'
+            entry['dictionary_sha256'] = _write_file(
+                path / entry['dictionary'],
+                zlib.compress(json.dumps(values, ensure_ascii=False).encode(), 9)
+            )
+        else:
+            encoded = [_encode(kind, row[index]) for row in rows]
+        entry['typecode'] = _typecode(encoded)
+        entry['file'] = f'{table}.{name}.col'
+        entry['sha256'] = _write_file(path / entry['file'], array(entry['typecode'], encoded).tobytes())
+        columns[name] = entry
+    return {'rows': len(rows), 'columns': columns}
+
+
+# Reading
+
+class PeriodArchive:
+    """
+    Read access to one archived period.
+
+    Integer columns are memory-mapped and returned as memoryviews; use the
+    archive as a context manager (or call close()) to unmap them.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path / MANIFEST_NAME, encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        if self.manifest.get('format') != ARCHIVE_FORMAT:
+            raise ValueError(f"{self.path}: unsupported archive format {self.manifest.get('format')}")
+        self._columns = {}
+        self._dictionaries = {}
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        columns = list(self._columns.values())
+        self._columns.clear()
+        for column in columns:
+            if isinstance(column, memoryview):
+                column.release()
+        for mapped in self._maps:
+            try:
+                mapped.close()
+            except BufferError:
+                pass  # A caller still holds a slice; the map closes when it is collected
+        self._maps.clear()
+
+    def rows(self, table):
+        return self.manifest[table]['rows']
+
+    def column(self, table, name):
+        """Integer values of a column (codes for text columns), memory-mapped."""
+        key = (table, name)
+        if key not in self._columns:
+            entry = self.manifest[table]['columns'][name]
+            path = self.path / entry['file']
+            if path.stat().st_size == 0:
+                column = array(entry['typecode'])
+            elif self.manifest['byteorder'] != sys.byteorder:
+                # Written on a machine of the other byte order: load and swap
+                column = array(entry['typecode'], path.read_bytes())
+                column.byteswap()
+            else:
+                with open(path, 'rb') as f:
+                    mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._maps.append(mapped)
+                column = memoryview(mapped).cast(entry['typecode'])
+            self._columns[key] = column
+        return self._columns[key]
+
+    def dictionary(self, table, name):
+        """Distinct values of a text column, indexed by code."""
+        key = (table, name)
+        if key not in self._dictionaries:
+            entry = self.manifest[table]['columns'][name]
+            data = (self.path / entry['dictionary']).read_bytes()
+            self._dictionaries[key] = json.loads(zlib.decompress(data))
+        return self._dictionaries[key]
+
+    def value(self, table, name, index):
+        """Decoded value of one cell."""
+        kind = self.manifest[table]['columns'][name]['kind']
+        raw = self.column(table, name)[index]
+        if kind == 'str':
+            return self.dictionary(table, name)[raw]
+        return _decode(kind, raw)
+
+    def row(self, table, index):
+        return {name: self.value(table, name, index) for name, _, _ in TABLES[table]}
+
+    def line_range(self, date_from=None, date_to=None):
+        """(start, stop) indexes of the lines dated in [date_from, date_to]."""
+        dates = self.column('lines', 'date')
+        start = 0 if date_from is None else bisect.bisect_left(dates, _encode('date', date_from))
+        stop = len(dates) if date_to is None else bisect.bisect_right(dates, _encode('date', date_to))
+        return start, max(start, stop)
+
+    def line_filter(self, start, stop, account_ids=None, dimensions=None, posted_only=True):
+        """
+        Indexes in [start, stop) of the lines matching the filters.
+
+        Args:
+            account_ids: Optional collection of account ids
+            dimensions: Optional {dimension: value} filter on line tags
+            posted_only: Skip lines of draft journals
+        """
+        tests = []
+        if posted_only:
+            dimensions = {'status': 'posted', **(dimensions or {})}
+        if account_ids is not None:
+            tests.append((self.column('lines', 'account'), set(account_ids)))
+        for name, wanted in (dimensions or {}).items():
+            values = self.dictionary('lines', name)
+            if wanted not in values:
+                return []
+            tests.append((self.column('lines', name), {values.index(wanted)}))
+        return [
+            index for index in range(start, stop)
+            if all(column[index] in allowed for column, allowed in tests)
+        ]
+
+    def totals_cents(self, date_from=None, date_to=None, account_ids=None, dimensions=None):
+        """Posted debit/credit totals per account id, in cents."""
+        start, stop = self.line_range(date_from, date_to)
+        accounts = self.column('lines', 'account')
+        debits = self.column('lines', 'debit')
+        credits = self.column('lines', 'credit')
+        totals = {}
+        for index in self.line_filter(start, stop, account_ids, dimensions):
+            account_id = accounts[index]
+            debit_total, credit_total = totals.get(account_id, (0, 0))
+            totals[account_id] = (debit_total + debits[index], credit_total + credits[index])
+        return totals
+
+    def daily_totals_cents(self):
+        """Posted debit/credit totals per (account id, date), in cents."""
+        dates = self.column('lines', 'date')
+        accounts = self.column('lines', 'account')
+        debits = self.column('lines', 'debit')
+        credits = self.column('lines', 'credit')
+        totals = {}
+        for index in self.line_filter(0, self.rows('lines')):
+            key = (accounts[index], dates[index])
+            debit_total, credit_total = totals.get(key, (0, 0))
+            totals[key] = (debit_total + debits[index], credit_total + credits[index])
+        return {(account_id, _decode('date', day)): pair for (account_id, day), pair in totals.items()}
+
+    def lines(self, date_from=None, date_to=None, account_ids=None, dimensions=None, posted_only=True):
+        """Decoded lines (dicts) in date order."""
+        start, stop = self.line_range(date_from, date_to)
+        for index in self.line_filter(start, stop, account_ids, dimensions, posted_only):
+            yield self.row('lines', index)
+
+    def journals(self, entry_number=None, reference_type=None, reference_id=None):
+        """Decoded journals (dicts) matching the filters, in date order."""
+        tests = []
+        if entry_number is not None:
+            tests.append((self.column('journals', 'entry_number'), int(entry_number)))
+        for name, wanted in (('reference_type', reference_type), ('reference_id', reference_id)):
+            if wanted is None:
+                continue
+            values = self.dictionary('journals', name)
+            if wanted not in values:
+                return
+            tests.append((self.column('journals', name), values.index(wanted)))
+        for index in range(self.rows('journals')):
+            if all(column[index] == wanted for column, wanted in tests):
+                yield self.row('journals', index)
+
+    def journal_lines(self, journal):
+        """Lines of one journal (a dict from journals()), in id order."""
+        start, stop = self.line_range(journal['date'], journal['date'])
+        owners = self.column('lines', 'journal_entry')
+        return [
+            self.row('lines', index)
+            for index in range(start, stop)
+            if owners[index] == journal['entry_number']
+        ]
+
+
+def archived_totals_cents(date_from=None, date_to=None, account_type=None, dimensions=None,
+                          account_ids=None):
+    """
+    Posted totals per account from archived lines dated in [date_from, date_to].
+
+    Returns:
+        Dict of account_id -> (debit_cents, credit_cents); empty without a
+        query of the lines when no archived period overlaps the range
+    """
+    totals = {}
+    periods = archived_periods(date_from, date_to)
+    if not periods:
+        return totals
+    if account_type is not None:
+        typed = set(Account.objects.filter(account_type=account_type).values_list('id', flat=True))
+        account_ids = typed if account_ids is None else typed & set(account_ids)
+    for period in periods:
+        with open_archive(period) as period_archive:
+            for account_id, (debits, credits) in period_archive.totals_cents(
+                date_from, date_to, account_ids, dimensions
+            ).items():
+                base_debits, base_credits = totals.get(account_id, (0, 0))
+                totals[account_id] = (base_debits + debits, base_credits + credits)
+    return totals
+
+
+def archived_daily_totals_cents():
+    """Posted totals per (account id, date) over every archived period."""
+    totals = {}
+    for period in archived_periods():
+        with open_archive(period) as period_archive:
+            totals.update(period_archive.daily_totals_cents())  # Periods never share a date
+    return totals
+
+
+def archived_lines(date_from=None, date_to=None, account_type=None, dimensions=None):
+    """Posted archived lines (decoded dicts) dated in [date_from, date_to], in date order."""
+    periods = archived_periods(date_from, date_to)
+    account_ids = None
+    if periods and account_type is not None:
+        account_ids = set(Account.objects.filter(account_type=account_type).values_list('id', flat=True))
+    for period in periods:
+        with open_archive(period) as period_archive:
+            yield from period_archive.lines(date_from, date_to, account_ids, dimensions)
+
+
+def archived_vendor_totals_cents(vendor_id=None):
+    """
+    Posted totals of archived vendor-tagged lines, from the manifests.
+
+    Returns:
+        Dict of (vendor_id, account_id) -> (debit_cents, credit_cents)
+    """
+    totals = {}
+    for period in archived_periods():
+        with open_archive(period) as period_archive:
+            rows = period_archive.manifest['vendor_totals']
+        for vendor, account_id, debits, credits in rows:
+            if vendor_id is not None and vendor != vendor_id:
+                continue
+            base_debits, base_credits = totals.get((vendor, account_id), (0, 0))
+            totals[(vendor, account_id)] = (base_debits + debits, base_credits + credits)
+    return totals
+
+
+# Archiving
+
+def _period_journals(period, first):
+    """Journals moved by archiving a period (see the module docstring for what stays)."""
+    journals = JournalEntry.objects.filter(date__lte=period.end, closed_period__isnull=True).exclude(
+        reversals__date__gt=period.end
+    )
+    if not first:
+        journals = journals.filter(date__gte=period.start)
+    return journals
+
+
+def _delete_rows(model, column, ids):
+    meta = model._meta
+    quote = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            batch = ids[start:start + DELETE_BATCH_SIZE]
+            cursor.execute(
+                'DELETE FROM {} WHERE {} IN ({})'.format(
+                    quote(meta.db_table), quote(column), ', '.join(['%s'] * len(batch))
+                ),
+                batch
+            )
+
+
+def _summarize(lines):
+    """Per-account and per-vendor posted totals of encoded line rows."""
+    names = [name for name, _, _ in LINE_COLUMNS]
+    status, account, debit, credit, vendor = (
+        names.index(name) for name in ('status', 'account', 'debit', 'credit', 'vendor_id')
+    )
+    accounts, vendors = {}, {}
+    for line in lines:
+        if line[status] != 'posted':
+            continue
+        debits, credits = to_cents(line[debit]), to_cents(line[credit])
+        keys = [(accounts, line[account])]
+        if line[vendor]:
+            keys.append((vendors, (line[vendor], line[account])))
+        for totals, key in keys:
+            base_debits, base_credits = totals.get(key, (0, 0))
+            totals[key] = (base_debits + debits, base_credits + credits)
+    return accounts, vendors
+
+
+def archive_period(period):
+    """
+    Move a closed period's journals and lines into its columnar archive.
+
+    The column files are written and read back before anything is deleted;
+    the rows are removed and the period marked archived in one transaction.
+
+    Returns:
+        The archive manifest (dict)
+
+    Raises:
+        ValueError: If the period is already archived or an earlier period
+            is not
+    """
+    with transaction.atomic():
+        period = AccountingPeriod.objects.select_for_update().get(pk=period.pk)
+        if period.archived_at is not None:
+            raise ValueError(f'{period} is already archived')
+        earlier = AccountingPeriod.objects.filter(end__lt=period.start)
+        if earlier.filter(archived_at__isnull=True).exists():
+            raise ValueError(f'Archive the periods before {period} first')
+        first = not earlier.exists()
+
+        journals = _period_journals(period, first)
+        journal_rows = list(
+            journals.order_by('date', 'entry_number').values_list(*(lookup for _, lookup, _ in JOURNAL_COLUMNS))
+        )
+        line_rows = list(
+            LedgerEntry.objects.filter(journal_entry__in=journals)
+            .order_by('journal_entry__date', 'journal_entry_id', 'id')
+            .values_list(*(lookup for _, lookup, _ in LINE_COLUMNS))
+        )
+        account_totals, vendor_totals = _summarize(line_rows)
+
+        path = period_path(period)
+        path.mkdir(parents=True, exist_ok=True)
+        (path / MANIFEST_NAME).unlink(missing_ok=True)
+        manifest = {
+            'format': ARCHIVE_FORMAT,
+            'period': str(period),
+            'start': period.start.isoformat(),
+            'end': period.end.isoformat(),
+            'first': first,
+            'byteorder': sys.byteorder,
+            'archived_at': timezone.now().isoformat(),
+            'journals': _write_table(path, 'journals', journal_rows),
+            'lines': _write_table(path, 'lines', line_rows),
+            'account_totals': sorted([account_id, *pair] for account_id, pair in account_totals.items()),
+            'vendor_totals': sorted([*key, *pair] for key, pair in vendor_totals.items()),
+        }
+        _write_file(path / MANIFEST_NAME, json.dumps(manifest, indent=2).encode())
+
+        # Read the files back before the rows go
+        with PeriodArchive(path) as period_archive:
+            if period_archive.totals_cents() != account_totals:
+                raise ValueError(f'{period}: archive read-back does not match the ledger; nothing deleted')
+
+        entry_ids = [row[0] for row in journal_rows]
+        line_ids = [row[0] for row in line_rows]
+        for start in range(0, len(entry_ids), DELETE_BATCH_SIZE):
+            batch = entry_ids[start:start + DELETE_BATCH_SIZE]
+            StockMovement.objects.filter(journal_entry_id__in=batch).update(journal_entry=None)
+            LedgerEvent.objects.filter(journal_entry_id__in=batch).update(journal_entry=None)
+            WebhookEvent.objects.filter(journal_entry_id__in=batch).update(journal_entry=None)
+        for start in range(0, len(line_ids), DELETE_BATCH_SIZE):
+            BankStatementLine.objects.filter(
+                matched_entry_id__in=line_ids[start:start + DELETE_BATCH_SIZE]
+            ).update(matched_entry=None)
+        _delete_rows(LedgerEntry, LedgerEntry._meta.pk.column, line_ids)
+        _delete_rows(JournalEntry, JournalEntry._meta.pk.column, entry_ids)
+
+        period.archived_at = timezone.now()
+        period.save(update_fields=['archived_at'])
+    return manifest
+
+
+def archive_periods(through):
+    """
+    Archive every closed, unarchived period ending on or before a date.
+
+    Returns:
+        List of (period, manifest)
+    """
+    archived = []
+    periods = AccountingPeriod.objects.filter(archived_at__isnull=True, end__lte=through).order_by('start')
+    for period in periods:
+        archived.append((period, archive_period(period)))
+    return archived
+
+
+def verify_archive(period):
+    """
+    Check an archived period's files and totals.
+
+    The checksums must match the manifest. The archived totals plus the
+    period's lines still in the database must equal the change in the
+    period's checkpoints.
+
+    Returns:
+        List of problem descriptions (empty if the archive is sound)
+    """
+    from .services import _add_totals
+
+    problems = []
+    path = period_path(period)
+    with PeriodArchive(path) as period_archive:
+        manifest = period_archive.manifest
+        for table in TABLES:
+            for name, entry in manifest[table]['columns'].items():
+                for file_key, sum_key in (('file', 'sha256'), ('dictionary', 'dictionary_sha256')):
+                    if file_key not in entry:
+                        continue
+                    digest = hashlib.sha256((path / entry[file_key]).read_bytes()).hexdigest()
+                    if digest != entry[sum_key]:
+                        problems.append(f'{period}: {entry[file_key]} checksum mismatch')
+        archived = period_archive.totals_cents()
+
+    recorded = {account_id: (debits, credits) for account_id, debits, credits in manifest['account_totals']}
+    if archived != recorded:
+        problems.append(f'{period}: column totals differ from the manifest')
+
+    def checkpoint_totals(checkpoint_period):
+        if checkpoint_period is None:
+            return {}
+        return {
+            account_id: (to_cents(debits), to_cents(credits))
+            for account_id, debits, credits in checkpoint_period.checkpoints.values_list(
+                'account_id', 'debit_total', 'credit_total'
+            )
+        }
+
+    previous = AccountingPeriod.objects.filter(end__lt=period.start).order_by('-end').first()
+    expected = _add_totals(checkpoint_totals(period), checkpoint_totals(previous), sign=-1)
+    remaining = LedgerEntry.objects.filter(journal_entry__status='posted', journal_entry__date__lte=period.end)
+    if previous is not None:
+        remaining = remaining.filter(journal_entry__date__gt=previous.end)
+    in_database = {}
+    for account_id, debits, credits in remaining.values_list('account_id', 'debit', 'credit'):
+        base_debits, base_credits = in_database.get(account_id, (0, 0))
+        in_database[account_id] = (base_debits + to_cents(debits), base_credits + to_cents(credits))
+    if _add_totals(archived, in_database) != expected:
+        problems.append(f'{period}: archived and remaining lines do not add up to the checkpoints')
+    return problems
+
+
+# Export
+
+EXPORT_HEADER = [
+    'entry_number', 'date', 'journal_description', 'reference_type', 'reference_id', 'status',
+    'line_id', 'account_number', 'account_name', 'debit', 'credit', 'description',
+    'vendor_id', 'market', 'event', 'category', 'reconciled', 'statement_line',
+]
+
+
+def export_rows(period):
+    """
+    The archived period as CSV-ready rows (header first), one per ledger line.
+    """
+    accounts = {account.id: account for account in Account.objects.all()}
+    yield EXPORT_HEADER
+    with open_archive(period) as period_archive:
+        journals = {}
+        for index in range(period_archive.rows('journals')):
+            journals[period_archive.column('journals', 'entry_number')[index]] = index
+        for line in period_archive.lines(posted_only=False):
+            journal = period_archive.row('journals', journals[line['journal_entry']])
+            account = accounts[line['account']]
+            yield [
+                journal['entry_number'], journal['date'].isoformat(), journal['description'],
+                journal['reference_type'], journal['reference_id'], journal['status'],
+                line['id'], account.account_number, account.account_name, line['debit'], line['credit'],
+                line['description'], line['vendor_id'], line['market'], line['event'], line['category'],
+                int(line['reconciled']), line['statement_line'] or '',
+            ]
+
+
+def export_csv(period, out):
+    """Write export_rows() to a text file object."""
+    writer = csv.writer(out)
+    count = -1
+    for row in export_rows(period):
+        writer.writerow(row)
+        count += 1
+    return count
@@ -0,0 +1,323 @@
+"""
+In-process balance index
+
+Optional in-memory index of posted totals per account and day. It serves
+point-in-time and range queries without reading ledger lines. Each account
+has two Fenwick (binary indexed) trees over day numbers, one for debit
+cents and one for credit cents, each stored in an array('q'). Totals
+through a date (a prefix sum) and a posting (a point update) both cost
+O(log days).
+
+The index consumes the outbox feed (feed.py). It loads the ledger once and
+remembers the last LedgerEvent sequence. Before each query it applies the
+events committed since then, so it sees postings from this process and
+from any other one, and never sees a rolled-back posting.
+journal.posted adds the journal's lines. journal.updated and
+journal.unposted trigger a reload instead: both come from journals edited or
+deleted through the admin or the API, or a period reopen, and their payloads
+hold the lines after the edit only.
+
+Enable it with LEDGER_BALANCE_INDEX = True. calculate_account_balance() and
+account_totals_cents() (without dimension filters) then answer from the
+index. Inside a transaction they keep using SQL, which sees the
+transaction's own uncommitted postings. The index is built on first use rather than in AppConfig.ready(),
+which runs before migrations and must not query the database.
+Cross-check it against the SQL aggregates with manage.py balance_index --verify.
+"""
+import random
+import threading
+import time
+from array import array
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Max
+
+from . import archive, feed
+from .models import Account, LedgerEntry, LedgerEvent
+from .money import SumCents, to_cents
+
+INDEX_HEADROOM_DAYS = 366  # Room for future-dated postings before the trees grow
+INDEX_LOAD_ATTEMPTS = 3
+
+
+class _Fenwick:
+    """Fenwick tree of integer cents over slots 1..size."""
+
+    def __init__(self, values):
+        # O(n) build from point values (values[0] is slot 1)
+        tree = array('q', [0])
+        tree.extend(values)
+        size = len(tree) - 1
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                tree[parent] += tree[index]
+        self.tree = tree
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def add(self, index, value):
+        tree = self.tree
+        size = len(tree) - 1
+        while index <= size:
+            tree[index] += value
+            index += index & -index
+
+    def prefix(self, index):
+        """Sum of slots 1..index."""
+        tree = self.tree
+        index = min(index, len(tree) - 1)
+        total = 0
+        while index > 0:
+            total += tree[index]
+            index -= index & -index
+        return total
+
+    def values(self):
+        """Point values of every slot, in order."""
+        return [self.prefix(index) - self.prefix(index - 1) for index in range(1, len(self) + 1)]
+
+
+class BalanceIndex:
+    """
+    Posted totals per account and day, answering prefix and range queries.
+
+    Day slot 1 is the origin date. Dates before the origin have no
+    postings; dates past the last slot count everything.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.loaded = False
+        self.sequence = 0
+        self.origin = None
+        self.size = 0
+        self.account_types = {}
+        self.account_ids = {}  # account_number -> id, for feed payloads
+        self.debits = {}
+        self.credits = {}
+
+    # Loading
+
+    def load(self):
+        """Build the index from the ledger lines and the archive."""
+        with self._lock:
+            for _ in range(INDEX_LOAD_ATTEMPTS):
+                sequence = LedgerEvent.objects.aggregate(last=Max('sequence'))['last'] or 0
+                daily = self._read_daily_totals()
+                # A posting committed during the read may or may not be in it: retry
+                if (LedgerEvent.objects.aggregate(last=Max('sequence'))['last'] or 0) == sequence:
+                    break
+            self._build(daily)
+            self.sequence = sequence
+            self.loaded = True
+
+    def _read_daily_totals(self):
+        rows = LedgerEntry.objects.filter(journal_entry__status='posted').values(
+            'account_id', 'journal_entry__date'
+        ).annotate(
+            debits=SumCents('debit'),
+            credits=SumCents('credit')
+        ).order_by()
+        daily = {(row['account_id'], row['journal_entry__date']): (row['debits'], row['credits']) for row in rows}
+        for key, (debits, credits) in archive.archived_daily_totals_cents().items():
+            base_debits, base_credits = daily.get(key, (0, 0))
+            daily[key] = (base_debits + debits, base_credits + credits)
+        return daily
+
+    def _build(self, daily):
+        accounts = Account.objects.values_list('id', 'account_number', 'account_type')
+        self.account_types = {account_id: account_type for account_id, _, account_type in accounts}
+        self.account_ids = {number: account_id for account_id, number, _ in accounts}
+
+        today = date.today()
+        self.origin = min((day for _, day in daily), default=today)
+        last = max((day for _, day in daily), default=today)
+        self.size = (max(last, today) - self.origin).days + 1 + INDEX_HEADROOM_DAYS
+
+        points = {account_id: ([0] * self.size, [0] * self.size) for account_id in self.account_types}
+        for (account_id, day), (debits, credits) in daily.items():
+            slot = (day - self.origin).days
+            points[account_id][0][slot] += debits
+            points[account_id][1][slot] += credits
+        self.debits = {account_id: _Fenwick(values) for account_id, (values, _) in points.items()}
+        self.credits = {account_id: _Fenwick(values) for account_id, (_, values) in points.items()}
+
+    def _resize(self, day):
+        """Move the origin back or add slots so that day fits."""
+        origin = min(self.origin, day)
+        size = max((self.origin - origin).days + self.size, (day - origin).days + 1 + INDEX_HEADROOM_DAYS)
+        shift = (self.origin - origin).days
+        for trees in (self.debits, self.credits):
+            for account_id, tree in trees.items():
+                values = [0] * size
+                values[shift:shift + self.size] = tree.values()
+                trees[account_id] = _Fenwick(values)
+        self.origin, self.size = origin, size
+
+    # Updates
+
+    def add(self, account_id, day, debit_cents, credit_cents):
+        """Add a posted line."""
+        with self._lock:
+            if account_id not in self.debits:
+                self.account_types[account_id] = Account.objects.get(id=account_id).account_type
+                self.debits[account_id] = _Fenwick([0] * self.size)
+                self.credits[account_id] = _Fenwick([0] * self.size)
+            if day < self.origin or (day - self.origin).days >= self.size:
+                self._resize(day)
+            slot = (day - self.origin).days + 1
+            self.debits[account_id].add(slot, debit_cents)
+            self.credits[account_id].add(slot, credit_cents)
+
+    def catch_up(self):
+        """Apply outbox events committed since the last one applied."""
+        with self._lock:
+            if not self.loaded:
+                self.load()
+                return
+            while True:
+                events = feed.get_events(self.sequence, feed.FEED_MAX_PAGE_SIZE)
+                if not events:
+                    return
+                for event in events:
+                    if event.event_type != 'journal.posted':
+                        self.load()
+                        return
+                    self._apply(event)
+                    self.sequence = event.sequence
+
+    def _apply(self, event):
+        day = date.fromisoformat(event.payload['date'])
+        for line in event.payload['lines']:
+            account_id = self.account_ids.get(line['account_number'])
+            if account_id is None:
+                account_id = Account.objects.get(account_number=line['account_number']).id
+                self.account_ids[line['account_number']] = account_id
+            self.add(account_id, day, to_cents(line['debit']), to_cents(line['credit']))
+
+    # Queries
+
+    def _slot(self, as_of_date):
+        if as_of_date is None:
+            return self.size
+        return (as_of_date - self.origin).days + 1
+
+    def totals_cents(self, account_id, as_of_date=None):
+        """(debit_cents, credit_cents) posted to an account through a date."""
+        with self._lock:
+            if account_id not in self.debits:
+                return (0, 0)
+            slot = self._slot(as_of_date)
+            return (self.debits[account_id].prefix(slot), self.credits[account_id].prefix(slot))
+
+    def range_totals_cents(self, date_from=None, date_to=None, account_type=None):
+        """
+        Totals per account for journals dated in [date_from, date_to].
+
+        Returns:
+            Dict of account_id -> (debit_cents, credit_cents), accounts with
+            no postings in the range left out
+        """
+        with self._lock:
+            high = self._slot(date_to)
+            low = self._slot(date_from - timedelta(days=1)) if date_from is not None else 0
+            totals = {}
+            for account_id, debit_tree in self.debits.items():
+                if account_type is not None and self.account_types.get(account_id) != account_type:
+                    continue
+                credit_tree = self.credits[account_id]
+                pair = (
+                    debit_tree.prefix(high) - debit_tree.prefix(low),
+                    credit_tree.prefix(high) - credit_tree.prefix(low)
+                )
+                if pair != (0, 0):
+                    totals[account_id] = pair
+            return totals
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(force=False):
+    """
+    The process-wide index, caught up with the outbox feed.
+
+    Returns:
+        BalanceIndex, or None when LEDGER_BALANCE_INDEX is off (unless
+        force) or inside a transaction
+    """
+    global _index
+    if not force and not getattr(settings, 'LEDGER_BALANCE_INDEX', False):
+        return None
+    if connection.in_atomic_block:
+        return None  # Its own uncommitted events would be applied, then maybe rolled back
+    with _index_lock:
+        if _index is None:
+            _index = BalanceIndex()
+    _index.catch_up()
+    return _index
+
+
+def reset_index():
+    """Drop the process-wide index; the next get_index() rebuilds it."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def verify_index(index, samples=200, seed=0):
+    """
+    Compare the index with the SQL aggregates (checkpoints plus ledger lines).
+
+    Checks every closed period end, today and random dates and ranges
+    between the first posting and today.
+
+    Returns:
+        (problems, timings) - a list of mismatch descriptions, and the mean
+        seconds per query for 'index' and 'sql'
+    """
+    from .models import AccountingPeriod
+    from .services import _add_totals, _cumulative_totals_cents
+
+    rng = random.Random(seed)
+    today = date.today()
+    span = max((today - index.origin).days, 0)
+    dates = [index.origin, today, None] + list(AccountingPeriod.objects.values_list('end', flat=True))
+    dates += [index.origin + timedelta(days=rng.randint(0, span)) for _ in range(samples)]
+
+    problems = []
+    timings = {'index': 0.0, 'sql': 0.0}
+    for as_of_date in dates:
+        started = time.perf_counter()
+        expected = _cumulative_totals_cents(as_of_date)
+        timings['sql'] += time.perf_counter() - started
+        started = time.perf_counter()
+        actual = index.range_totals_cents(date_to=as_of_date)
+        timings['index'] += time.perf_counter() - started
+        if actual != expected:
+            problems.append(f'Totals through {as_of_date}: index {actual} != SQL {expected}')
+
+    for _ in range(samples):
+        date_from, date_to = sorted(index.origin + timedelta(days=rng.randint(0, span)) for _ in range(2))
+        expected = _add_totals(
+            _cumulative_totals_cents(date_to),
+            _cumulative_totals_cents(date_from - timedelta(days=1)),
+            sign=-1
+        )
+        actual = index.range_totals_cents(date_from, date_to)
+        if actual != expected:
+            problems.append(f'Totals {date_from}..{date_to}: index {actual} != SQL {expected}')
+
+    for account_id in index.debits:
+        for as_of_date in rng.sample(dates, min(len(dates), 10)):
+            expected = _cumulative_totals_cents(as_of_date).get(account_id, (0, 0))
+            if index.totals_cents(account_id, as_of_date) != expected:
+                problems.append(f'Account {account_id} through {as_of_date}: index differs from SQL')
+
+    timings = {name: total / len(dates) for name, total in timings.items()}
+    return problems, timings
@@ -0,0 +1,177 @@
+"""
+Subscription billing runs
+
+A billing run charges every active subscription due on its date: one
+Cash / Subscription Revenue journal each, posted with record_transactions()
+a chunk at a time. Only one chunk of subscriptions and journals is in
+memory at once.
+
+Each chunk commits in one transaction: the chunk's journals, the
+subscriptions' next billing dates and the run's checkpoint (the id of the
+last subscription handled). A crashed run therefore stops at a chunk
+boundary. Running it again for the same date resumes after the checkpoint
+and never posts a subscription twice. Subscriptions that cannot be posted
+are recorded as BillingRunFailure rows and left due for the next run.
+
+Run it with ``manage.py run_billing``.
+"""
+import time
+from calendar import monthrange
+from datetime import date
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Account, BillingRun, BillingRunFailure, Subscription
+from .money import from_cents, to_cents
+from .periods import closed_date_errors
+from .services import record_transactions, retry_on_conflict
+from .validation import JournalValidationError
+
+BILLING_CHUNK_SIZE = 500
+
+
+def add_months(day, months, anchor_day):
+    """The anchor day of the month `months` after day's month (clamped to the month's end)."""
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    return date(year, month + 1, min(anchor_day, monthrange(year, month + 1)[1]))
+
+
+def due_subscriptions(run_date):
+    """Active subscriptions due on or before run_date and not yet charged by its run."""
+    return Subscription.objects.filter(status='active', next_billing_date__lte=run_date).filter(
+        Q(last_billed_date__isnull=True) | Q(last_billed_date__lt=run_date)
+    )
+
+
+def start_run(run_date=None):
+    """
+    The billing run for a date, created if needed.
+
+    Raises:
+        ValueError: If run_date is in a closed period
+    """
+    run_date = run_date or date.today()
+    error = closed_date_errors([run_date])[0]
+    if error:
+        raise ValueError(error['message'])
+    run, _ = BillingRun.objects.get_or_create(run_date=run_date)
+    return run
+
+
+def _journal(subscription, run_date, cash_account, revenue_account):
+    return {
+        'date': run_date,
+        'description': f'Subscription payment for {subscription.subscription_id} (due {subscription.next_billing_date})',
+        'reference_type': 'subscription',
+        'reference_id': subscription.subscription_id,
+        'entries': [
+            {'account_id': cash_account.id, 'debit': subscription.amount, 'credit': 0, 'description': 'Cash received'},
+            {'account_id': revenue_account.id, 'debit': 0, 'credit': subscription.amount, 'description': 'Subscription revenue'},
+        ],
+    }
+
+
+@retry_on_conflict
+def bill_chunk(run, chunk_size=None):
+    """
+    Charge the next chunk of due subscriptions of a run.
+
+    Returns:
+        Dict of counts {'posted', 'failed', 'amount' (cents)} for the chunk,
+        or None when nothing is left (the run is then completed)
+    """
+    chunk_size = chunk_size or getattr(settings, 'SUBSCRIPTION_BILLING_CHUNK_SIZE', BILLING_CHUNK_SIZE)
+
+    with transaction.atomic():
+        # The lock makes concurrent workers on one run take chunks in turn
+        run = BillingRun.objects.select_for_update().get(pk=run.pk)
+        if run.status == 'completed':
+            return None
+        subscriptions = list(
+            due_subscriptions(run.run_date).filter(pk__gt=run.checkpoint).order_by('pk')[:chunk_size]
+        )
+        if not subscriptions:
+            run.status = 'completed'
+            run.finished_at = timezone.now()
+            run.save(update_fields=['status', 'finished_at'])
+            return None
+
+        cash_account = Account.objects.get(account_number='1000')
+        revenue_account = Account.objects.get(account_number='4100')
+        pending = [
+            (subscription, _journal(subscription, run.run_date, cash_account, revenue_account))
+            for subscription in subscriptions
+        ]
+        failures = []
+        while pending:
+            try:
+                record_transactions([item for _, item in pending])
+            except JournalValidationError as e:
+                bad = {error['journal'] for error in e.errors}
+                for index in bad:
+                    failures.append(BillingRunFailure(
+                        run=run,
+                        subscription=pending[index][0],
+                        error='; '.join(dict.fromkeys(
+                            error['message'] for error in e.errors if error['journal'] == index
+                        ))
+                    ))
+                pending = [pair for index, pair in enumerate(pending) if index not in bad]
+                continue
+            break
+
+        billed = [subscription for subscription, _ in pending]
+        now = timezone.now()
+        for subscription in billed:
+            subscription.updated_at = now
+            subscription.last_billed_date = run.run_date
+            subscription.next_billing_date = add_months(
+                subscription.next_billing_date, subscription.interval_months, subscription.start_date.day
+            )
+        Subscription.objects.bulk_update(billed, ['last_billed_date', 'next_billing_date', 'updated_at'])
+        BillingRunFailure.objects.bulk_create(failures, ignore_conflicts=True)
+
+        amount = sum(to_cents(subscription.amount) for subscription in billed)
+        run.checkpoint = subscriptions[-1].pk
+        run.chunks += 1
+        run.posted += len(billed)
+        run.failed += len(failures)
+        run.amount = from_cents(to_cents(run.amount) + amount)
+        run.save(update_fields=['checkpoint', 'chunks', 'posted', 'failed', 'amount'])
+
+    return {'posted': len(billed), 'failed': len(failures), 'amount': amount}
+
+
+def run_billing(run_date=None, chunk_size=None, max_chunks=None, progress=None):
+    """
+    Charge every subscription due on run_date, resuming an unfinished run.
+
+    Args:
+        max_chunks: Stop after this many chunks (the run stays resumable)
+        progress: Optional callable(counts) called after each chunk
+
+    Returns:
+        Dict with the run, this call's 'chunks', 'posted', 'failed',
+        'amount' (cents), 'elapsed' seconds and 'rate' (subscriptions per
+        second)
+    """
+    run = start_run(run_date)
+    totals = {'chunks': 0, 'posted': 0, 'failed': 0, 'amount': 0}
+    started = time.perf_counter()
+    while max_chunks is None or totals['chunks'] < max_chunks:
+        counts = bill_chunk(run, chunk_size)
+        if counts is None:
+            break
+        totals['chunks'] += 1
+        for key, value in counts.items():
+            totals[key] += value
+        if progress:
+            progress(counts)
+    elapsed = time.perf_counter() - started
+    run.refresh_from_db()
+    handled = totals['posted'] + totals['failed']
+    return dict(totals, run=run, elapsed=elapsed, rate=handled / elapsed if elapsed else 0.0)
@@ -0,0 +1,202 @@
+"""
+Ledger change feed
+
+Every posting writes LedgerEvent rows (the outbox) in the same database
+transaction as the journal. Consumers keep the sequence number of the last
+event they processed and ask for events after it, by long-poll or
+Server-Sent Events. Each read is a primary key range scan, so delivering new
+postings costs O(new events) however long the ledger is.
+"""
+import asyncio
+import json
+import threading
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import LedgerEvent
+from .money import from_cents, to_cents
+
+FEED_PAGE_SIZE = 100
+FEED_MAX_PAGE_SIZE = 1000
+FEED_POLL_INTERVAL = 1.0  # Seconds between checks for events from other processes
+# Sequence numbers are assigned on insert, so with concurrent writers a lower
+# number can commit after a higher one. Reads stop at a gap for this long
+# after they first see it, to pick the late event up; older gaps are
+# rolled-back inserts.
+FEED_GAP_GRACE = timedelta(seconds=5)
+# Gaps before events older than this are always rolled-back inserts (no
+# posting transaction stays open that long), so replaying history never waits
+FEED_GAP_MAX_AGE = timedelta(minutes=5)
+
+_lock = threading.Lock()
+_gaps_seen = {}  # Missing sequence -> time.monotonic() when a read first stopped at it
+_waiters = set()  # (event loop, asyncio.Event) of readers waiting in this process
+
+
+def _notify():
+    # Wakes waiting readers in this process as soon as a posting commits
+    with _lock:
+        waiters = list(_waiters)
+    for loop, wakeup in waiters:
+        try:
+            loop.call_soon_threadsafe(wakeup.set)
+        except RuntimeError:
+            pass  # The reader's event loop has closed
+
+
+def _line_payload(account_number, debit, credit, description, tags):
+    return {
+        'account_number': account_number,
+        'debit': str(from_cents(debit)),
+        'credit': str(from_cents(credit)),
+        'description': description,
+        **tags
+    }
+
+
+def journal_payload(journal_entry, journal=None):
+    """
+    Event payload for a journal entry.
+
+    Args:
+        journal_entry: JournalEntry instance
+        journal: Optional ValidatedJournal it was posted from (default: the
+            lines are read from the database)
+    """
+    if journal is not None:
+        lines = [
+            _line_payload(line.account.account_number, line.debit, line.credit, line.description, line.tags)
+            for line in journal.lines
+        ]
+    else:
+        from .models import LedgerEntry
+        lines = [
+            _line_payload(
+                entry.account.account_number,
+                to_cents(entry.debit),
+                to_cents(entry.credit),
+                entry.description,
+                {field: getattr(entry, field) for field in LedgerEntry.DIMENSIONS if getattr(entry, field)}
+            )
+            for entry in journal_entry.ledger_entries.select_related('account')
+        ]
+    return {
+        'entry_number': journal_entry.entry_number,
+        'date': str(journal_entry.date),
+        'description': journal_entry.description,
+        'reference_type': journal_entry.reference_type,
+        'reference_id': journal_entry.reference_id,
+        'amount': str(from_cents(to_cents(journal_entry.amount))),
+        'reverses': journal_entry.reverses_id,
+        'lines': lines,
+    }
+
+
+def record_journal_events(postings, event_type='journal.posted'):
+    """
+    Write outbox events for journals; call inside the posting transaction.
+
+    Args:
+        postings: List of (JournalEntry, ValidatedJournal or None) pairs
+        event_type: One of LedgerEvent.EVENT_TYPES
+    """
+    LedgerEvent.objects.bulk_create([
+        LedgerEvent(
+            event_type=event_type,
+            journal_entry=journal_entry,
+            payload=journal_payload(journal_entry, journal)
+        )
+        for journal_entry, journal in postings
+    ])
+    transaction.on_commit(_notify)
+
+
+def _gap_is_recent(sequence):
+    """Whether a read first stopped at missing sequence less than FEED_GAP_GRACE ago."""
+    now = time.monotonic()
+    with _lock:
+        for missing, seen in list(_gaps_seen.items()):
+            if now - seen > FEED_GAP_MAX_AGE.total_seconds():
+                del _gaps_seen[missing]
+        first_seen = _gaps_seen.setdefault(sequence, now)
+    return now - first_seen < FEED_GAP_GRACE.total_seconds()
+
+
+def get_events(after=0, limit=FEED_PAGE_SIZE):
+    """
+    Committed events with sequence > after, oldest first.
+
+    Returns:
+        List of LedgerEvent instances (at most limit)
+    """
+    events = list(LedgerEvent.objects.filter(sequence__gt=after).order_by('sequence')[:limit])
+
+    # Hold back at a gap seen recently: the missing event may still commit.
+    # The grace runs from when the gap was first seen, not from when the
+    # later event was written, so a slow transaction that commits late is
+    # not skipped.
+    expected = after + 1
+    cutoff = timezone.now() - FEED_GAP_MAX_AGE
+    for index, event in enumerate(events):
+        if event.sequence != expected and event.created_at > cutoff and _gap_is_recent(expected):
+            return events[:index]
+        expected = event.sequence + 1
+    return events
+
+
+def _read_events(after, limit):
+    try:
+        return get_events(after, limit)
+    finally:
+        close_old_connections()  # The read ran in a pool thread with its own connection
+
+
+async def wait_for_events(after=0, limit=FEED_PAGE_SIZE, timeout=0):
+    """
+    Like get_events(), but wait up to timeout seconds for at least one event.
+
+    Waits on the event loop, so a waiting reader holds no thread. Reads run
+    in pool threads (thread_sensitive=False) rather than queueing on the
+    shared sync thread. Postings committed in this process wake the wait
+    immediately; postings from other processes are seen within
+    FEED_POLL_INTERVAL.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    wakeup = asyncio.Event()
+    waiter = (loop, wakeup)
+    with _lock:
+        _waiters.add(waiter)
+    try:
+        while True:
+            wakeup.clear()
+            events = await sync_to_async(_read_events, thread_sensitive=False)(after, limit)
+            remaining = deadline - loop.time()
+            if events or remaining <= 0:
+                return events
+            try:
+                await asyncio.wait_for(wakeup.wait(), min(FEED_POLL_INTERVAL, remaining))
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        with _lock:
+            _waiters.discard(waiter)
+
+
+def serialize_event(event):
+    return {
+        'sequence': event.sequence,
+        'event_type': event.event_type,
+        'created_at': event.created_at.isoformat(),
+        'payload': event.payload,
+    }
+
+
+def format_sse(event):
+    """One Server-Sent Events message; the id lets clients resume with Last-Event-ID."""
+    data = json.dumps(serialize_event(event), separators=(',', ':'))
+    return f"id: {event.sequence}\nevent: {event.event_type}\ndata: {data}\n\n"
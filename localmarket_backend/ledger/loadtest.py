@@ -0,0 +1,167 @@
+"""
+Concurrent posting load test
+
+Posts a mix of order payments, vendor payouts, subscription payments and
+refunds from several threads or processes. Then it checks every materialized
+balance (AccountBalance, balance slots, VendorBalance) against a full
+recompute from the ledger lines. Run it with ``manage.py load_test_postings``.
+
+Models are imported inside the functions so that spawned worker processes can
+import this module before Django is set up.
+"""
+import multiprocessing
+import random
+import threading
+import time
+from decimal import Decimal
+
+from django.db import OperationalError, connections
+
+VENDOR_COUNT = 20
+HOT_ACCOUNTS = ('1000', '2100', '4000')
+
+
+def _post_one(rng, worker, index):
+    from .services import (
+        record_order_payment, record_refund, record_subscription_payment, record_vendor_payout
+    )
+
+    kind = rng.random()
+    vendor_id = f'vendor-{rng.randrange(VENDOR_COUNT)}'
+    if kind < 0.7:
+        amount = Decimal(rng.randrange(500, 50000)) / 100
+        fee = (amount * Decimal('0.1')).quantize(Decimal('0.01'))
+        order_id = f'load-{worker}-{index}'
+        record_order_payment(order_id, amount, fee, amount - fee, vendor_id=vendor_id)
+        if rng.random() < 0.1:
+            record_refund('order', order_id, (amount / 2).quantize(Decimal('0.01')))
+    elif kind < 0.9:
+        record_vendor_payout(vendor_id, Decimal(rng.randrange(100, 5000)) / 100)
+    else:
+        record_subscription_payment(f'load-sub-{worker}-{index}', Decimal('29.99'))
+
+
+def run_worker(worker, postings, seed=0):
+    """
+    Post random journals from the current thread.
+
+    Returns:
+        (posted, failed) - failed counts postings still conflicting after
+        retry_on_conflict gave up
+    """
+    rng = random.Random(seed * 100003 + worker)
+    posted = failed = 0
+    try:
+        for index in range(postings):
+            try:
+                _post_one(rng, worker, index)
+                posted += 1
+            except OperationalError:
+                failed += 1
+    finally:
+        connections.close_all()
+    return posted, failed
+
+
+def _process_worker(worker, postings, seed, database_name):
+    # Entry point of a spawned process: point at the same database, then set up
+    import django
+    from django.conf import settings
+
+    if database_name:
+        settings.DATABASES['default']['NAME'] = database_name
+    django.setup()
+    return run_worker(worker, postings, seed)
+
+
+def run_load(workers, postings, processes=False, seed=0):
+    """
+    Post workers x postings journals concurrently.
+
+    Returns:
+        Dict with 'posted', 'failed' and 'elapsed' (seconds)
+    """
+    started = time.perf_counter()
+    if processes:
+        database_name = str(connections['default'].settings_dict['NAME'])
+        connections.close_all()  # Never share a connection with a child
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers) as pool:
+            results = pool.starmap(
+                _process_worker,
+                [(worker, postings, seed, database_name) for worker in range(workers)]
+            )
+    else:
+        results = [None] * workers
+
+        def target(worker):
+            results[worker] = run_worker(worker, postings, seed)
+
+        threads = [threading.Thread(target=target, args=(worker,)) for worker in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        results = [result or (0, postings) for result in results]
+
+    return {
+        'posted': sum(posted for posted, _ in results),
+        'failed': sum(failed for _, failed in results),
+        'elapsed': time.perf_counter() - started,
+    }
+
+
+def check_balances():
+    """
+    Compare every materialized balance with a recompute from ledger lines.
+
+    Returns:
+        List of mismatch descriptions (empty if everything agrees)
+    """
+    from .archive import archived_vendor_totals_cents
+    from .models import Account, AccountBalance, LedgerEntry, VendorBalance
+    from .money import SumCents, to_cents
+    from .services import _add_totals, account_totals_cents, sharded_balance_cents, signed_balance_cents
+
+    problems = []
+    totals = account_totals_cents()
+    balances = {
+        balance.account_id: balance for balance in AccountBalance.objects.all()
+    }
+    for account in Account.objects.all():
+        expected = totals.get(account.id, (0, 0))
+        if account.counter_slots:
+            actual = sharded_balance_cents(account)
+        elif account.id in balances:
+            balance = balances[account.id]
+            actual = (to_cents(balance.debit_total), to_cents(balance.credit_total))
+            net = signed_balance_cents(account.account_type, *actual)
+            if to_cents(balance.net_balance) != net:
+                problems.append(f'{account}: net balance {to_cents(balance.net_balance)} != {net}')
+        else:
+            actual = (0, 0)
+        if actual != expected:
+            problems.append(f'{account}: materialized (debits, credits) {actual} != ledger {expected}')
+
+    vendor_totals = {
+        (row['vendor_id'], row['account_id']): (row['debits'], row['credits'])
+        for row in LedgerEntry.objects.filter(journal_entry__status='posted').exclude(vendor_id='')
+        .values('vendor_id', 'account_id').annotate(debits=SumCents('debit'), credits=SumCents('credit'))
+        .order_by()
+    }
+    vendor_totals = _add_totals(vendor_totals, archived_vendor_totals_cents())
+    vendor_balances = {
+        (balance.vendor_id, balance.account_id): (to_cents(balance.debit_total), to_cents(balance.credit_total))
+        for balance in VendorBalance.objects.all()
+    }
+    for key in sorted(set(vendor_totals) | set(vendor_balances)):
+        expected = vendor_totals.get(key, (0, 0))
+        actual = vendor_balances.get(key, (0, 0))
+        if actual != expected:
+            problems.append(f'Vendor {key[0]} account {key[1]}: materialized {actual} != ledger {expected}')
+
+    debits = sum(debit for debit, _ in totals.values())
+    credits = sum(credit for _, credit in totals.values())
+    if debits != credits:
+        problems.append(f'Ledger out of balance: debits {debits} != credits {credits}')
+    return problems
@@ -0,0 +1,67 @@
+"""
+Refresh the NumPy analytics snapshot and print a few vectorized reports.
+"""
+import time
+from datetime import date
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.analytics import TIME_BUCKETS, LedgerSnapshot
+from ledger.money import from_cents
+
+
+class Command(BaseCommand):
+    help = 'Refresh the NumPy column snapshot of posted ledger lines; optionally print a trial balance and P&L'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Rebuild the snapshot from scratch')
+        parser.add_argument('--trial-balance', metavar='YYYY-MM-DD', help='Print totals per account through a date')
+        parser.add_argument('--pnl', action='store_true', help='Print revenue, expenses and net income per bucket')
+        parser.add_argument('--bucket', choices=TIME_BUCKETS, default='month', help='P&L bucket (default: month)')
+
+    def handle(self, *args, **options):
+        try:
+            snapshot = LedgerSnapshot()
+        except ImproperlyConfigured as e:
+            raise CommandError(str(e))
+
+        started = time.perf_counter()
+        snapshot.load()
+        if options['rebuild']:
+            snapshot.rebuild()
+            appended = None
+        else:
+            appended = snapshot.refresh()
+        elapsed = time.perf_counter() - started
+        action = 'Rebuilt' if appended is None else f'Appended {appended:,} lines;'
+        self.stdout.write(
+            f"{action} {snapshot.rows:,} lines through entry #{snapshot.meta['last_entry']} "
+            f'in {elapsed:.2f}s -> {snapshot.path}'
+        )
+
+        if options['trial_balance']:
+            try:
+                as_of_date = date.fromisoformat(options['trial_balance'])
+            except ValueError:
+                raise CommandError('Date must be YYYY-MM-DD')
+            started = time.perf_counter()
+            rows = snapshot.group_totals(['account'], closing_entries=True, date_to=as_of_date)
+            elapsed = time.perf_counter() - started
+            for row in rows:
+                self.stdout.write(
+                    f"{row['account']:>8} {from_cents(row['debits']):>16} {from_cents(row['credits']):>16}"
+                )
+            self.stdout.write(f'Trial balance through {as_of_date} in {elapsed * 1000:.1f} ms')
+
+        if options['pnl']:
+            bucket = options['bucket']
+            started = time.perf_counter()
+            rows = snapshot.profit_and_loss(bucket=bucket)
+            elapsed = time.perf_counter() - started
+            for row in rows:
+                self.stdout.write(
+                    f"{row[bucket]:>10} {from_cents(row['revenue']):>16} {from_cents(row['expenses']):>16} "
+                    f"{from_cents(row['net_income']):>16}"
+                )
+            self.stdout.write(f'P&L by {bucket} in {elapsed * 1000:.1f} ms')
@@ -0,0 +1,82 @@
+"""
+Move closed months out of the database into the columnar archive, and read
+them back for audits and exports.
+"""
+import sys
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.archive import archive_periods, export_csv, period_path, verify_archive
+from ledger.models import AccountingPeriod
+from ledger.periods import month_bounds
+
+
+def _month(value):
+    try:
+        return datetime.strptime(value, '%Y-%m')
+    except ValueError:
+        raise CommandError('Month must be YYYY-MM')
+
+
+class Command(BaseCommand):
+    help = 'Archive closed months into memory-mappable column files; list, verify or export them'
+
+    def add_arguments(self, parser):
+        parser.add_argument('through', nargs='?', help='Archive every closed month up to this one, YYYY-MM')
+        parser.add_argument('--list', action='store_true', help='List archived months and their size on disk')
+        parser.add_argument('--verify', action='store_true', help='Check checksums and totals of every archived month')
+        parser.add_argument('--export', metavar='YYYY-MM', help='Write an archived month as CSV, one row per line')
+        parser.add_argument('--output', help='File for --export (default: stdout)')
+
+    def handle(self, *args, **options):
+        archived = AccountingPeriod.objects.filter(archived_at__isnull=False).order_by('start')
+
+        if options['export']:
+            month = _month(options['export'])
+            period = archived.filter(start=month_bounds(month.year, month.month)[0]).first()
+            if period is None:
+                raise CommandError(f"{options['export']} is not archived")
+            if options['output']:
+                with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                    count = export_csv(period, out)
+                self.stderr.write(f"Exported {count:,} lines to {options['output']}")
+            else:
+                export_csv(period, sys.stdout)
+            return
+
+        if options['list']:
+            for period in archived:
+                files = list(period_path(period).iterdir())
+                size = sum(path.stat().st_size for path in files)
+                self.stdout.write(
+                    f'{period}: {len(files)} files, {size / 1024:,.1f} KiB, '
+                    f'archived {period.archived_at:%Y-%m-%d %H:%M}'
+                )
+            return
+
+        if options['verify']:
+            problems = []
+            for period in archived:
+                problems += verify_archive(period)
+            for problem in problems:
+                self.stderr.write(problem)
+            if problems:
+                raise CommandError(f'{len(problems)} problem(s) in the archive')
+            self.stdout.write(self.style.SUCCESS(f'{archived.count()} archived months verified'))
+            return
+
+        if not options['through']:
+            raise CommandError('Give the last month to archive (YYYY-MM), or --list, --verify or --export')
+        month = _month(options['through'])
+        try:
+            results = archive_periods(month_bounds(month.year, month.month)[1])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if not results:
+            self.stdout.write('Nothing to archive')
+        for period, manifest in results:
+            self.stdout.write(self.style.SUCCESS(
+                f"Archived {period}: {manifest['journals']['rows']:,} journals, "
+                f"{manifest['lines']['rows']:,} lines -> {period_path(period)}"
+            ))
@@ -0,0 +1,46 @@
+"""
+Build the in-process balance index and cross-check it against SQL.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.balance_index import BalanceIndex, verify_index
+
+
+class Command(BaseCommand):
+    help = 'Build the Fenwick balance index and compare it with the SQL aggregates'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Compare as-of and range totals with the SQL aggregates'
+        )
+        parser.add_argument('--samples', type=int, default=200, help='Random dates and ranges to check (default: 200)')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+
+    def handle(self, *args, **options):
+        index = BalanceIndex()
+        started = time.perf_counter()
+        index.load()
+        elapsed = time.perf_counter() - started
+        nbytes = sum(
+            tree.tree.itemsize * len(tree.tree)
+            for trees in (index.debits, index.credits) for tree in trees.values()
+        )
+        self.stdout.write(
+            f'Loaded {len(index.debits)} accounts x {index.size:,} days from {index.origin} '
+            f'in {elapsed:.2f}s ({nbytes / 1024:,.0f} KiB, through event #{index.sequence})'
+        )
+        if not options['verify']:
+            return
+
+        problems, timings = verify_index(index, options['samples'], options['seed'])
+        for problem in problems[:20]:
+            self.stderr.write(problem)
+        if problems:
+            raise CommandError(f'{len(problems)} mismatch(es) between the index and SQL')
+        self.stdout.write(self.style.SUCCESS(
+            f"Index matches SQL: {timings['index'] * 1000:.3f} ms per as-of query "
+            f"vs {timings['sql'] * 1000:.3f} ms"
+        ))
@@ -0,0 +1,204 @@
+"""
+Build the docs site into a cache-friendly output directory.
+
+Minifies CSS and HTML, writes content-hashed copies of static assets plus a
+manifest.json, rewrites asset references in HTML/CSS to the hashed names and
+writes .gz variants of text files. serve_docs serves the output directory
+when it contains a manifest.
+"""
+import gzip
+import hashlib
+import json
+import re
+import shutil
+from pathlib import Path
+from urllib.parse import quote, unquote, urlsplit
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from localmarket_backend.docs_server import MANIFEST_NAME
+
+HASHED_EXTENSIONS = {
+    '.css', '.js', '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.ico', '.woff', '.woff2',
+}
+GZIP_EXTENSIONS = {'.html', '.css', '.js', '.svg', '.json'}
+GZIP_MIN_SIZE = 256
+
+CSS_STRING_OR_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/)', re.S)
+CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+HTML_ATTR_REF = re.compile(r'(\s(?:href|src)=)(["\'])([^"\']*)\2', re.I)
+HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+HTML_RAW_BLOCK = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.S | re.I)
+HTML_STYLE_BLOCK = re.compile(r'(<style\b[^>]*>)(.*?)(</style\s*>)', re.S | re.I)
+WHITESPACE = re.compile(r'\s+')
+
+
+def minify_css(text):
+    """Strip comments and redundant whitespace, leaving strings untouched."""
+    text = ''.join(
+        part for part in CSS_STRING_OR_COMMENT.split(text) if not part.startswith('/*')
+    )
+    out = []
+    for i, part in enumerate(CSS_STRING_OR_COMMENT.split(text)):
+        if i % 2:
+            out.append(part)
+            continue
+        part = WHITESPACE.sub(' ', part)
+        part = re.sub(r'\s*([{};,>])\s*', r'\1', part)
+        out.append(part)
+    return ''.join(out).replace(';}', '}').strip()
+
+
+def _collapse_whitespace(match):
+    return '\n' if '\n' in match.group(0) else ' '
+
+
+def minify_html(text):
+    """
+    Remove comments and collapse whitespace runs.
+
+    Whitespace is collapsed rather than removed so inline layout is
+    unchanged; <pre>, <textarea> and <script> bodies are kept verbatim and
+    <style> bodies are CSS-minified.
+    """
+    text = HTML_COMMENT.sub('', text)
+    out = []
+    for i, part in enumerate(HTML_RAW_BLOCK.split(text)):
+        if i % 3 == 2:
+            continue  # tag name captured by the inner group
+        if i % 3 == 1:
+            out.append(HTML_STYLE_BLOCK.sub(
+                lambda m: m.group(1) + minify_css(m.group(2)) + m.group(3), part
+            ))
+            continue
+        out.append(WHITESPACE.sub(_collapse_whitespace, part))
+    return ''.join(out).strip()
+
+
+def hashed_name(rel_path, content):
+    digest = hashlib.sha256(content).hexdigest()[:12]
+    path = Path(rel_path)
+    return path.with_name(f'{path.stem}.{digest}{path.suffix}').as_posix()
+
+
+def rewrite_reference(ref, base_dir, manifest):
+    """Map a relative URL to its hashed counterpart, or return it unchanged."""
+    parts = urlsplit(ref)
+    if parts.scheme or parts.netloc or not parts.path or parts.path.startswith('/') or '${' in ref:
+        return ref
+    target = (base_dir / unquote(parts.path)).as_posix()
+    # Normalise ../ and ./ segments without touching the filesystem
+    segments = []
+    for segment in target.split('/'):
+        if segment in ('', '.'):
+            continue
+        if segment == '..':
+            if not segments:
+                return ref
+            segments.pop()
+        else:
+            segments.append(segment)
+    hashed = manifest.get('/'.join(segments))
+    if hashed is None:
+        return ref
+    new_name = Path(hashed).name
+    if '%' in parts.path:
+        new_name = quote(new_name)
+    head = parts.path.rsplit('/', 1)[0] + '/' if '/' in parts.path else ''
+    new_ref = head + new_name
+    if parts.query:
+        new_ref += '?' + parts.query
+    if parts.fragment:
+        new_ref += '#' + parts.fragment
+    return new_ref
+
+
+class Command(BaseCommand):
+    help = 'Minify the docs site, write content-hashed assets, a manifest and gzip variants'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default=None,
+            help='Docs source directory (default: settings.DOCS_ROOT)'
+        )
+        parser.add_argument(
+            '--output', default=None,
+            help='Output directory (default: settings.DOCS_BUILD_DIR)'
+        )
+
+    def handle(self, *args, **options):
+        source = Path(options['source'] or settings.DOCS_ROOT).resolve()
+        output = Path(options['output'] or settings.DOCS_BUILD_DIR).resolve()
+
+        if not source.is_dir():
+            raise CommandError(f'Docs source directory not found: {source}')
+        if output == source or source in output.parents:
+            raise CommandError('Output directory must not be inside the docs source directory')
+
+        if output.exists():
+            shutil.rmtree(output)
+        output.mkdir(parents=True)
+
+        files = sorted(
+            p for p in source.rglob('*')
+            if p.is_file() and p.suffix != '.gz'
+        )
+        assets = [p for p in files if p.suffix.lower() in HASHED_EXTENSIONS and p.suffix.lower() != '.css']
+        stylesheets = [p for p in files if p.suffix.lower() == '.css']
+        pages = [p for p in files if p.suffix.lower() == '.html']
+        others = [p for p in files if p not in assets and p not in stylesheets and p not in pages]
+
+        manifest = {}
+        written = 0
+
+        # Binary/JS assets first so CSS and HTML can reference their hashed names
+        for path in assets:
+            rel = path.relative_to(source).as_posix()
+            content = path.read_bytes()
+            manifest[rel] = hashed_name(rel, content)
+            written += self._write(output, rel, content)
+            written += self._write(output, manifest[rel], content)
+
+        for path in stylesheets:
+            rel = path.relative_to(source).as_posix()
+            base_dir = Path(rel).parent
+            text = CSS_URL.sub(
+                lambda m: f'url({m.group(1)}{rewrite_reference(m.group(2), base_dir, manifest)}{m.group(1)})',
+                path.read_text(encoding='utf-8')
+            )
+            content = minify_css(text).encode('utf-8')
+            manifest[rel] = hashed_name(rel, content)
+            written += self._write(output, rel, content)
+            written += self._write(output, manifest[rel], content)
+
+        for path in pages:
+            rel = path.relative_to(source).as_posix()
+            base_dir = Path(rel).parent
+            text = HTML_ATTR_REF.sub(
+                lambda m: m.group(1) + m.group(2) + rewrite_reference(m.group(3), base_dir, manifest) + m.group(2),
+                path.read_text(encoding='utf-8')
+            )
+            written += self._write(output, rel, minify_html(text).encode('utf-8'))
+
+        for path in others:
+            rel = path.relative_to(source).as_posix()
+            written += self._write(output, rel, path.read_bytes())
+
+        (output / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding='utf-8')
+
+        source_size = sum(p.stat().st_size for p in files)
+        self.stdout.write(self.style.SUCCESS(
+            f'Built {len(files)} files ({len(manifest)} hashed) into {output}: '
+            f'{source_size:,} bytes in, {written:,} bytes out (excluding .gz)'
+        ))
+
+    def _write(self, output, rel, content):
+        target = output / rel
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_bytes(content)
+        if target.suffix.lower() in GZIP_EXTENSIONS and len(content) >= GZIP_MIN_SIZE:
+            target.with_name(target.name + '.gz').write_bytes(
+                gzip.compress(content, compresslevel=9, mtime=0)
+            )
+        return len(content)
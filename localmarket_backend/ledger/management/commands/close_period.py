@@ -0,0 +1,39 @@
+"""
+Close an accounting month, or reopen the latest closed one.
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.periods import close_period, closed_through, reopen_latest_period
+
+
+class Command(BaseCommand):
+    help = 'Close an accounting month (lock posting, roll revenue and expense into equity, write checkpoints)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', nargs='?', help='Month to close, YYYY-MM')
+        parser.add_argument(
+            '--reopen', action='store_true',
+            help='Reopen the most recently closed month instead'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            if options['reopen']:
+                period = reopen_latest_period()
+                self.stdout.write(self.style.SUCCESS(f'Reopened {period}; closed through {closed_through()}'))
+                return
+            if not options['month']:
+                raise CommandError('Give the month to close (YYYY-MM) or --reopen')
+            try:
+                month = datetime.strptime(options['month'], '%Y-%m')
+            except ValueError:
+                raise CommandError('Month must be YYYY-MM')
+            period = close_period(month.year, month.month)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        checkpoints = period.checkpoints.count()
+        journal = f'closing journal #{period.closing_entry_id}' if period.closing_entry_id else 'no closing journal'
+        self.stdout.write(self.style.SUCCESS(f'Closed {period}: {journal}, {checkpoints} checkpoints'))
@@ -0,0 +1,51 @@
+"""
+Fold the balance counter slots of hot accounts into AccountBalance.
+
+Reads stay correct without it (they add the slots up); compaction keeps the
+number of non-zero slot rows small. Run once, or with --loop as a
+long-running worker.
+"""
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.models import Account
+from ledger.services import compact_all_balance_slots, compact_balance_slots
+
+
+class Command(BaseCommand):
+    help = 'Fold sharded balance counter slots into AccountBalance'
+
+    def add_arguments(self, parser):
+        parser.add_argument('accounts', nargs='*', help='Account numbers (default: every account with slots)')
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and compact periodically'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=60.0,
+            help='Seconds between runs with --loop (default: 60)'
+        )
+
+    def handle(self, *args, **options):
+        accounts = []
+        for number in options['accounts']:
+            try:
+                accounts.append(Account.objects.get(account_number=number))
+            except Account.DoesNotExist:
+                raise CommandError(f'Account not found: {number}')
+
+        while True:
+            if accounts:
+                folded = {account.account_number: compact_balance_slots(account) for account in accounts}
+            else:
+                folded = compact_all_balance_slots()
+            total = sum(folded.values())
+            if total or not options['loop']:
+                details = ', '.join(f'{number}: {count}' for number, count in folded.items() if count)
+                self.stdout.write(self.style.SUCCESS(
+                    f"Folded {total} slots" + (f" ({details})" if details else '')
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,63 @@
+"""
+Generate month-end statements for every vendor as CSV and HTML files.
+"""
+import os
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.periods import month_bounds
+from ledger.statements import generate_statements
+
+
+class Command(BaseCommand):
+    help = 'Write a statement (opening balance, order credits, fees, refunds, payouts) per vendor for a month'
+
+    def add_arguments(self, parser):
+        parser.add_argument('month', help='Statement month, YYYY-MM')
+        parser.add_argument(
+            '--output',
+            help="Directory for the statements (default: LEDGER_STATEMENTS_DIR/<month>)"
+        )
+        parser.add_argument('--vendor', action='append', dest='vendors', help='Only this vendor (repeatable)')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Worker processes rendering statements (default: CPU count; 1 renders in this process)'
+        )
+        parser.add_argument('--format', choices=['csv', 'html', 'both'], default='both', help='Default: both')
+        parser.add_argument('--slowest', type=int, default=5, help='Report the N slowest statements (default: 5)')
+
+    def handle(self, *args, **options):
+        try:
+            month = datetime.strptime(options['month'], '%Y-%m')
+        except ValueError:
+            raise CommandError('Month must be YYYY-MM')
+        start, end = month_bounds(month.year, month.month)
+        output = Path(options['output'] or Path(settings.LEDGER_STATEMENTS_DIR) / options['month'])
+        formats = ('csv', 'html') if options['format'] == 'both' else (options['format'],)
+
+        try:
+            result = generate_statements(
+                start, end, output, vendor_ids=options['vendors'], workers=options['workers'], formats=formats
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        statements = result['statements']
+        if options['verbosity'] >= 2:
+            for vendor_id, rows, seconds, written in statements:
+                self.stdout.write(f'{vendor_id}: {rows:,} rows, {written / 1024:,.1f} KiB in {seconds * 1000:.1f} ms')
+        if statements and options['slowest']:
+            self.stdout.write('Slowest:')
+            for vendor_id, rows, seconds, _ in sorted(statements, key=lambda item: -item[2])[:options['slowest']]:
+                self.stdout.write(f'  {vendor_id}: {rows:,} rows in {seconds * 1000:.1f} ms')
+
+        rows = sum(item[1] for item in statements)
+        render_seconds = sum(item[2] for item in statements)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(statements):,} statements ({rows:,} rows) for {options['month']} -> {result['output_dir']}: "
+            f"collected in {result['collect']:.2f}s, rendered in {result['render']:.2f}s "
+            f"({render_seconds:.2f}s of worker time)"
+        ))
@@ -0,0 +1,46 @@
+"""
+Post pending payment webhook events to the ledger in batches.
+
+Run once to drain the queue, or with --loop as a long-running worker (set
+PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND = False so web processes leave the
+queue to it).
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from ledger.webhooks import drain_pending_events
+
+
+class Command(BaseCommand):
+    help = 'Post pending payment webhook events to the ledger in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help='Events per batch (default: settings.PAYMENT_WEBHOOK_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--loop', action='store_true',
+            help='Keep running and poll for new events'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=1.0,
+            help='Seconds between polls with --loop (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            counts = drain_pending_events(options['batch_size'])
+            total = sum(counts.values())
+            if total or not options['loop']:
+                elapsed = time.perf_counter() - started
+                rate = total / elapsed if elapsed > 0 else 0
+                self.stdout.write(self.style.SUCCESS(
+                    f"Processed {total} events in {elapsed:.2f}s ({rate:,.0f}/s): "
+                    f"{counts['posted']} posted, {counts['ignored']} ignored, {counts['failed']} failed"
+                ))
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
@@ -0,0 +1,51 @@
+"""
+Import a bank statement CSV and reconcile it against the ledger.
+"""
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.models import Account
+from ledger.reconciliation import StatementFormatError, import_statement, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Import a bank statement CSV for an account and match it to unreconciled ledger lines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('account', help='Account number, e.g. 1100')
+        parser.add_argument('file', nargs='?', help='Statement CSV (omit to only re-run matching)')
+        parser.add_argument('--window', type=int, default=3, help='Days either side of the statement date (default: 3)')
+        parser.add_argument('--tolerance', default='0', help='Amount tolerance for the last pass (default: 0, off)')
+        parser.add_argument('--date-format', default=None, help='strptime format of the date column')
+
+    def handle(self, *args, **options):
+        try:
+            account = Account.objects.get(account_number=options['account'])
+        except Account.DoesNotExist:
+            raise CommandError(f"Account not found: {options['account']}")
+        try:
+            tolerance = Decimal(options['tolerance'])
+        except InvalidOperation:
+            raise CommandError(f"Invalid tolerance: {options['tolerance']}")
+
+        if options['file']:
+            started = time.perf_counter()
+            try:
+                with open(options['file'], 'rb') as f:
+                    statement = import_statement(account, f, filename=options['file'],
+                                                 date_format=options['date_format'])
+            except (OSError, StatementFormatError) as e:
+                raise CommandError(str(e))
+            self.stdout.write(
+                f'Imported {statement.line_count:,} new lines in {time.perf_counter() - started:.2f}s'
+            )
+
+        started = time.perf_counter()
+        counts = reconcile(account, window=options['window'], tolerance=tolerance)
+        self.stdout.write(self.style.SUCCESS(
+            f"Matched {counts['exact']:,} exact, {counts['window']:,} within {options['window']} days, "
+            f"{counts['tolerance']:,} within tolerance; {counts['unmatched']:,} unmatched "
+            f"({time.perf_counter() - started:.2f}s)"
+        ))
@@ -0,0 +1,54 @@
+"""
+Charge every subscription due on a date, a chunk per transaction.
+"""
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.billing import run_billing
+from ledger.money import from_cents
+
+
+class Command(BaseCommand):
+    help = 'Post a payment journal for each due subscription; resumes an interrupted run for the same date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Billing date, YYYY-MM-DD (default: today)')
+        parser.add_argument(
+            '--chunk-size', type=int,
+            help='Subscriptions charged per transaction (default: SUBSCRIPTION_BILLING_CHUNK_SIZE)'
+        )
+        parser.add_argument('--max-chunks', type=int, help='Stop after N chunks; run again to resume')
+
+    def handle(self, *args, **options):
+        if options['date']:
+            try:
+                run_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError:
+                raise CommandError('Date must be YYYY-MM-DD')
+        else:
+            run_date = date.today()
+
+        def progress(counts):
+            if options['verbosity'] >= 2:
+                self.stdout.write(
+                    f"chunk: {counts['posted']:,} posted, {counts['failed']:,} failed, "
+                    f"{from_cents(counts['amount'])}"
+                )
+
+        try:
+            result = run_billing(
+                run_date, chunk_size=options['chunk_size'], max_chunks=options['max_chunks'], progress=progress
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        run = result['run']
+        self.stdout.write(self.style.SUCCESS(
+            f"Billing run {run.run_date}: {result['posted']:,} posted, {result['failed']:,} failed, "
+            f"{from_cents(result['amount'])} in {result['chunks']:,} chunks, {result['elapsed']:.2f}s "
+            f"({result['rate']:,.0f} subscriptions/s)"
+        ))
+        self.stdout.write(
+            f'Run {run.status}: {run.posted:,} posted, {run.failed:,} failed in total, checkpoint {run.checkpoint}'
+        )
@@ -0,0 +1,104 @@
+"""
+Local fake payment provider: send signed invoice.paid events to the webhook.
+
+Talks to a running server (manage.py runserver) over HTTP; no payment
+service account is needed. Re-sends a share of the events to exercise
+deduplication.
+"""
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from ledger.webhooks import sign_payload
+
+
+def fake_invoice_paid_event(subscription_id, amount_cents, created=None):
+    """A minimal invoice.paid event in the provider's format."""
+    created = created or int(time.time())
+    return {
+        'id': f'evt_{uuid.uuid4().hex[:24]}',
+        'object': 'event',
+        'type': 'invoice.paid',
+        'created': created,
+        'data': {
+            'object': {
+                'id': f'in_{uuid.uuid4().hex[:24]}',
+                'object': 'invoice',
+                'subscription': subscription_id,
+                'amount_paid': amount_cents,
+                'currency': 'usd',
+                'status_transitions': {'paid_at': created},
+            }
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = 'Send signed fake invoice.paid events to the payment webhook'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://127.0.0.1:8000/ledger/api/webhooks/payments/',
+            help='Webhook URL'
+        )
+        parser.add_argument('--count', type=int, default=100, help='Distinct events to send')
+        parser.add_argument('--duplicates', type=float, default=0.1, help='Share of events sent twice')
+        parser.add_argument('--concurrency', type=int, default=8, help='Parallel senders')
+        parser.add_argument(
+            '--secret', default=None,
+            help='Signing secret (default: settings.PAYMENT_WEBHOOK_SECRET)'
+        )
+
+    def handle(self, *args, **options):
+        secret = options['secret'] or settings.PAYMENT_WEBHOOK_SECRET
+        if not secret:
+            raise CommandError('No signing secret: set STRIPE_WEBHOOK_SECRET or pass --secret')
+
+        events = [
+            fake_invoice_paid_event(f'sub_fake_{i % 50}', random.choice([999, 1999, 2999]))
+            for i in range(options['count'])
+        ]
+        deliveries = events + random.sample(events, int(len(events) * options['duplicates']))
+        random.shuffle(deliveries)
+
+        def send(event):
+            body = json.dumps(event).encode()
+            request = urllib.request.Request(options['url'], data=body, method='POST', headers={
+                'Content-Type': 'application/json',
+                'Stripe-Signature': sign_payload(body, secret),
+            })
+            started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=10) as response:
+                    duplicate = json.loads(response.read()).get('duplicate', False)
+                    status = response.status
+            except urllib.error.HTTPError as e:
+                status, duplicate = e.code, False
+            except urllib.error.URLError as e:
+                raise CommandError(f"Cannot reach {options['url']}: {e.reason}")
+            return status, duplicate, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(send, deliveries))
+        elapsed = time.perf_counter() - started
+
+        ok = sum(1 for status, _, _ in results if status == 200)
+        duplicates = sum(1 for _, duplicate, _ in results if duplicate)
+        latencies = sorted(latency for _, _, latency in results)
+        p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Sent {len(results)} deliveries ({len(events)} events) in {elapsed:.2f}s: '
+            f'{ok} acknowledged, {duplicates} flagged duplicate, '
+            f'{len(results) - ok} rejected; p95 ack latency {p95 * 1000:.0f} ms'
+        ))
+        self.stdout.write(
+            f"Total sent: ${sum(e['data']['object']['amount_paid'] for e in events) / 100:,.2f}"
+        )
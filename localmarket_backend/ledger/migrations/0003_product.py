@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:22
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0002_seed_chart_of_accounts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Product',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slug', models.SlugField(help_text='URL identifier, e.g. citrus-ipa', max_length=100, unique=True)),
+                ('name', models.CharField(max_length=200)),
+                ('vendor_id', models.CharField(help_text='External vendor identifier (string, no FK constraint for flexibility)', max_length=100)),
+                ('image', models.URLField(blank=True, max_length=500)),
+                ('price', models.DecimalField(decimal_places=2, max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))])),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['name', 'id'],
+                'indexes': [models.Index(fields=['vendor_id', 'is_active', 'name'], name='ledger_prod_vendor__07a1ba_idx'), models.Index(fields=['is_active', 'name', 'id'], name='ledger_prod_is_acti_2decde_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:23
+
+from django.db import migrations
+from decimal import Decimal
+
+
+PRODUCTS = [
+    {
+        'slug': 'citrus-ipa',
+        'name': 'Citrus IPA',
+        'image': 'https://images.unsplash.com/photo-1608270586620-248524c67de9?w=300&h=200&fit=crop',
+        'price': Decimal('12.99'),
+    },
+    {
+        'slug': 'chocolate-stout',
+        'name': 'Chocolate Stout',
+        'image': 'https://images.unsplash.com/photo-1571613316887-6f8d5cbf7ef7?w=300&h=200&fit=crop',
+        'price': Decimal('14.99'),
+    },
+    {
+        'slug': 'golden-lager',
+        'name': 'Golden Lager',
+        'image': 'https://images.unsplash.com/photo-1581636625402-29b2a704ef13?w=300&h=200&fit=crop',
+        'price': Decimal('11.99'),
+    },
+    {
+        'slug': 'hefeweizen',
+        'name': 'Hefeweizen',
+        'image': 'https://images.unsplash.com/photo-1513475382585-d06e58bcb0e0?w=300&h=200&fit=crop',
+        'price': Decimal('13.99'),
+    },
+    {
+        'slug': 'pale-ale',
+        'name': 'Pale Ale',
+        'image': 'https://images.unsplash.com/photo-1608270586620-248524c67de9?w=300&h=200&fit=crop',
+        'price': Decimal('12.49'),
+    },
+]
+
+
+def create_products(apps, schema_editor):
+    Product = apps.get_model('ledger', 'Product')
+    
+    # Products previously hard-coded in views_web (brewery vendor page)
+    for product in PRODUCTS:
+        Product.objects.get_or_create(
+            slug=product['slug'],
+            defaults={
+                'name': product['name'],
+                'vendor_id': 'brewery',
+                'image': product['image'],
+                'price': product['price'],
+                'is_active': True
+            }
+        )
+
+
+def reverse_products(apps, schema_editor):
+    Product = apps.get_model('ledger', 'Product')
+    Product.objects.filter(slug__in=[p['slug'] for p in PRODUCTS]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0003_product'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_products, reverse_products),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:23
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0004_seed_products'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockLevel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity_on_hand', models.IntegerField(default=0)),
+                ('inventory_value', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('quantity_sold', models.IntegerField(default=0)),
+                ('cogs_total', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='stock_level', to='ledger.product')),
+            ],
+            options={
+                'ordering': ['product'],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('movement_type', models.CharField(choices=[('receipt', 'Receipt'), ('sale', 'Sale'), ('return', 'Return'), ('adjustment', 'Adjustment')], max_length=20)),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(help_text='Positive into stock, negative out of stock')),
+                ('unit_cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15)),
+                ('total_cost', models.DecimalField(decimal_places=2, default=Decimal('0.00'), help_text='Signed valuation change (quantity x unit cost)', max_digits=15)),
+                ('description', models.CharField(blank=True, max_length=500)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('journal_entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='ledger.journalentry')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_movements', to='ledger.product')),
+            ],
+            options={
+                'ordering': ['product', 'id'],
+                'indexes': [models.Index(fields=['product', 'date'], name='ledger_stoc_product_7efdb1_idx')],
+            },
+        ),
+    ]
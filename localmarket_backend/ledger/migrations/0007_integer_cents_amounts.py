@@ -0,0 +1,248 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:40
+
+import django.core.validators
+import ledger.money
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Cast, Round
+
+
+# (model, decimal field) pairs converted to integer cents
+AMOUNT_FIELDS = [
+    ('ledgerentry', 'debit'),
+    ('ledgerentry', 'credit'),
+    ('accountbalance', 'debit_total'),
+    ('accountbalance', 'credit_total'),
+    ('accountbalance', 'net_balance'),
+    ('product', 'price'),
+    ('stockmovement', 'unit_cost'),
+    ('stockmovement', 'total_cost'),
+    ('stocklevel', 'inventory_value'),
+    ('stocklevel', 'cogs_total'),
+]
+
+
+def decimals_to_cents(apps, schema_editor):
+    # Set-based copy: cents = ROUND(amount * 100) as BIGINT
+    for model_name, field in AMOUNT_FIELDS:
+        Model = apps.get_model('ledger', model_name)
+        Model.objects.update(**{
+            f'{field}_cents': Cast(Round(F(field) * 100), models.BigIntegerField())
+        })
+
+
+def cents_to_decimals(apps, schema_editor):
+    # Row by row: SQL integer division would truncate the cents
+    for model_name, field in AMOUNT_FIELDS:
+        Model = apps.get_model('ledger', model_name)
+        batch = []
+        for obj in Model.objects.only('pk', f'{field}_cents').iterator(chunk_size=2000):
+            setattr(obj, field, getattr(obj, f'{field}_cents'))
+            batch.append(obj)
+            if len(batch) >= 2000:
+                Model.objects.bulk_update(batch, [field])
+                batch = []
+        Model.objects.bulk_update(batch, [field])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0006_journalentry_updated_at_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='debit_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='credit_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='accountbalance',
+            name='debit_total_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='accountbalance',
+            name='credit_total_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='accountbalance',
+            name='net_balance_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='price_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='unit_cost_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='stockmovement',
+            name='total_cost_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='stocklevel',
+            name='inventory_value_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AddField(
+            model_name='stocklevel',
+            name='cogs_total_cents',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        # Give the old columns a default so the migration can be reversed
+        migrations.AlterField(
+            model_name='accountbalance',
+            name='net_balance',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15, validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+        ),
+        migrations.RunPython(decimals_to_cents, cents_to_decimals),
+        migrations.RemoveField(
+            model_name='ledgerentry',
+            name='debit',
+        ),
+        migrations.RemoveField(
+            model_name='ledgerentry',
+            name='credit',
+        ),
+        migrations.RemoveField(
+            model_name='accountbalance',
+            name='debit_total',
+        ),
+        migrations.RemoveField(
+            model_name='accountbalance',
+            name='credit_total',
+        ),
+        migrations.RemoveField(
+            model_name='accountbalance',
+            name='net_balance',
+        ),
+        migrations.RemoveField(
+            model_name='product',
+            name='price',
+        ),
+        migrations.RemoveField(
+            model_name='stockmovement',
+            name='unit_cost',
+        ),
+        migrations.RemoveField(
+            model_name='stockmovement',
+            name='total_cost',
+        ),
+        migrations.RemoveField(
+            model_name='stocklevel',
+            name='inventory_value',
+        ),
+        migrations.RemoveField(
+            model_name='stocklevel',
+            name='cogs_total',
+        ),
+        migrations.RenameField(
+            model_name='ledgerentry',
+            old_name='debit_cents',
+            new_name='debit',
+        ),
+        migrations.RenameField(
+            model_name='ledgerentry',
+            old_name='credit_cents',
+            new_name='credit',
+        ),
+        migrations.RenameField(
+            model_name='accountbalance',
+            old_name='debit_total_cents',
+            new_name='debit_total',
+        ),
+        migrations.RenameField(
+            model_name='accountbalance',
+            old_name='credit_total_cents',
+            new_name='credit_total',
+        ),
+        migrations.RenameField(
+            model_name='accountbalance',
+            old_name='net_balance_cents',
+            new_name='net_balance',
+        ),
+        migrations.RenameField(
+            model_name='product',
+            old_name='price_cents',
+            new_name='price',
+        ),
+        migrations.RenameField(
+            model_name='stockmovement',
+            old_name='unit_cost_cents',
+            new_name='unit_cost',
+        ),
+        migrations.RenameField(
+            model_name='stockmovement',
+            old_name='total_cost_cents',
+            new_name='total_cost',
+        ),
+        migrations.RenameField(
+            model_name='stocklevel',
+            old_name='inventory_value_cents',
+            new_name='inventory_value',
+        ),
+        migrations.RenameField(
+            model_name='stocklevel',
+            old_name='cogs_total_cents',
+            new_name='cogs_total',
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='debit',
+            field=ledger.money.MoneyField(default=Decimal('0.00'), help_text='Stored as integer cents', validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+        ),
+        migrations.AlterField(
+            model_name='ledgerentry',
+            name='credit',
+            field=ledger.money.MoneyField(default=Decimal('0.00'), help_text='Stored as integer cents', validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+        ),
+        migrations.AlterField(
+            model_name='accountbalance',
+            name='net_balance',
+            field=ledger.money.MoneyField(),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='price',
+            field=ledger.money.MoneyField(validators=[django.core.validators.MinValueValidator(Decimal('0.00'))]),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='unit_cost',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='total_cost',
+            field=ledger.money.MoneyField(default=Decimal('0.00'), help_text='Signed valuation change (quantity x unit cost)'),
+        ),
+        migrations.AlterField(
+            model_name='stocklevel',
+            name='inventory_value',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+        migrations.AlterField(
+            model_name='stocklevel',
+            name='cogs_total',
+            field=ledger.money.MoneyField(default=Decimal('0.00')),
+        ),
+    ]
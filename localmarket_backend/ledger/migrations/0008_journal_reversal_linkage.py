@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:29
+
+import django.db.models.deletion
+import ledger.money
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_amounts(apps, schema_editor):
+    """Set journal totals and link existing refunds to their originals."""
+    JournalEntry = apps.get_model('ledger', 'JournalEntry')
+    LedgerEntry = apps.get_model('ledger', 'LedgerEntry')
+    
+    debits = LedgerEntry.objects.filter(
+        journal_entry=OuterRef('pk')
+    ).values('journal_entry').annotate(total=Sum('debit')).values('total')
+    JournalEntry.objects.update(
+        amount=Coalesce(Subquery(debits, output_field=models.BigIntegerField()), Value(0))
+    )
+    
+    # An order's amount is what the customer paid, as record_order_payment()
+    # stores it: the Sales Revenue (4000) credit. Its total debits also
+    # count the fee and vendor lines.
+    revenue = LedgerEntry.objects.filter(
+        journal_entry=OuterRef('pk'), account__account_number='4000'
+    ).values('journal_entry').annotate(total=Sum('credit')).values('total')
+    JournalEntry.objects.filter(reference_type='order').update(
+        amount=Coalesce(Subquery(revenue, output_field=models.BigIntegerField()), F('amount'))
+    )
+    
+    # Refunds were posted as reference_type 'refund', reference_id
+    # '<type>_<id>' and always reversed the whole original
+    refunded = {}
+    for refund in JournalEntry.objects.filter(reference_type='refund').order_by('entry_number'):
+        reference_type, _, reference_id = refund.reference_id.partition('_')
+        original = JournalEntry.objects.filter(
+            reference_type=reference_type,
+            reference_id=reference_id,
+            status='posted'
+        ).order_by('entry_number').first()
+        if original is None:
+            continue
+        refund.reverses = original
+        refund.amount = original.amount
+        refund.save(update_fields=['reverses', 'amount'])
+        refunded[original.pk] = refunded.get(original.pk, 0) + refund.amount
+    
+    for pk, total in refunded.items():
+        JournalEntry.objects.filter(pk=pk).update(refunded_amount=total)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0007_integer_cents_amounts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='journalentry',
+            name='amount',
+            field=ledger.money.MoneyField(default=Decimal('0.00'), help_text='Gross amount refunds are measured against (default: total debits)'),
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='refunded_amount',
+            field=ledger.money.MoneyField(default=Decimal('0.00'), help_text='Total reversed so far by refunds of this entry'),
+        ),
+        migrations.AddField(
+            model_name='journalentry',
+            name='reverses',
+            field=models.ForeignKey(blank=True, help_text='Original journal entry this entry (partially) reverses', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='reversals', to='ledger.journalentry'),
+        ),
+        migrations.AddIndex(
+            model_name='journalentry',
+            index=models.Index(condition=models.Q(('refunded_amount__gt', 0)), fields=['refunded_amount'], name='ledger_jour_refunded_idx'),
+        ),
+        migrations.RunPython(backfill_amounts, migrations.RunPython.noop),
+    ]
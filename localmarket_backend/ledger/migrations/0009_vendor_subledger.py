@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:32
+
+import django.db.models.deletion
+import ledger.money
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0008_journal_reversal_linkage'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VendorBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('vendor_id', models.CharField(max_length=100)),
+                ('debit_total', ledger.money.MoneyField(default=Decimal('0.00'))),
+                ('credit_total', ledger.money.MoneyField(default=Decimal('0.00'))),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['vendor_id', 'account'],
+            },
+        ),
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='vendor_id',
+            field=models.CharField(blank=True, default='', help_text='External vendor identifier this line belongs to (vendor sub-ledger)', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['vendor_id', 'account', 'journal_entry'], name='ledger_ledg_vendor__9e98b0_idx'),
+        ),
+        migrations.AddField(
+            model_name='vendorbalance',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='vendor_balances', to='ledger.account'),
+        ),
+        migrations.AddIndex(
+            model_name='vendorbalance',
+            index=models.Index(fields=['account', 'vendor_id'], name='ledger_vend_account_f0e852_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='vendorbalance',
+            constraint=models.UniqueConstraint(fields=('vendor_id', 'account'), name='unique_vendor_account_balance'),
+        ),
+    ]
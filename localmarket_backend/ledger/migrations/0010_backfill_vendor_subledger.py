@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:34
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Sum
+
+
+def backfill_vendor_subledger(apps, schema_editor):
+    """
+    Tag existing vendor payouts and build the per-vendor balances.
+
+    Payouts were posted with reference_type 'payment' and the vendor ID as
+    reference_id; their Vendor Payables lines belong to that vendor.
+    """
+    JournalEntry = apps.get_model('ledger', 'JournalEntry')
+    LedgerEntry = apps.get_model('ledger', 'LedgerEntry')
+    VendorBalance = apps.get_model('ledger', 'VendorBalance')
+
+    LedgerEntry.objects.filter(
+        journal_entry__reference_type='payment',
+        account__account_number='2100',
+        vendor_id=''
+    ).update(
+        vendor_id=Subquery(
+            JournalEntry.objects.filter(pk=OuterRef('journal_entry_id')).values('reference_id')[:1]
+        )
+    )
+
+    rows = LedgerEntry.objects.filter(
+        journal_entry__status='posted'
+    ).exclude(vendor_id='').values('vendor_id', 'account_id').annotate(
+        debits=Sum('debit'),
+        credits=Sum('credit')
+    ).order_by()
+    VendorBalance.objects.bulk_create([
+        VendorBalance(
+            vendor_id=row['vendor_id'],
+            account_id=row['account_id'],
+            debit_total=row['debits'],
+            credit_total=row['credits']
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+def remove_vendor_balances(apps, schema_editor):
+    apps.get_model('ledger', 'VendorBalance').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0009_vendor_subledger'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_vendor_subledger, remove_vendor_balances),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0010_backfill_vendor_subledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='category',
+            field=models.CharField(blank=True, default='', help_text='Product category', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='event',
+            field=models.CharField(blank=True, default='', help_text='Event slug, e.g. summer-music-festival', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='market',
+            field=models.CharField(blank=True, default='', help_text='Market the line belongs to', max_length=100),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='category',
+            field=models.CharField(blank=True, default='', help_text='Product category, copied onto sale lines', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['market', 'account', 'journal_entry'], name='ledger_ledg_market_19fc72_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['event', 'account', 'journal_entry'], name='ledger_ledg_event_42e00c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['category', 'account', 'journal_entry'], name='ledger_ledg_categor_69154a_idx'),
+        ),
+    ]
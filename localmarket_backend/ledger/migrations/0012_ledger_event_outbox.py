@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0011_ledger_dimensions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEvent',
+            fields=[
+                ('sequence', models.BigAutoField(primary_key=True, serialize=False)),
+                ('event_type', models.CharField(choices=[('journal.posted', 'Journal posted'), ('journal.updated', 'Posted journal edited'), ('journal.unposted', 'Journal unposted')], max_length=30)),
+                ('payload', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('journal_entry', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='events', to='ledger.journalentry')),
+            ],
+            options={
+                'ordering': ['sequence'],
+            },
+        ),
+    ]
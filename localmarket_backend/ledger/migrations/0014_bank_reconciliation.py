@@ -0,0 +1,80 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:39
+
+import django.db.models.deletion
+import ledger.money
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0013_webhook_event'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BankStatementImport',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('filename', models.CharField(blank=True, max_length=255)),
+                ('line_count', models.IntegerField(default=0, help_text='New lines imported (re-imported lines are skipped)')),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['-imported_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BankStatementLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('amount', ledger.money.MoneyField()),
+                ('description', models.CharField(blank=True, max_length=500)),
+                ('reference', models.CharField(blank=True, max_length=100)),
+                ('fingerprint', models.CharField(help_text='Identifies the line across re-imports', max_length=64)),
+                ('status', models.CharField(choices=[('unmatched', 'Unmatched'), ('matched', 'Matched')], default='unmatched', max_length=10)),
+                ('match_method', models.CharField(blank=True, choices=[('exact', 'Exact amount and date'), ('window', 'Exact amount within date window'), ('tolerance', 'Amount within tolerance'), ('manual', 'Manual')], max_length=10)),
+            ],
+            options={
+                'ordering': ['date', 'id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='ledgerentry',
+            name='reconciled',
+            field=models.BooleanField(default=False, help_text='Matched to a bank statement line'),
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(condition=models.Q(('reconciled', False)), fields=['account', 'journal_entry'], name='ledger_ledg_unreconciled_idx'),
+        ),
+        migrations.AddField(
+            model_name='bankstatementimport',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='statement_imports', to='ledger.account'),
+        ),
+        migrations.AddField(
+            model_name='bankstatementline',
+            name='account',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='statement_lines', to='ledger.account'),
+        ),
+        migrations.AddField(
+            model_name='bankstatementline',
+            name='matched_entry',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='statement_line', to='ledger.ledgerentry'),
+        ),
+        migrations.AddField(
+            model_name='bankstatementline',
+            name='statement_import',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='ledger.bankstatementimport'),
+        ),
+        migrations.AddIndex(
+            model_name='bankstatementline',
+            index=models.Index(fields=['account', 'status', 'date'], name='ledger_bank_account_fd1056_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='bankstatementline',
+            constraint=models.UniqueConstraint(fields=('account', 'fingerprint'), name='unique_statement_line'),
+        ),
+    ]
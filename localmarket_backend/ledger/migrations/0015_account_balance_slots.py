@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:53
+
+import django.db.models.deletion
+import ledger.money
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0014_bank_reconciliation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='counter_slots',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Balance counter slots for hot accounts; postings update one slot at random instead of the single AccountBalance row (0 = off)'),
+        ),
+        migrations.CreateModel(
+            name='AccountBalanceSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('debit_total', ledger.money.MoneyField(default=Decimal('0.00'))),
+                ('credit_total', ledger.money.MoneyField(default=Decimal('0.00'))),
+                ('last_updated', models.DateTimeField(auto_now=True)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_slots', to='ledger.account')),
+            ],
+            options={
+                'ordering': ['account', 'slot'],
+                'constraints': [models.UniqueConstraint(fields=('account', 'slot'), name='unique_account_balance_slot')],
+            },
+        ),
+    ]
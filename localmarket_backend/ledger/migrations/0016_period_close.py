@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:59
+
+import django.db.models.deletion
+import ledger.money
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0015_account_balance_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountingPeriod',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateField(unique=True)),
+                ('end', models.DateField(unique=True)),
+                ('closed_at', models.DateTimeField(auto_now_add=True)),
+                ('closing_entry', models.OneToOneField(blank=True, help_text="Journal rolling the period's revenue and expense into Retained Earnings", null=True, on_delete=django.db.models.deletion.PROTECT, related_name='closed_period', to='ledger.journalentry')),
+            ],
+            options={
+                'ordering': ['-start'],
+            },
+        ),
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of_date', models.DateField()),
+                ('debit_total', ledger.money.MoneyField(default=Decimal('0.00'))),
+                ('credit_total', ledger.money.MoneyField(default=Decimal('0.00'))),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='ledger.account')),
+                ('period', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='ledger.accountingperiod')),
+            ],
+            options={
+                'ordering': ['-as_of_date', 'account'],
+                'constraints': [models.UniqueConstraint(fields=('account', 'as_of_date'), name='unique_account_checkpoint')],
+            },
+        ),
+    ]
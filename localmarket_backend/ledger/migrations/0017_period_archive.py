@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0016_period_close'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accountingperiod',
+            name='archived_at',
+            field=models.DateTimeField(blank=True, help_text="When the period's journals were moved out of the database into the archive", null=True),
+        ),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-19 03:10
+
+from django.db import migrations
+
+# SQLite FTS5 indexes over journal and line text (see ledger/search.py).
+# External-content tables: the text stays in the ledger tables, and triggers
+# keep the indexes in step with every insert, edit and delete, including
+# bulk_create() and the archive's raw deletes.
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE ledger_journal_fts USING fts5(
+        description, reference_type, reference_id,
+        content='ledger_journalentry', content_rowid='entry_number'
+    )
+    """,
+    """
+    CREATE TRIGGER ledger_journal_fts_insert AFTER INSERT ON ledger_journalentry BEGIN
+        INSERT INTO ledger_journal_fts (rowid, description, reference_type, reference_id)
+        VALUES (new.entry_number, new.description, new.reference_type, new.reference_id);
+    END
+    """,
+    """
+    CREATE TRIGGER ledger_journal_fts_delete AFTER DELETE ON ledger_journalentry BEGIN
+        INSERT INTO ledger_journal_fts (ledger_journal_fts, rowid, description, reference_type, reference_id)
+        VALUES ('delete', old.entry_number, old.description, old.reference_type, old.reference_id);
+    END
+    """,
+    """
+    CREATE TRIGGER ledger_journal_fts_update
+    AFTER UPDATE OF description, reference_type, reference_id ON ledger_journalentry BEGIN
+        INSERT INTO ledger_journal_fts (ledger_journal_fts, rowid, description, reference_type, reference_id)
+        VALUES ('delete', old.entry_number, old.description, old.reference_type, old.reference_id);
+        INSERT INTO ledger_journal_fts (rowid, description, reference_type, reference_id)
+        VALUES (new.entry_number, new.description, new.reference_type, new.reference_id);
+    END
+    """,
+    """
+    CREATE VIRTUAL TABLE ledger_line_fts USING fts5(
+        description, vendor_id,
+        content='ledger_ledgerentry', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER ledger_line_fts_insert AFTER INSERT ON ledger_ledgerentry BEGIN
+        INSERT INTO ledger_line_fts (rowid, description, vendor_id)
+        VALUES (new.id, new.description, new.vendor_id);
+    END
+    """,
+    """
+    CREATE TRIGGER ledger_line_fts_delete AFTER DELETE ON ledger_ledgerentry BEGIN
+        INSERT INTO ledger_line_fts (ledger_line_fts, rowid, description, vendor_id)
+        VALUES ('delete', old.id, old.description, old.vendor_id);
+    END
+    """,
+    """
+    CREATE TRIGGER ledger_line_fts_update AFTER UPDATE OF description, vendor_id ON ledger_ledgerentry BEGIN
+        INSERT INTO ledger_line_fts (ledger_line_fts, rowid, description, vendor_id)
+        VALUES ('delete', old.id, old.description, old.vendor_id);
+        INSERT INTO ledger_line_fts (rowid, description, vendor_id)
+        VALUES (new.id, new.description, new.vendor_id);
+    END
+    """,
+    # Index the rows that already exist
+    "INSERT INTO ledger_journal_fts (ledger_journal_fts) VALUES ('rebuild')",
+    "INSERT INTO ledger_line_fts (ledger_line_fts) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    'DROP TRIGGER IF EXISTS ledger_line_fts_update',
+    'DROP TRIGGER IF EXISTS ledger_line_fts_delete',
+    'DROP TRIGGER IF EXISTS ledger_line_fts_insert',
+    'DROP TABLE IF EXISTS ledger_line_fts',
+    'DROP TRIGGER IF EXISTS ledger_journal_fts_update',
+    'DROP TRIGGER IF EXISTS ledger_journal_fts_delete',
+    'DROP TRIGGER IF EXISTS ledger_journal_fts_insert',
+    'DROP TABLE IF EXISTS ledger_journal_fts',
+]
+
+
+def create_search_index(apps, schema_editor):
+    # Other databases fall back to LIKE filters (see ledger/search.py)
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in CREATE_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in DROP_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0017_period_archive'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
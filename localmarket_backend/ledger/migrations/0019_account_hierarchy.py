@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat
+
+
+def set_root_paths(apps, schema_editor):
+    """Every existing account is a root: path '<id>/'."""
+    Account = apps.get_model('ledger', 'Account')
+    Account.objects.update(path=Concat(Cast(F('id'), CharField()), Value('/')), depth=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0018_fulltext_search'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='parent',
+            field=models.ForeignKey(blank=True, help_text='Parent account; its subtotals include this account', null=True, on_delete=django.db.models.deletion.PROTECT, related_name='children', to='ledger.account'),
+        ),
+        migrations.AddField(
+            model_name='account',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, help_text="Account ids from the root, e.g. '1/7/'", max_length=255),
+        ),
+        migrations.RunPython(set_root_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:29
+
+import django.core.validators
+import django.db.models.deletion
+import ledger.money
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0019_account_hierarchy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BillingRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField(unique=True)),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed')], default='running', max_length=10)),
+                ('checkpoint', models.PositiveBigIntegerField(default=0, help_text='Id of the last subscription handled')),
+                ('chunks', models.PositiveIntegerField(default=0)),
+                ('posted', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('amount', ledger.money.MoneyField(default=Decimal('0.00'), help_text='Total charged')),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['-run_date'],
+            },
+        ),
+        migrations.CreateModel(
+            name='Subscription',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subscription_id', models.CharField(help_text='External subscription identifier', max_length=100, unique=True)),
+                ('amount', ledger.money.MoneyField(validators=[django.core.validators.MinValueValidator(Decimal('0.01'))])),
+                ('interval_months', models.PositiveSmallIntegerField(default=1, validators=[django.core.validators.MinValueValidator(1)])),
+                ('start_date', models.DateField(help_text='First billing date; later charges fall on the same day of the month')),
+                ('next_billing_date', models.DateField()),
+                ('last_billed_date', models.DateField(blank=True, help_text='Date of the last billing run that charged it', null=True)),
+                ('status', models.CharField(choices=[('active', 'Active'), ('paused', 'Paused'), ('cancelled', 'Cancelled')], default='active', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['subscription_id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'active')), fields=['next_billing_date', 'id'], name='ledger_subscription_due_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='BillingRunFailure',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('error', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('run', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='failures', to='ledger.billingrun')),
+                ('subscription', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='billing_failures', to='ledger.subscription')),
+            ],
+            options={
+                'ordering': ['run', 'subscription'],
+                'constraints': [models.UniqueConstraint(fields=('run', 'subscription'), name='unique_billing_run_failure')],
+            },
+        ),
+    ]
@@ -0,0 +1,42 @@
+from django.db import migrations
+
+
+# Inventory is valued by the stock sub-ledger; the vendor's share of a sale
+# gets its own expense account so Cost of Goods Sold (5200) is stock cost only
+ACCOUNTS = [
+    ('1300', 'Inventory', 'Asset', 'Debit'),
+    ('5300', 'Vendor Share of Sales', 'Expense', 'Debit'),
+]
+
+
+def create_inventory_accounts(apps, schema_editor):
+    Account = apps.get_model('ledger', 'Account')
+    for account_number, account_name, account_type, normal_balance in ACCOUNTS:
+        account, created = Account.objects.get_or_create(
+            account_number=account_number,
+            defaults={
+                'account_name': account_name,
+                'account_type': account_type,
+                'normal_balance': normal_balance,
+                'is_active': True
+            }
+        )
+        if created:
+            # Historical models skip Account.save(), which sets the path
+            Account.objects.filter(pk=account.pk).update(path=f'{account.pk}/', depth=0)
+
+
+def remove_inventory_accounts(apps, schema_editor):
+    Account = apps.get_model('ledger', 'Account')
+    Account.objects.filter(account_number__in=[account[0] for account in ACCOUNTS]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ledger', '0020_subscription_billing'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_inventory_accounts, remove_inventory_accounts),
+    ]
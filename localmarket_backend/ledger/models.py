@@ -2,10 +2,18 @@ from django.db import models
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 
+from .money import MoneyField
+
 
 class Account(models.Model):
     """
     Chart of Accounts - Account model
+    
+    Accounts form a tree through parent (e.g. per-market cash accounts under
+    1000 Cash). path is a materialized path of account ids from the root,
+    '1/7/' for account 7 under account 1, kept up to date by save(): the
+    subtree of an account is one indexed prefix filter, and its ancestors
+    are read off its path without queries.
     """
     ACCOUNT_TYPES = [
         ('Asset', 'Asset'),
@@ -25,6 +33,22 @@ class Account(models.Model):
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
     normal_balance = models.CharField(max_length=10, choices=NORMAL_BALANCE_CHOICES)
     is_active = models.BooleanField(default=True)
+    counter_slots = models.PositiveSmallIntegerField(
+        default=0,
+        help_text="Balance counter slots for hot accounts; postings update one slot at random "
+                  "instead of the single AccountBalance row (0 = off)"
+    )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='children',
+        help_text="Parent account; its subtotals include this account"
+    )
+    path = models.CharField(max_length=255, db_index=True, editable=False, default='',
+                            help_text="Account ids from the root, e.g. '1/7/'")
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -33,6 +57,62 @@ class Account(models.Model):
     
     def __str__(self):
         return f"{self.account_number} - {self.account_name}"
+    
+    def ancestor_ids(self):
+        """Ids from the root down to this account (included)."""
+        return [int(part) for part in self.path.split('/') if part] or [self.pk]
+    
+    def subtree(self):
+        """This account and all its descendants."""
+        if not self.path:
+            return Account.objects.filter(pk=self.pk)
+        return Account.objects.filter(path__startswith=self.path)
+    
+    def clean(self):
+        from django.core.exceptions import ValidationError
+        if self.parent_id is None:
+            return
+        parent = Account.objects.filter(pk=self.parent_id).values('path', 'account_type').first()
+        if parent is None:
+            return
+        if self.pk and str(self.pk) in parent['path'].split('/'):
+            raise ValidationError({'parent': "An account cannot be placed under itself or one of its sub-accounts"})
+        if parent['account_type'] != self.account_type:
+            raise ValidationError({'parent': "A sub-account must have the same account type as its parent"})
+    
+    def save(self, *args, **kwargs):
+        self.clean()
+        if self.pk is not None:
+            # Start from the stored path: moving an ancestor since this
+            # instance was loaded has changed it
+            stored = Account.objects.filter(pk=self.pk).values_list('path', 'depth').first()
+            if stored is not None:
+                self.path, self.depth = stored
+        super().save(*args, **kwargs)
+        self._update_path()
+    
+    def _update_path(self):
+        """Set path and depth from the parent, and move the subtree along."""
+        from django.db.models import F, Value
+        from django.db.models.functions import Concat, Substr
+        
+        parent_path = ''
+        if self.parent_id is not None:
+            parent_path = Account.objects.filter(pk=self.parent_id).values_list('path', flat=True).get()
+        path = f'{parent_path}{self.pk}/'
+        depth = path.count('/') - 1
+        if path == self.path and depth == self.depth:
+            return
+        
+        old_path, old_depth = self.path, self.depth
+        Account.objects.filter(pk=self.pk).update(path=path, depth=depth)
+        if old_path:
+            # One UPDATE for the whole subtree: swap the path prefix, shift the depth
+            Account.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+                depth=F('depth') + (depth - old_depth)
+            )
+        self.path, self.depth = path, depth
 
 
 class JournalEntry(models.Model):
@@ -56,6 +136,19 @@ class JournalEntry(models.Model):
         help_text="External system's ID (string, no FK constraint for flexibility)"
     )
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='draft')
+    amount = MoneyField(default=Decimal('0.00'), help_text="Gross amount refunds are measured against (default: total debits)")
+    reverses = models.ForeignKey(
+        'self',
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='reversals',
+        help_text="Original journal entry this entry (partially) reverses"
+    )
+    refunded_amount = MoneyField(
+        default=Decimal('0.00'),
+        help_text="Total reversed so far by refunds of this entry"
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -65,6 +158,12 @@ class JournalEntry(models.Model):
         indexes = [
             models.Index(fields=['reference_type', 'reference_id']),
             models.Index(fields=['date']),
+            models.Index(fields=['updated_at']),
+            models.Index(
+                fields=['refunded_amount'],
+                condition=models.Q(refunded_amount__gt=0),
+                name='ledger_jour_refunded_idx'
+            ),
         ]
     
     def __str__(self):
@@ -77,6 +176,10 @@ class JournalEntry(models.Model):
     @property
     def total_credits(self):
         return sum(entry.credit for entry in self.ledger_entries.all())
+    
+    @property
+    def refundable_amount(self):
+        return self.amount - self.refunded_amount
 
 
 class LedgerEntry(models.Model):
@@ -89,25 +192,46 @@ class LedgerEntry(models.Model):
         related_name='ledger_entries'
     )
     account = models.ForeignKey(Account, on_delete=models.PROTECT)
-    debit = models.DecimalField(
-        max_digits=15,
-        decimal_places=2,
+    debit = MoneyField(
         default=Decimal('0.00'),
-        validators=[MinValueValidator(Decimal('0.00'))]
+        validators=[MinValueValidator(Decimal('0.00'))],
+        help_text="Stored as integer cents"
     )
-    credit = models.DecimalField(
-        max_digits=15,
-        decimal_places=2,
+    credit = MoneyField(
         default=Decimal('0.00'),
-        validators=[MinValueValidator(Decimal('0.00'))]
+        validators=[MinValueValidator(Decimal('0.00'))],
+        help_text="Stored as integer cents"
     )
     description = models.CharField(max_length=500, blank=True)
+    vendor_id = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        help_text="External vendor identifier this line belongs to (vendor sub-ledger)"
+    )
+    # Analytic dimensions (blank = untagged)
+    market = models.CharField(max_length=100, blank=True, default='', help_text="Market the line belongs to")
+    event = models.CharField(max_length=100, blank=True, default='', help_text="Event slug, e.g. summer-music-festival")
+    category = models.CharField(max_length=100, blank=True, default='', help_text="Product category")
+    reconciled = models.BooleanField(default=False, help_text="Matched to a bank statement line")
+    
+    # Tag fields accepted on journal lines and usable in pivot reports
+    DIMENSIONS = ('vendor_id', 'market', 'event', 'category')
     
     class Meta:
         ordering = ['journal_entry', 'id']
         verbose_name_plural = "Ledger Entries"
         indexes = [
             models.Index(fields=['account', 'journal_entry']),
+            models.Index(fields=['vendor_id', 'account', 'journal_entry']),
+            models.Index(fields=['market', 'account', 'journal_entry']),
+            models.Index(fields=['event', 'account', 'journal_entry']),
+            models.Index(fields=['category', 'account', 'journal_entry']),
+            models.Index(
+                fields=['account', 'journal_entry'],
+                condition=models.Q(reconciled=False),
+                name='ledger_ledg_unreconciled_idx'
+            ),
         ]
     
     def __str__(self):
@@ -137,9 +261,9 @@ class AccountBalance(models.Model):
         related_name='balance'
     )
     balance_as_of_date = models.DateField()
-    debit_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
-    credit_total = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
-    net_balance = models.DecimalField(max_digits=15, decimal_places=2)
+    debit_total = MoneyField(default=Decimal('0.00'))
+    credit_total = MoneyField(default=Decimal('0.00'))
+    net_balance = MoneyField()
     last_updated = models.DateTimeField(auto_now=True)
     
     class Meta:
@@ -147,3 +271,445 @@ class AccountBalance(models.Model):
     
     def __str__(self):
         return f"{self.account.account_name} - Balance: {self.net_balance}"
+
+
+class AccountBalanceSlot(models.Model):
+    """
+    One shard of a hot account's balance counter
+    
+    Holds the debits and credits posted since the last compaction; the
+    account's balance is its AccountBalance plus all of its slots.
+    """
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='balance_slots')
+    slot = models.PositiveSmallIntegerField()
+    debit_total = MoneyField(default=Decimal('0.00'))
+    credit_total = MoneyField(default=Decimal('0.00'))
+    last_updated = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['account', 'slot']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'slot'], name='unique_account_balance_slot'),
+        ]
+    
+    def __str__(self):
+        return f"{self.account.account_name} - Slot {self.slot}"
+
+
+class AccountingPeriod(models.Model):
+    """
+    A closed accounting month
+    
+    Months are closed in order; nothing can be posted on or before the
+    latest period's end. The closing journal rolls revenue and expense into
+    Retained Earnings. Archived periods have had their journals moved to the
+    columnar archive (see archive.py).
+    """
+    start = models.DateField(unique=True)
+    end = models.DateField(unique=True)
+    closing_entry = models.OneToOneField(
+        JournalEntry,
+        on_delete=models.PROTECT,
+        null=True,
+        blank=True,
+        related_name='closed_period',
+        help_text="Journal rolling the period's revenue and expense into Retained Earnings"
+    )
+    closed_at = models.DateTimeField(auto_now_add=True)
+    archived_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        help_text="When the period's journals were moved out of the database into the archive"
+    )
+    
+    class Meta:
+        ordering = ['-start']
+    
+    def __str__(self):
+        return f"{self.start:%Y-%m}"
+
+
+class BalanceCheckpoint(models.Model):
+    """
+    Cumulative posted totals of an account at the end of a closed period,
+    including the period's closing journal
+    """
+    period = models.ForeignKey(AccountingPeriod, on_delete=models.CASCADE, related_name='checkpoints')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='checkpoints')
+    as_of_date = models.DateField()
+    debit_total = MoneyField(default=Decimal('0.00'))
+    credit_total = MoneyField(default=Decimal('0.00'))
+    
+    class Meta:
+        ordering = ['-as_of_date', 'account']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'as_of_date'], name='unique_account_checkpoint'),
+        ]
+    
+    def __str__(self):
+        return f"{self.account.account_name} - {self.as_of_date}"
+
+
+class VendorBalance(models.Model):
+    """
+    Running per-vendor totals for each account, updated as lines are posted
+    """
+    vendor_id = models.CharField(max_length=100)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='vendor_balances')
+    debit_total = MoneyField(default=Decimal('0.00'))
+    credit_total = MoneyField(default=Decimal('0.00'))
+    last_updated = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['vendor_id', 'account']
+        constraints = [
+            models.UniqueConstraint(fields=['vendor_id', 'account'], name='unique_vendor_account_balance'),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'vendor_id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.vendor_id} - {self.account.account_name}"
+    
+    @property
+    def net_balance(self):
+        if self.account.account_type in ['Asset', 'Expense']:
+            return self.debit_total - self.credit_total
+        return self.credit_total - self.debit_total
+
+
+class Product(models.Model):
+    """
+    Product catalog - items sold by vendors on the marketplace
+    """
+    slug = models.SlugField(max_length=100, unique=True, help_text="URL identifier, e.g. citrus-ipa")
+    name = models.CharField(max_length=200)
+    vendor_id = models.CharField(
+        max_length=100,
+        help_text="External vendor identifier (string, no FK constraint for flexibility)"
+    )
+    category = models.CharField(max_length=100, blank=True, default='', help_text="Product category, copied onto sale lines")
+    image = models.URLField(max_length=500, blank=True)
+    price = MoneyField(validators=[MinValueValidator(Decimal('0.00'))])
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['name', 'id']
+        indexes = [
+            models.Index(fields=['vendor_id', 'is_active', 'name']),
+            models.Index(fields=['is_active', 'name', 'id']),
+        ]
+    
+    def __str__(self):
+        return f"{self.name} ({self.vendor_id})"
+    
+    def save(self, *args, **kwargs):
+        from .services import invalidate_product_cache
+        if self.pk:
+            # Drop the cached entry under the old slug if it is being renamed
+            old_slug = Product.objects.filter(pk=self.pk).values_list('slug', flat=True).first()
+            if old_slug and old_slug != self.slug:
+                invalidate_product_cache(old_slug)
+        super().save(*args, **kwargs)
+        invalidate_product_cache(self.slug)
+    
+    def delete(self, *args, **kwargs):
+        from .services import invalidate_product_cache
+        invalidate_product_cache(self.slug)
+        return super().delete(*args, **kwargs)
+
+
+class StockMovement(models.Model):
+    """
+    Stock Movement - Quantity in/out of a product, optionally tied to a journal entry
+    """
+    MOVEMENT_TYPES = [
+        ('receipt', 'Receipt'),
+        ('sale', 'Sale'),
+        ('return', 'Return'),
+        ('adjustment', 'Adjustment'),
+    ]
+    
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.PROTECT,
+        related_name='stock_movements'
+    )
+    journal_entry = models.ForeignKey(
+        JournalEntry,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='stock_movements'
+    )
+    movement_type = models.CharField(max_length=20, choices=MOVEMENT_TYPES)
+    date = models.DateField()
+    quantity = models.IntegerField(help_text="Positive into stock, negative out of stock")
+    unit_cost = MoneyField(default=Decimal('0.00'))
+    total_cost = MoneyField(default=Decimal('0.00'), help_text="Signed valuation change (quantity x unit cost)")
+    description = models.CharField(max_length=500, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['product', 'id']
+        indexes = [
+            models.Index(fields=['product', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.product.name} {self.quantity:+d} ({self.movement_type})"
+
+
+class StockLevel(models.Model):
+    """
+    Running stock totals per product, updated incrementally with each movement
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='stock_level'
+    )
+    quantity_on_hand = models.IntegerField(default=0)
+    inventory_value = MoneyField(default=Decimal('0.00'))
+    quantity_sold = models.IntegerField(default=0)
+    cogs_total = MoneyField(default=Decimal('0.00'))
+    last_updated = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['product']
+    
+    def __str__(self):
+        return f"{self.product.name} - On hand: {self.quantity_on_hand}"
+    
+    @property
+    def average_cost(self):
+        if self.quantity_on_hand <= 0:
+            return Decimal('0.00')
+        return (self.inventory_value / self.quantity_on_hand).quantize(Decimal('0.01'))
+
+
+class LedgerEvent(models.Model):
+    """
+    Outbox of ledger changes for downstream consumers, in posting order
+    
+    Written in the same database transaction as the posting, so the feed
+    never shows a journal that was rolled back or misses one that committed.
+    """
+    EVENT_TYPES = [
+        ('journal.posted', 'Journal posted'),
+        ('journal.updated', 'Posted journal edited'),
+        ('journal.unposted', 'Journal unposted'),
+    ]
+    
+    sequence = models.BigAutoField(primary_key=True)
+    event_type = models.CharField(max_length=30, choices=EVENT_TYPES)
+    journal_entry = models.ForeignKey(
+        JournalEntry,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='events'
+    )
+    payload = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['sequence']
+    
+    def __str__(self):
+        return f"#{self.sequence} {self.event_type}"
+
+
+class WebhookEvent(models.Model):
+    """
+    Payment provider event received by the webhook endpoint
+    
+    Stored and acknowledged on receipt (event_id is unique, so retries are
+    deduplicated) and posted to the ledger later in batches.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('posted', 'Posted'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_id = models.CharField(max_length=255, unique=True)
+    event_type = models.CharField(max_length=100)
+    payload = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    journal_entry = models.ForeignKey(
+        JournalEntry,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='webhook_events'
+    )
+    error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                condition=models.Q(status='pending'),
+                name='ledger_webhook_pending_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_id} ({self.event_type}, {self.status})"
+
+
+class BankStatementImport(models.Model):
+    """
+    One imported bank statement file for a cash or bank account
+    """
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='statement_imports')
+    filename = models.CharField(max_length=255, blank=True)
+    line_count = models.IntegerField(default=0, help_text="New lines imported (re-imported lines are skipped)")
+    imported_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-imported_at']
+    
+    def __str__(self):
+        return f"{self.account.account_number} {self.filename or 'statement'} ({self.line_count} lines)"
+
+
+class BankStatementLine(models.Model):
+    """
+    A bank statement line, matched against a ledger line of the same account
+    
+    amount is signed from the bank's point of view: deposits positive,
+    withdrawals negative (so it compares with ledger debit - credit).
+    """
+    STATUS_CHOICES = [
+        ('unmatched', 'Unmatched'),
+        ('matched', 'Matched'),
+    ]
+    MATCH_METHODS = [
+        ('exact', 'Exact amount and date'),
+        ('window', 'Exact amount within date window'),
+        ('tolerance', 'Amount within tolerance'),
+        ('manual', 'Manual'),
+    ]
+    
+    statement_import = models.ForeignKey(BankStatementImport, on_delete=models.CASCADE, related_name='lines')
+    account = models.ForeignKey(Account, on_delete=models.PROTECT, related_name='statement_lines')
+    date = models.DateField()
+    amount = MoneyField()
+    description = models.CharField(max_length=500, blank=True)
+    reference = models.CharField(max_length=100, blank=True)
+    fingerprint = models.CharField(max_length=64, help_text="Identifies the line across re-imports")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='unmatched')
+    match_method = models.CharField(max_length=10, choices=MATCH_METHODS, blank=True)
+    matched_entry = models.OneToOneField(
+        LedgerEntry,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='statement_line'
+    )
+    
+    class Meta:
+        ordering = ['date', 'id']
+        constraints = [
+            models.UniqueConstraint(fields=['account', 'fingerprint'], name='unique_statement_line'),
+        ]
+        indexes = [
+            models.Index(fields=['account', 'status', 'date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.date} {self.amount} {self.description}"
+
+
+class Subscription(models.Model):
+    """
+    Recurring subscription charged by the billing run (see billing.py)
+    
+    Each run posts one Cash / Subscription Revenue journal per subscription
+    due on its date and moves next_billing_date on by interval_months.
+    """
+    STATUS_CHOICES = [
+        ('active', 'Active'),
+        ('paused', 'Paused'),
+        ('cancelled', 'Cancelled'),
+    ]
+    
+    subscription_id = models.CharField(max_length=100, unique=True, help_text="External subscription identifier")
+    amount = MoneyField(validators=[MinValueValidator(Decimal('0.01'))])
+    interval_months = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
+    start_date = models.DateField(help_text="First billing date; later charges fall on the same day of the month")
+    next_billing_date = models.DateField()
+    last_billed_date = models.DateField(null=True, blank=True, help_text="Date of the last billing run that charged it")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['subscription_id']
+        indexes = [
+            # Due subscriptions in id order, the billing run's chunk scan
+            models.Index(
+                fields=['next_billing_date', 'id'],
+                condition=models.Q(status='active'),
+                name='ledger_subscription_due_idx'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.subscription_id} ({self.amount} every {self.interval_months} month(s), {self.status})"
+
+
+class BillingRun(models.Model):
+    """
+    One billing run per date, with its checkpoint and counts
+    
+    checkpoint is the id of the last subscription handled. It is saved in
+    the same transaction as each chunk's journals, so a run that crashed
+    resumes after the last committed chunk.
+    """
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+    ]
+    
+    run_date = models.DateField(unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='running')
+    checkpoint = models.PositiveBigIntegerField(default=0, help_text="Id of the last subscription handled")
+    chunks = models.PositiveIntegerField(default=0)
+    posted = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    amount = MoneyField(default=Decimal('0.00'), help_text="Total charged")
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-run_date']
+    
+    def __str__(self):
+        return f"Billing run {self.run_date} ({self.status}: {self.posted} posted, {self.failed} failed)"
+
+
+class BillingRunFailure(models.Model):
+    """A subscription a billing run could not charge, and why"""
+    run = models.ForeignKey(BillingRun, on_delete=models.CASCADE, related_name='failures')
+    subscription = models.ForeignKey(Subscription, on_delete=models.CASCADE, related_name='billing_failures')
+    error = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['run', 'subscription']
+        constraints = [
+            models.UniqueConstraint(fields=['run', 'subscription'], name='unique_billing_run_failure'),
+        ]
+    
+    def __str__(self):
+        return f"{self.run.run_date} {self.subscription.subscription_id}: {self.error}"
@@ -0,0 +1,106 @@
+"""
+Money helpers - amounts as integer minor units (cents)
+
+Ledger amounts are stored and summed as 64-bit integer cents. Python code
+works in int cents internally and converts to 2-place Decimals only at the
+API boundary with from_cents().
+"""
+from decimal import Decimal, InvalidOperation
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models import Sum, lookups
+
+CENTS = 100
+MAX_CENTS = 2 ** 63 - 1
+
+
+def to_cents(value):
+    """
+    Convert an amount to integer cents exactly.
+
+    Accepts Decimal, int, str or float (floats go through str() so 0.1
+    becomes 10 cents, not 10.000000000000000555).
+
+    Raises:
+        ValueError: If the value is not a number, has more than two decimal
+            places or does not fit in 64 bits
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        cents = value * CENTS
+    else:
+        if value is None or value == '':
+            value = 0
+        try:
+            amount = value if isinstance(value, Decimal) else Decimal(str(value))
+            scaled = amount.scaleb(2)
+            cents = int(scaled)
+        except (InvalidOperation, ValueError, TypeError):
+            raise ValueError(f"Invalid amount: {value!r}")
+        if scaled != cents:
+            raise ValueError(f"Amount {value} has more than two decimal places")
+    if abs(cents) > MAX_CENTS:
+        raise ValueError(f"Amount {value} is out of range")
+    return cents
+
+
+def from_cents(cents):
+    """Convert integer cents to a 2-place Decimal (e.g. 1234 -> Decimal('12.34'))."""
+    return Decimal(cents).scaleb(-2)
+
+
+def cents_to_float(cents):
+    """Convert integer cents to a float for JSON report output."""
+    return cents / CENTS
+
+
+class SumCents(Sum):
+    """Sum of a MoneyField as raw integer cents (0 when there are no rows)."""
+
+    def __init__(self, expression, **extra):
+        extra.setdefault('output_field', models.BigIntegerField())
+        extra.setdefault('default', 0)
+        super().__init__(expression, **extra)
+
+
+class MoneyField(models.BigIntegerField):
+    """
+    Amount stored as a BIGINT of cents; the Python value is a 2-place Decimal.
+
+    Queries, filters and aggregates keep working with Decimals, while the
+    database sums plain integers.
+    """
+    description = "Amount in integer minor units"
+
+    def from_db_value(self, value, expression, connection):
+        if value is None:
+            return value
+        return from_cents(int(value))
+
+    def to_python(self, value):
+        if value is None:
+            return value
+        try:
+            return from_cents(to_cents(value))
+        except ValueError as e:
+            raise ValidationError(str(e), code='invalid')
+
+    def get_prep_value(self, value):
+        if value is None or hasattr(value, 'resolve_expression'):
+            return value
+        return to_cents(value)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{
+            'form_class': forms.DecimalField,
+            'max_digits': 18,
+            'decimal_places': 2,
+            **kwargs,
+        })
+
+
+# IntegerField rounds float right-hand sides of gte/lt to whole numbers;
+# money amounts need the plain lookups so 0.5 means 50 cents
+MoneyField.register_lookup(lookups.GreaterThanOrEqual)
+MoneyField.register_lookup(lookups.LessThan)
@@ -0,0 +1,182 @@
+"""
+Accounting period close
+
+Closing a month does three things:
+- Locks it: nothing can be posted on or before its last day.
+- Posts a closing journal that rolls revenue and expense into Retained
+  Earnings (3100).
+- Writes a BalanceCheckpoint per account with its cumulative totals at month
+  end.
+
+Months are closed in order, so every date up to the latest period's end is
+closed. The first close also rolls any earlier history. Balance and report
+queries in services.py start from the nearest checkpoint and read only the
+ledger lines after it.
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_date
+
+from .models import Account, AccountingPeriod, BalanceCheckpoint, JournalEntry
+from .money import from_cents
+
+CLOSING_REFERENCE_TYPE = 'period_close'
+RETAINED_EARNINGS_ACCOUNT = '3100'
+
+
+def closed_through():
+    """Last day of the latest closed period, or None if nothing is closed."""
+    return AccountingPeriod.objects.aggregate(end=Max('end'))['end']
+
+
+def closed_date_errors(dates):
+    """
+    Validation errors for posting dates in a closed period.
+
+    Args:
+        dates: List of posting dates (date or YYYY-MM-DD string)
+
+    Returns:
+        List with one error dict (or None) per date, in the format of
+        JournalValidationError.errors
+    """
+    last_closed = closed_through()
+    errors = []
+    for posting_date in dates:
+        if isinstance(posting_date, str):
+            posting_date = parse_date(posting_date)
+        if last_closed is not None and posting_date is not None and posting_date <= last_closed:
+            errors.append({
+                'line': None,
+                'field': 'date',
+                'message': f'{posting_date} is in a closed period (closed through {last_closed})'
+            })
+        else:
+            errors.append(None)
+    return errors
+
+
+def month_bounds(year, month):
+    return date(year, month, 1), date(year, month, monthrange(year, month)[1])
+
+
+def close_period(year, month):
+    """
+    Close a month.
+
+    Returns:
+        AccountingPeriod
+
+    Raises:
+        ValueError: If the month has not ended, is already closed, or the
+            month before it is still open
+    """
+    from .services import account_totals_cents, record_transaction
+
+    start, end = month_bounds(year, month)
+    if end >= date.today():
+        raise ValueError(f'{start:%Y-%m} has not ended yet')
+
+    with transaction.atomic():
+        # Lock the latest period so two closes cannot interleave
+        last = AccountingPeriod.objects.select_for_update().order_by('-end').first()
+        if last is not None and start <= last.end:
+            raise ValueError(f'{start:%Y-%m} is already closed')
+        if last is not None and start != last.end + timedelta(days=1):
+            raise ValueError(f'Close {last.end + timedelta(days=1):%Y-%m} first')
+
+        # The first close rolls everything before it as well
+        activity = account_totals_cents(
+            date_from=start if last is not None else None,
+            date_to=end,
+            closing_entries=False
+        )
+        closing_entry = _post_closing_journal(start, end, activity, record_transaction)
+
+        # Cumulative totals through month end, including the closing journal
+        cumulative = account_totals_cents(date_to=end)
+        period = AccountingPeriod.objects.create(start=start, end=end, closing_entry=closing_entry)
+        BalanceCheckpoint.objects.bulk_create([
+            BalanceCheckpoint(
+                period=period,
+                account_id=account_id,
+                as_of_date=end,
+                debit_total=from_cents(debits),
+                credit_total=from_cents(credits)
+            )
+            for account_id, (debits, credits) in cumulative.items()
+        ], batch_size=1000)
+    return period
+
+
+def _post_closing_journal(start, end, activity, record_transaction):
+    accounts = Account.objects.filter(id__in=activity, account_type__in=['Revenue', 'Expense'])
+    entries = []
+    net_income = 0
+    for account in accounts.order_by('account_number'):
+        debits, credits = activity[account.id]
+        if debits == credits:
+            continue
+        # Post the opposite side of the period balance to bring it to zero
+        entries.append({
+            'account_id': account.id,
+            'debit': from_cents(max(credits - debits, 0)),
+            'credit': from_cents(max(debits - credits, 0)),
+            'description': 'Closed to retained earnings'
+        })
+        net_income += credits - debits
+    if not entries:
+        return None
+
+    if net_income:
+        retained_earnings = Account.objects.get(account_number=RETAINED_EARNINGS_ACCOUNT)
+        entries.append({
+            'account_id': retained_earnings.id,
+            'debit': from_cents(max(-net_income, 0)),
+            'credit': from_cents(max(net_income, 0)),
+            'description': 'Net income' if net_income > 0 else 'Net loss'
+        })
+    return record_transaction(
+        date=end,
+        description=f'Close {start:%B %Y}',
+        reference_type=CLOSING_REFERENCE_TYPE,
+        reference_id=f'{start:%Y-%m}',
+        entries=entries
+    )
+
+
+def reopen_latest_period():
+    """
+    Reopen the most recently closed month.
+
+    Deletes its checkpoints and closing journal and recomputes the balances
+    of the accounts that journal touched.
+
+    Returns:
+        The deleted AccountingPeriod (unsaved)
+
+    Raises:
+        ValueError: If no period is closed, or the latest one is archived
+    """
+    from .feed import record_journal_events
+    from .services import update_account_balance
+
+    with transaction.atomic():
+        period = AccountingPeriod.objects.select_for_update().order_by('-end').first()
+        if period is None:
+            raise ValueError('No closed period to reopen')
+        if period.archived_at is not None:
+            raise ValueError(f'{period} is archived; its journals are no longer in the database')
+        closing_entry = period.closing_entry
+        period.delete()
+
+        if closing_entry is not None:
+            account_ids = set(closing_entry.ledger_entries.values_list('account_id', flat=True))
+            record_journal_events([(closing_entry, None)], 'journal.unposted')
+            JournalEntry.objects.filter(pk=closing_entry.pk).delete()
+            for account in Account.objects.filter(id__in=account_ids).order_by('id'):
+                update_account_balance(account)
+    return period
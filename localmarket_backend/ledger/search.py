@@ -0,0 +1,122 @@
+"""
+Full-text search over journals and ledger lines
+
+On SQLite, migration 0018 creates two FTS5 indexes: ledger_journal_fts over
+journal descriptions and references, and ledger_line_fts over line
+descriptions and vendor IDs. Triggers keep them in step with every write,
+so a search is an index lookup instead of a LIKE '%...%' scan.
+
+Every word of the search text must match, as a prefix: "order pay 12"
+finds "Order payment for order 123". The words must all match one
+document, the journal's own text or one of its lines: a journal matches if
+either does, and a line matches on its own text or its journal's.
+
+On other databases the same search falls back to icontains filters, with
+the words grouped the same way. Those match anywhere in a word, not only
+at its start, so "ment" finds "payment" there but not with FTS5.
+"""
+import re
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+from .models import LedgerEntry
+
+WORD_PATTERN = re.compile(r'\w+')
+MAX_SEARCH_TERMS = 16
+
+JOURNAL_MATCH_SQL = (
+    'SELECT rowid FROM ledger_journal_fts WHERE ledger_journal_fts MATCH %s '
+    'UNION '
+    'SELECT journal_entry_id FROM ledger_ledgerentry '
+    'WHERE id IN (SELECT rowid FROM ledger_line_fts WHERE ledger_line_fts MATCH %s)'
+)
+LINE_MATCH_SQL = 'SELECT rowid FROM ledger_line_fts WHERE ledger_line_fts MATCH %s'
+JOURNAL_ONLY_MATCH_SQL = 'SELECT rowid FROM ledger_journal_fts WHERE ledger_journal_fts MATCH %s'
+
+# Columns of each index, for the icontains fallback
+JOURNAL_SEARCH_FIELDS = ('description', 'reference_type', 'reference_id')
+LINE_SEARCH_FIELDS = ('description', 'vendor_id')
+
+
+def search_terms(text):
+    """Words of a search text, lowercased (at most MAX_SEARCH_TERMS)."""
+    return [word.lower() for word in WORD_PATTERN.findall(text or '')][:MAX_SEARCH_TERMS]
+
+
+def match_expression(terms):
+    """
+    FTS5 query for terms: every term as a quoted prefix, ANDed.
+
+    Quoting keeps user input from being read as FTS5 syntax (AND, NEAR, *).
+    """
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def uses_fts():
+    return connection.vendor == 'sqlite'
+
+
+def contains_all(terms, fields, prefix=''):
+    """Q requiring every term in at least one of the fields (the fallback for one FTS5 index)."""
+    query = Q()
+    for term in terms:
+        query &= reduce(or_, (Q(**{f'{prefix}{field}__icontains': term}) for field in fields))
+    return query
+
+
+def search_journals(queryset, text):
+    """
+    Filter a JournalEntry queryset to journals matching a search text.
+
+    Returns:
+        The filtered queryset (unchanged if the text has no words)
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    if uses_fts():
+        expression = match_expression(terms)
+        return queryset.filter(entry_number__in=RawSQL(JOURNAL_MATCH_SQL, [expression, expression]))
+
+    # A subquery rather than a join, so journals with several matching lines appear once
+    lines = LedgerEntry.objects.filter(contains_all(terms, LINE_SEARCH_FIELDS))
+    return queryset.filter(
+        contains_all(terms, JOURNAL_SEARCH_FIELDS)
+        | Q(entry_number__in=lines.values('journal_entry_id'))
+    )
+
+
+def search_lines(queryset, text):
+    """
+    Filter a LedgerEntry queryset to lines matching a search text.
+
+    A line matches on its own description or vendor ID, or on its
+    journal's description and references.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    if uses_fts():
+        expression = match_expression(terms)
+        return queryset.filter(
+            Q(id__in=RawSQL(LINE_MATCH_SQL, [expression]))
+            | Q(journal_entry_id__in=RawSQL(JOURNAL_ONLY_MATCH_SQL, [expression]))
+        )
+
+    return queryset.filter(
+        contains_all(terms, LINE_SEARCH_FIELDS)
+        | contains_all(terms, JOURNAL_SEARCH_FIELDS, prefix='journal_entry__')
+    )
+
+
+def rebuild_search_index():
+    """Re-index every journal and line (after restoring a database, for example)."""
+    if not uses_fts():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute("INSERT INTO ledger_journal_fts (ledger_journal_fts) VALUES ('rebuild')")
+        cursor.execute("INSERT INTO ledger_line_fts (ledger_line_fts) VALUES ('rebuild')")
@@ -1,5 +1,8 @@
+from decimal import Decimal
+
 from rest_framework import serializers
-from .models import Account, JournalEntry, LedgerEntry, AccountBalance
+from .models import Account, JournalEntry, LedgerEntry, AccountBalance, Product, StockLevel
+from .validation import JournalValidationError, validate_journal
 
 
 class AccountSerializer(serializers.ModelSerializer):
@@ -7,8 +10,9 @@ class AccountSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Account
-        fields = ['id', 'account_number', 'account_name', 'account_type', 'normal_balance', 'is_active', 'balance']
-        read_only_fields = ['id']
+        fields = ['id', 'account_number', 'account_name', 'account_type', 'normal_balance', 'is_active', 'parent',
+                  'path', 'depth', 'balance']
+        read_only_fields = ['id', 'path', 'depth']
     
     def validate_account_number(self, value):
         """Ensure account number is unique when creating"""
@@ -17,7 +21,22 @@ class AccountSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError("An account with this account number already exists.")
         return value
     
+    def validate(self, data):
+        # Parent checks live on the model (no cycles, same account type)
+        from django.core.exceptions import ValidationError as DjangoValidationError
+        account = Account(pk=self.instance.pk if self.instance else None)
+        account.parent_id = (data['parent'].pk if data['parent'] else None) if 'parent' in data else getattr(self.instance, 'parent_id', None)
+        account.account_type = data.get('account_type', getattr(self.instance, 'account_type', None))
+        try:
+            account.clean()
+        except DjangoValidationError as e:
+            raise serializers.ValidationError(e.message_dict)
+        return data
+    
     def get_balance(self, obj):
+        if obj.counter_slots:
+            from .services import get_account_balance
+            return float(get_account_balance(obj))  # Includes the unfolded slots
         try:
             if hasattr(obj, 'balance') and obj.balance:
                 return float(obj.balance.net_balance)
@@ -29,10 +48,14 @@ class AccountSerializer(serializers.ModelSerializer):
 class LedgerEntrySerializer(serializers.ModelSerializer):
     account_name = serializers.CharField(source='account.account_name', read_only=True)
     account_number = serializers.CharField(source='account.account_number', read_only=True)
+    # Stored as integer cents; exposed as 2-place decimals
+    debit = serializers.DecimalField(max_digits=18, decimal_places=2, required=False)
+    credit = serializers.DecimalField(max_digits=18, decimal_places=2, required=False)
     
     class Meta:
         model = LedgerEntry
-        fields = ['id', 'account', 'account_name', 'account_number', 'debit', 'credit', 'description']
+        fields = ['id', 'account', 'account_name', 'account_number', 'debit', 'credit', 'description',
+                  'vendor_id', 'market', 'event', 'category']
         read_only_fields = ['id']
 
 
@@ -40,12 +63,15 @@ class JournalEntrySerializer(serializers.ModelSerializer):
     ledger_entries = LedgerEntrySerializer(many=True, read_only=True)
     total_debits = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
     total_credits = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+    amount = serializers.DecimalField(max_digits=18, decimal_places=2, read_only=True)
+    refunded_amount = serializers.DecimalField(max_digits=18, decimal_places=2, read_only=True)
     
     class Meta:
         model = JournalEntry
         fields = ['entry_number', 'date', 'description', 'reference_type', 'reference_id', 'status', 
-                  'created_at', 'updated_at', 'ledger_entries', 'total_debits', 'total_credits']
-        read_only_fields = ['entry_number', 'created_at', 'updated_at']
+                  'created_at', 'updated_at', 'ledger_entries', 'total_debits', 'total_credits',
+                  'amount', 'reverses', 'refunded_amount']
+        read_only_fields = ['entry_number', 'created_at', 'updated_at', 'reverses']
 
 
 class TransactionCreateSerializer(serializers.Serializer):
@@ -66,24 +92,57 @@ class TransactionCreateSerializer(serializers.Serializer):
         return value
     
     def validate(self, data):
-        entries = data['entries']
-        total_debits = sum(float(e.get('debit', 0)) for e in entries)
-        total_credits = sum(float(e.get('credit', 0)) for e in entries)
-        
-        if abs(total_debits - total_credits) > 0.01:  # Allow small rounding differences
-            raise serializers.ValidationError(
-                f"Debits ({total_debits}) must equal credits ({total_credits})"
-            )
+        # Single validation pass: accounts (one query), amounts and balance in exact cents
+        try:
+            data['journal'] = validate_journal(data['entries'])
+        except JournalValidationError as e:
+            raise serializers.ValidationError(self._error_detail(e.errors))
         
         return data
+    
+    @staticmethod
+    def _error_detail(errors):
+        """Map pipeline errors to DRF's {'entries': {line: {field: [...]}}} shape."""
+        detail = {}
+        for error in errors:
+            if error['line'] is None:
+                detail.setdefault('non_field_errors', []).append(error['message'])
+                continue
+            line = detail.setdefault('entries', {}).setdefault(error['line'], {})
+            line.setdefault(error['field'] or 'non_field_errors', []).append(error['message'])
+        return detail
 
 
 class AccountBalanceSerializer(serializers.ModelSerializer):
     account_name = serializers.CharField(source='account.account_name', read_only=True)
     account_number = serializers.CharField(source='account.account_number', read_only=True)
+    debit_total = serializers.DecimalField(max_digits=18, decimal_places=2, read_only=True)
+    credit_total = serializers.DecimalField(max_digits=18, decimal_places=2, read_only=True)
+    net_balance = serializers.DecimalField(max_digits=18, decimal_places=2, read_only=True)
     
     class Meta:
         model = AccountBalance
         fields = ['account', 'account_name', 'account_number', 'balance_as_of_date', 
                   'debit_total', 'credit_total', 'net_balance', 'last_updated']
 
+
+class ProductSerializer(serializers.ModelSerializer):
+    # Stored as integer cents; exposed as 2-place decimals
+    price = serializers.DecimalField(max_digits=18, decimal_places=2, min_value=Decimal('0.00'))
+    
+    class Meta:
+        model = Product
+        fields = ['id', 'slug', 'name', 'vendor_id', 'category', 'image', 'price', 'is_active', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class StockLevelSerializer(serializers.ModelSerializer):
+    product = serializers.CharField(source='product.slug', read_only=True)
+    average_cost = serializers.DecimalField(max_digits=15, decimal_places=2, read_only=True)
+    inventory_value = serializers.DecimalField(max_digits=18, decimal_places=2, read_only=True)
+    cogs_total = serializers.DecimalField(max_digits=18, decimal_places=2, read_only=True)
+    
+    class Meta:
+        model = StockLevel
+        fields = ['product', 'quantity_on_hand', 'inventory_value', 'average_cost',
+                  'quantity_sold', 'cogs_total', 'last_updated']
@@ -1,14 +1,89 @@
 """
 Ledger business logic services
 """
+import functools
+import random
+import time
 from decimal import Decimal
-from datetime import date
-from django.db import transaction
+from datetime import date, timedelta
+from django.core.cache import cache
+from django.db import OperationalError, transaction
+from django.db.models import F
+from django.db.models.functions import TruncMonth, TruncYear
 from django.utils import timezone
-from .models import Account, JournalEntry, LedgerEntry, AccountBalance
+from .models import (
+    Account, JournalEntry, LedgerEntry, AccountBalance, AccountBalanceSlot, AccountingPeriod,
+    BalanceCheckpoint, VendorBalance, Product, StockMovement, StockLevel, LedgerEvent
+)
+from . import archive, balance_index
+from .feed import record_journal_events
+from .periods import CLOSING_REFERENCE_TYPE, closed_date_errors
+from .money import to_cents, from_cents, cents_to_float, SumCents
+from .validation import (
+    JournalValidationError, ValidatedJournal, journal_header_errors, validate_journal, validate_journals
+)
 
+PRODUCT_CACHE_TIMEOUT = 60 * 15
 
-def record_transaction(date, description, reference_type, reference_id, entries):
+# Stock postings: Inventory is valued by the stock sub-ledger, and Cost of
+# Goods Sold is the cost of the stock movements (not the vendor's share)
+INVENTORY_ACCOUNT = '1300'
+COGS_ACCOUNT = '5200'
+VENDOR_SHARE_ACCOUNT = '5300'
+
+
+# Concurrent posting
+#
+# Postings lock rows in one global order: StockLevel rows by product id,
+# then balance rows (AccountBalance or a balance slot) by account id, then
+# VendorBalance rows by (vendor, account). Two postings therefore never wait on
+# each other in a cycle. Balances are updated with relative UPDATEs
+# (total = total + delta), so concurrent postings never overwrite each
+# other's totals. A posting that still loses a lock conflict (SQLite "database is
+# locked", a PostgreSQL serialization failure) is retried from the start.
+
+POSTING_MAX_RETRIES = 5
+POSTING_RETRY_DELAY = 0.05  # Seconds, doubled per attempt, with jitter
+
+# SQLSTATEs for serialization failure and deadlock, MySQL deadlock / lock wait timeout
+_CONFLICT_SQLSTATES = ('40001', '40P01')
+_CONFLICT_MYSQL_ERRORS = (1213, 1205)
+
+
+def _is_lock_conflict(error):
+    cause = error.__cause__
+    if (getattr(cause, 'pgcode', None) or getattr(cause, 'sqlstate', None)) in _CONFLICT_SQLSTATES:
+        return True
+    if cause is not None and cause.args and cause.args[0] in _CONFLICT_MYSQL_ERRORS:
+        return True
+    return 'database is locked' in str(error) or 'database table is locked' in str(error)
+
+
+def retry_on_conflict(func):
+    """
+    Re-run a posting function that failed on a lock conflict.
+    
+    Only the outermost transaction can be retried: inside an enclosing
+    atomic() block the error is raised for the caller's retry to handle.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if (attempt >= POSTING_MAX_RETRIES or not _is_lock_conflict(e)
+                        or transaction.get_connection().in_atomic_block):
+                    raise
+                attempt += 1
+                time.sleep(random.uniform(0.5, 1.0) * POSTING_RETRY_DELAY * 2 ** attempt)
+    return wrapper
+
+
+@retry_on_conflict
+def record_transaction(date, description, reference_type, reference_id, entries, reverses=None,
+                       amount=None):
     """
     Main function to record any transaction.
     
@@ -17,52 +92,131 @@ def record_transaction(date, description, reference_type, reference_id, entries)
         description: Transaction description
         reference_type: External system identifier (e.g., "order", "payment", "subscription")
         reference_id: External system's ID (string)
-        entries: List of dicts with {account_id, debit, credit, description}
+        entries: List of dicts with {account_id, debit, credit, description} and
+            optional dimension tags (vendor_id, market, event, category), or a
+            ValidatedJournal that has already been through validate_journal()
+        reverses: Optional JournalEntry this transaction (partially) reverses
+        amount: Gross amount of the transaction, which refunds are measured
+            against (default: total debits)
     
     Returns:
         JournalEntry instance
     
     Raises:
-        ValueError: If debits don't equal credits or validation fails
+        JournalValidationError (a ValueError): If debits don't equal credits, validation
+            fails (including text longer than its column) or the date is in a
+            closed period
     """
-    # Validate entries
-    total_debits = sum(Decimal(str(e.get('debit', 0))) for e in entries)
-    total_credits = sum(Decimal(str(e.get('credit', 0))) for e in entries)
-    
-    if total_debits != total_credits:
-        raise ValueError(f"Debits ({total_debits}) must equal credits ({total_credits})")
-    
-    if not entries or len(entries) < 2:
-        raise ValueError("A transaction must have at least two entries")
+    header_errors = journal_header_errors(description, reference_type, reference_id)
+    if header_errors:
+        raise JournalValidationError(header_errors)
+    journal = entries if isinstance(entries, ValidatedJournal) else validate_journal(entries)
     
     with transaction.atomic():
+        date_error = closed_date_errors([date])[0]
+        if date_error:
+            raise JournalValidationError([date_error])
+        
         # Create journal entry
         journal_entry = JournalEntry.objects.create(
             date=date,
             description=description,
             reference_type=reference_type,
             reference_id=str(reference_id),
-            status='posted'
+            status='posted',
+            amount=from_cents(journal.total_cents) if amount is None else amount,
+            reverses=reverses
         )
         
-        # Create ledger entries
-        for entry in entries:
-            account = Account.objects.get(id=entry['account_id'])
-            LedgerEntry.objects.create(
-                journal_entry=journal_entry,
-                account=account,
-                debit=Decimal(str(entry.get('debit', 0))),
-                credit=Decimal(str(entry.get('credit', 0))),
-                description=entry.get('description', '')
-            )
+        # Lines are already validated; bulk insert skips per-row full_clean()
+        LedgerEntry.objects.bulk_create(_ledger_entries(journal_entry, journal))
         
         # Update account balances
-        for entry in entries:
-            update_account_balance(Account.objects.get(id=entry['account_id']))
+        apply_account_balances([journal])
+        apply_vendor_balances([journal])
+        record_journal_events([(journal_entry, journal)])
     
     return journal_entry
 
 
+@retry_on_conflict
+def record_transactions(transactions):
+    """
+    Record a batch of transactions atomically.
+    
+    All journals are validated first with one account query; nothing is
+    posted if any of them is invalid.
+    
+    Args:
+        transactions: List of dicts with {date, description, reference_type,
+            reference_id, entries}
+    
+    Returns:
+        List of JournalEntry instances, in input order
+    
+    Raises:
+        JournalValidationError: With each error's 'journal' index set
+    """
+    validated, errors = validate_journals([t['entries'] for t in transactions])
+    for index, t in enumerate(transactions):
+        header_errors = journal_header_errors(t['description'], t['reference_type'], t['reference_id'])
+        if header_errors:
+            errors[index] = header_errors + errors[index]
+    batch_errors = [
+        dict(error, journal=index)
+        for index, journal_errors in enumerate(errors)
+        for error in journal_errors
+    ]
+    if batch_errors:
+        raise JournalValidationError(batch_errors)
+    
+    with transaction.atomic():
+        date_errors = [
+            dict(error, journal=index)
+            for index, error in enumerate(closed_date_errors([t['date'] for t in transactions]))
+            if error
+        ]
+        if date_errors:
+            raise JournalValidationError(date_errors)
+        
+        journal_entries = JournalEntry.objects.bulk_create([
+            JournalEntry(
+                date=t['date'],
+                description=t['description'],
+                reference_type=t['reference_type'],
+                reference_id=str(t['reference_id']),
+                status='posted',
+                amount=from_cents(journal.total_cents)
+            )
+            for t, journal in zip(transactions, validated)
+        ])
+        
+        lines = []
+        for journal_entry, journal in zip(journal_entries, validated):
+            lines.extend(_ledger_entries(journal_entry, journal))
+        LedgerEntry.objects.bulk_create(lines, batch_size=1000)
+        
+        apply_account_balances(validated)
+        apply_vendor_balances(validated)
+        record_journal_events(list(zip(journal_entries, validated)))
+    
+    return journal_entries
+
+
+def _ledger_entries(journal_entry, journal):
+    return [
+        LedgerEntry(
+            journal_entry=journal_entry,
+            account=line.account,
+            debit=from_cents(line.debit),
+            credit=from_cents(line.credit),
+            description=line.description,
+            **line.tags
+        )
+        for line in journal.lines
+    ]
+
+
 def get_account_balance(account, as_of_date=None):
     """
     Get account balance.
@@ -77,13 +231,21 @@ def get_account_balance(account, as_of_date=None):
     if as_of_date is None:
         as_of_date = date.today()
     
-    # Get cached balance if available and up to date
-    try:
-        cached_balance = AccountBalance.objects.get(account=account)
-        if cached_balance.balance_as_of_date >= as_of_date:
-            return cached_balance.net_balance
-    except AccountBalance.DoesNotExist:
-        pass
+    # Sharded counters are always current; the AccountBalance row alone is
+    # only part of the balance
+    if account.counter_slots:
+        if as_of_date < date.today():
+            return calculate_account_balance(account, as_of_date)
+        debits, credits = sharded_balance_cents(account)
+        return from_cents(signed_balance_cents(account.account_type, debits, credits))
+    
+    # The cached balance includes every posting so far, so it only answers
+    # for today (or later); earlier dates start from a period checkpoint
+    if as_of_date >= date.today():
+        try:
+            return AccountBalance.objects.get(account=account).net_balance
+        except AccountBalance.DoesNotExist:
+            pass
     
     # Calculate balance
     return calculate_account_balance(account, as_of_date)
@@ -103,51 +265,392 @@ def calculate_account_balance(account, as_of_date=None):
     if as_of_date is None:
         as_of_date = date.today()
     
-    ledger_entries = LedgerEntry.objects.filter(
+    index = balance_index.get_index()
+    if index is not None:
+        debits, credits = index.totals_cents(account.id, as_of_date)
+        return from_cents(signed_balance_cents(account.account_type, debits, credits))
+    
+    # Start from the account's latest checkpoint and add the lines since
+    checkpoint = BalanceCheckpoint.objects.filter(
+        account=account,
+        as_of_date__lte=as_of_date
+    ).order_by('-as_of_date').first()
+    entries = LedgerEntry.objects.filter(
         account=account,
         journal_entry__date__lte=as_of_date,
         journal_entry__status='posted'
     )
+    if checkpoint is not None:
+        entries = entries.filter(journal_entry__date__gt=checkpoint.as_of_date)
+    totals = entries.aggregate(debits=SumCents('debit'), credits=SumCents('credit'))
     
-    total_debits = sum(entry.debit for entry in ledger_entries)
-    total_credits = sum(entry.credit for entry in ledger_entries)
+    debits, credits = totals['debits'], totals['credits']
+    if checkpoint is not None:
+        debits += to_cents(checkpoint.debit_total)
+        credits += to_cents(checkpoint.credit_total)
+    # A date inside an archived month: its lines since the checkpoint are on disk
+    archived = archive.archived_totals_cents(
+        checkpoint.as_of_date + timedelta(days=1) if checkpoint is not None else None,
+        as_of_date,
+        account_ids=[account.id]
+    )
+    archived_debits, archived_credits = archived.get(account.id, (0, 0))
+    debits += archived_debits
+    credits += archived_credits
+    return from_cents(signed_balance_cents(account.account_type, debits, credits))
+
+
+def signed_balance_cents(account_type, debit_cents, credit_cents):
+    """
+    Balance in cents with the sign convention of the account type.
+    
+    For asset and expense accounts, debit balance is positive.
+    For liability, equity, and revenue accounts, credit balance is positive.
+    """
+    if account_type in ['Asset', 'Expense']:
+        return debit_cents - credit_cents
+    return credit_cents - debit_cents  # Liability, Equity, Revenue
+
+
+def account_totals_cents(date_from=None, date_to=None, account_type=None, dimensions=None,
+                         closing_entries=True):
+    """
+    Posted debit/credit totals per account in integer cents.
+    
+    Without dimension filters the totals come from the in-process balance
+    index when it is enabled (see balance_index.py). Otherwise they start
+    from the nearest period checkpoint (see periods.py), so only ledger
+    lines after it are read: totals to date_to, less totals to the day
+    before date_from.
+    
+    Args:
+        dimensions: Optional {dimension: value} filter on line tags,
+            e.g. {'event': 'summer-music-festival'}
+        closing_entries: Include period closing journals (False for
+            activity reports such as the P&L)
+    
+    Returns:
+        Dict of account_id -> (debit_cents, credit_cents)
+    """
+    if dimensions:
+        # Checkpoints are per account only; closing journals carry no tags
+        return _line_totals_cents(date_from, date_to, account_type, dimensions)
     
-    # For asset and expense accounts, debit balance is positive
-    # For liability, equity, and revenue accounts, credit balance is positive
-    if account.account_type in ['Asset', 'Expense']:
-        balance = total_debits - total_credits
-    else:  # Liability, Equity, Revenue
-        balance = total_credits - total_debits
+    index = balance_index.get_index()
+    if index is not None:
+        totals = index.range_totals_cents(date_from, date_to, account_type)
+    else:
+        totals = _cumulative_totals_cents(date_to, account_type)
+        if date_from is not None:
+            before = _cumulative_totals_cents(date_from - timedelta(days=1), account_type)
+            totals = _add_totals(totals, before, sign=-1)
     
-    return balance
+    if not closing_entries:
+        periods = AccountingPeriod.objects.filter(closing_entry__isnull=False)
+        if date_from is not None:
+            periods = periods.filter(end__gte=date_from)
+        if date_to is not None:
+            periods = periods.filter(end__lte=date_to)
+        closing_ids = list(periods.values_list('closing_entry_id', flat=True))
+        if closing_ids:
+            closing = LedgerEntry.objects.filter(journal_entry_id__in=closing_ids)
+            if account_type is not None:
+                closing = closing.filter(account__account_type=account_type)
+            rows = closing.values('account_id').annotate(
+                debits=SumCents('debit'),
+                credits=SumCents('credit')
+            ).order_by()
+            closing_totals = {row['account_id']: (row['debits'], row['credits']) for row in rows}
+            totals = _add_totals(totals, closing_totals, sign=-1)
+    return totals
+
+
+def _line_totals_cents(date_from=None, date_to=None, account_type=None, dimensions=None):
+    """Totals per account from the ledger lines (and archived lines in the range)."""
+    entries = LedgerEntry.objects.filter(journal_entry__status='posted', **(dimensions or {}))
+    if date_from is not None:
+        entries = entries.filter(journal_entry__date__gte=date_from)
+    if date_to is not None:
+        entries = entries.filter(journal_entry__date__lte=date_to)
+    if account_type is not None:
+        entries = entries.filter(account__account_type=account_type)
+    
+    rows = entries.values('account_id').annotate(
+        debits=SumCents('debit'),
+        credits=SumCents('credit')
+    ).order_by()
+    totals = {row['account_id']: (row['debits'], row['credits']) for row in rows}
+    return _add_totals(totals, archive.archived_totals_cents(date_from, date_to, account_type, dimensions))
+
+
+def _cumulative_totals_cents(as_of_date=None, account_type=None):
+    """Totals through as_of_date: the nearest checkpoint plus the lines after it."""
+    periods = AccountingPeriod.objects.all()
+    if as_of_date is not None:
+        periods = periods.filter(end__lte=as_of_date)
+    period = periods.order_by('-end').first()
+    if period is None:
+        return _line_totals_cents(date_to=as_of_date, account_type=account_type)
+    
+    checkpoints = BalanceCheckpoint.objects.filter(period=period)
+    if account_type is not None:
+        checkpoints = checkpoints.filter(account__account_type=account_type)
+    totals = {
+        account_id: (to_cents(debits), to_cents(credits))
+        for account_id, debits, credits in checkpoints.values_list('account_id', 'debit_total', 'credit_total')
+    }
+    since = _line_totals_cents(period.end + timedelta(days=1), as_of_date, account_type)
+    return _add_totals(totals, since)
+
+
+def _add_totals(totals, other, sign=1):
+    """totals + sign * other per account, dropping accounts that come to zero."""
+    result = dict(totals)
+    for account_id, (debits, credits) in other.items():
+        base_debits, base_credits = result.get(account_id, (0, 0))
+        result[account_id] = (base_debits + sign * debits, base_credits + sign * credits)
+    return {account_id: pair for account_id, pair in result.items() if pair != (0, 0)}
+
+
+def rollup_totals_cents(totals, accounts=None):
+    """
+    Add each account's totals to every account above it in the hierarchy.
+
+    The ancestors come from the accounts' materialized paths, so the rollup
+    is one pass over the accounts whatever the depth of the tree.
+
+    Args:
+        totals: {account_id: (debit_cents, credit_cents)}, e.g. from
+            account_totals_cents()
+        accounts: Optional iterable of Account (default: all accounts)
+
+    Returns:
+        {account_id: (debit_cents, credit_cents)} of each account's own
+        postings plus those of all its descendants
+    """
+    if accounts is None:
+        accounts = Account.objects.only('id', 'path')
+    rolled = {}
+    for account in accounts:
+        pair = totals.get(account.id)
+        if not pair:
+            continue
+        for ancestor_id in account.ancestor_ids():
+            debits, credits = rolled.get(ancestor_id, (0, 0))
+            rolled[ancestor_id] = (debits + pair[0], credits + pair[1])
+    return rolled
+
+
+def get_account_tree(date_from=None, date_to=None, account_type=None, dimensions=None, closing_entries=True):
+    """
+    Accounts in hierarchy order, each with its own totals and its subtotal.
+
+    One account query and one totals query (account_totals_cents), however
+    deep the tree.
+
+    Returns:
+        List of dicts in depth-first order (children by account number)
+        with account_number, account_name, account_type, parent (account
+        number or None), depth, debit/credit cents of the account itself,
+        and subtotal debit/credit cents including all descendants. Accounts
+        with nothing posted in their subtree are left out.
+    """
+    accounts = Account.objects.filter(is_active=True).select_related('parent')
+    if account_type is not None:
+        accounts = accounts.filter(account_type=account_type)
+    accounts = list(accounts)
+    totals = account_totals_cents(
+        date_from=date_from, date_to=date_to, account_type=account_type, dimensions=dimensions,
+        closing_entries=closing_entries
+    )
+    rolled = rollup_totals_cents(totals, accounts)
+
+    # Depth-first: sort by the account numbers along each path
+    numbers = {account.id: account.account_number for account in accounts}
+    def sort_key(account):
+        return [numbers.get(ancestor_id, '') for ancestor_id in account.ancestor_ids()]
+
+    tree = []
+    for account in sorted(accounts, key=sort_key):
+        subtotal = rolled.get(account.id, (0, 0))
+        if subtotal == (0, 0):
+            continue
+        own = totals.get(account.id, (0, 0))
+        tree.append({
+            'account_number': account.account_number,
+            'account_name': account.account_name,
+            'account_type': account.account_type,
+            'parent': account.parent.account_number if account.parent else None,
+            'depth': account.depth,
+            'debits': own[0],
+            'credits': own[1],
+            'subtotal_debits': subtotal[0],
+            'subtotal_credits': subtotal[1],
+        })
+    return tree
 
 
 def update_account_balance(account):
     """
-    Update cached balance for an account.
+    Recompute the cached balance for an account from its latest checkpoint
+    and the ledger lines after it.
+    
+    For a sharded account this also resets its slots, so the recomputed
+    AccountBalance row holds the whole balance.
     
     Args:
         account: Account instance
     """
-    balance = calculate_account_balance(account)
-    ledger_entries = LedgerEntry.objects.filter(
-        account=account,
-        journal_entry__status='posted'
-    )
+    with transaction.atomic():
+        # Lock the balance row and slots before reading the ledger: postings
+        # in flight commit first, later ones add on top of the recompute
+        AccountBalance.objects.get_or_create(
+            account=account,
+            defaults={'balance_as_of_date': date.today(), 'net_balance': Decimal('0.00')}
+        )
+        balance = AccountBalance.objects.select_for_update().get(account=account)
+        slot_ids = list(
+            AccountBalanceSlot.objects.select_for_update().filter(account=account)
+            .order_by('slot').values_list('id', flat=True)
+        )
+        # Archived lines are only in the checkpoints
+        checkpoint = BalanceCheckpoint.objects.filter(account=account).order_by('-as_of_date').first()
+        entries = LedgerEntry.objects.filter(account=account, journal_entry__status='posted')
+        if checkpoint is not None:
+            entries = entries.filter(journal_entry__date__gt=checkpoint.as_of_date)
+        totals = entries.aggregate(debits=SumCents('debit'), credits=SumCents('credit'))
+        debits, credits = totals['debits'], totals['credits']
+        if checkpoint is not None:
+            debits += to_cents(checkpoint.debit_total)
+            credits += to_cents(checkpoint.credit_total)
+        
+        balance.balance_as_of_date = date.today()
+        balance.debit_total = from_cents(debits)
+        balance.credit_total = from_cents(credits)
+        balance.net_balance = from_cents(signed_balance_cents(account.account_type, debits, credits))
+        balance.save()
+        if slot_ids:
+            AccountBalanceSlot.objects.filter(id__in=slot_ids).update(
+                debit_total=Decimal('0.00'),
+                credit_total=Decimal('0.00')
+            )
+
+
+def apply_account_balances(journals):
+    """
+    Add newly posted journals to the account balances.
     
-    total_debits = sum(entry.debit for entry in ledger_entries)
-    total_credits = sum(entry.credit for entry in ledger_entries)
+    Incremental: one relative UPDATE per account, in account id order.
+    Accounts with counter_slots add their totals to one random slot, so
+    concurrent postings to a hot account rarely wait on the same row. Must
+    run in the same database transaction as the posting.
     
-    AccountBalance.objects.update_or_create(
-        account=account,
-        defaults={
-            'balance_as_of_date': date.today(),
-            'debit_total': total_debits,
-            'credit_total': total_credits,
-            'net_balance': balance,
-            'last_updated': timezone.now()
-        }
+    Args:
+        journals: Iterable of ValidatedJournal
+    """
+    deltas = {}
+    for journal in journals:
+        for line in journal.lines:
+            account, debits, credits = deltas.get(line.account.id, (line.account, 0, 0))
+            deltas[line.account.id] = (account, debits + line.debit, credits + line.credit)
+    
+    for account_id in sorted(deltas):
+        account, debits, credits = deltas[account_id]
+        if account.counter_slots:
+            _add_to_balance_slot(account, debits, credits)
+        else:
+            _add_to_account_balance(account, debits, credits)
+
+
+def _add_to_account_balance(account, debit_cents, credit_cents):
+    updated = AccountBalance.objects.filter(account=account).update(
+        debit_total=F('debit_total') + debit_cents,
+        credit_total=F('credit_total') + credit_cents,
+        net_balance=F('net_balance') + signed_balance_cents(account.account_type, debit_cents, credit_cents),
+        balance_as_of_date=date.today(),
+        last_updated=timezone.now()
     )
+    if not updated:
+        # First posting to the account: build the row from the ledger,
+        # which already includes this posting's lines
+        update_account_balance(account)
+
+
+def _add_to_balance_slot(account, debit_cents, credit_cents):
+    slot = random.randrange(account.counter_slots)
+    changes = {
+        'debit_total': F('debit_total') + debit_cents,
+        'credit_total': F('credit_total') + credit_cents,
+        'last_updated': timezone.now()
+    }
+    if not AccountBalanceSlot.objects.filter(account=account, slot=slot).update(**changes):
+        AccountBalanceSlot.objects.get_or_create(account=account, slot=slot)
+        AccountBalanceSlot.objects.filter(account=account, slot=slot).update(**changes)
+
+
+def sharded_balance_cents(account):
+    """
+    Current (debit_cents, credit_cents) of a sharded account: its
+    AccountBalance row plus every slot, in one query.
+    """
+    slots = AccountBalanceSlot.objects.filter(account=account).aggregate(
+        debits=SumCents('debit_total'),
+        credits=SumCents('credit_total')
+    )
+    base = AccountBalance.objects.filter(account=account).values_list('debit_total', 'credit_total').first()
+    base_debits, base_credits = (to_cents(base[0]), to_cents(base[1])) if base else (0, 0)
+    return base_debits + slots['debits'], base_credits + slots['credits']
+
+
+def compact_balance_slots(account):
+    """
+    Fold an account's slots into its AccountBalance row.
+    
+    Subtracts exactly what was folded from each slot, so postings that land
+    during compaction are kept for the next run.
+    
+    Returns:
+        Number of slots folded
+    """
+    if not AccountBalanceSlot.objects.filter(account=account).exclude(debit_total=0, credit_total=0).exists():
+        return 0
+    
+    with transaction.atomic():
+        # Same lock order as update_account_balance(): balance row, then slots
+        AccountBalance.objects.get_or_create(
+            account=account,
+            defaults={'balance_as_of_date': date.today(), 'net_balance': Decimal('0.00')}
+        )
+        balance = AccountBalance.objects.select_for_update().get(account=account)
+        slots = list(
+            AccountBalanceSlot.objects.select_for_update().filter(account=account)
+            .exclude(debit_total=0, credit_total=0).order_by('slot')
+        )
+        if not slots:
+            return 0
+        debits = sum(to_cents(slot.debit_total) for slot in slots)
+        credits = sum(to_cents(slot.credit_total) for slot in slots)
+        
+        total_debits = to_cents(balance.debit_total) + debits
+        total_credits = to_cents(balance.credit_total) + credits
+        balance.debit_total = from_cents(total_debits)
+        balance.credit_total = from_cents(total_credits)
+        balance.net_balance = from_cents(signed_balance_cents(account.account_type, total_debits, total_credits))
+        balance.balance_as_of_date = date.today()
+        balance.save()
+        
+        for slot in slots:
+            AccountBalanceSlot.objects.filter(id=slot.id).update(
+                debit_total=F('debit_total') - to_cents(slot.debit_total),
+                credit_total=F('credit_total') - to_cents(slot.credit_total)
+            )
+    return len(slots)
+
+
+def compact_all_balance_slots():
+    """Compact every account that has slots; returns {account_number: slots folded}."""
+    accounts = Account.objects.filter(balance_slots__isnull=False).distinct()
+    return {account.account_number: compact_balance_slots(account) for account in accounts}
 
 
 def update_all_balances():
@@ -158,9 +661,526 @@ def update_all_balances():
         update_account_balance(account)
 
 
+# Pivot reporting over line dimensions
+
+PIVOT_GROUPS = {
+    'vendor_id': lambda: F('vendor_id'),
+    'market': lambda: F('market'),
+    'event': lambda: F('event'),
+    'category': lambda: F('category'),
+    'account': lambda: F('account__account_number'),
+    'account_type': lambda: F('account__account_type'),
+    'date': lambda: F('journal_entry__date'),
+    'month': lambda: TruncMonth('journal_entry__date'),
+    'year': lambda: TruncYear('journal_entry__date'),
+}
+
+# The same groups for archived lines (dicts from archive.archived_lines)
+PIVOT_LINE_KEYS = {
+    'vendor_id': lambda line, account: line['vendor_id'],
+    'market': lambda line, account: line['market'],
+    'event': lambda line, account: line['event'],
+    'category': lambda line, account: line['category'],
+    'account': lambda line, account: account.account_number,
+    'account_type': lambda line, account: account.account_type,
+    'date': lambda line, account: line['date'],
+    'month': lambda line, account: line['date'].replace(day=1),
+    'year': lambda line, account: line['date'].replace(month=1, day=1),
+}
+
+
+def pivot_totals(group_by, date_from=None, date_to=None, account_type=None, dimensions=None):
+    """
+    Posted totals grouped by any combination of dimensions, one GROUP BY query.
+    
+    Args:
+        group_by: List of PIVOT_GROUPS keys, e.g. ['market', 'month']
+        date_from, date_to: Optional journal date range
+        account_type: Optional account type filter (e.g. 'Revenue')
+        dimensions: Optional {dimension: value} filter on line tags
+    
+    Returns:
+        List of dicts, one per group, with the group keys plus debits,
+        credits and net (credits - debits) in cents. Month and year keys
+        are formatted 'YYYY-MM' and 'YYYY'.
+    
+    Raises:
+        ValueError: If a group_by key is unknown
+    """
+    unknown = [name for name in group_by if name not in PIVOT_GROUPS]
+    if unknown:
+        raise ValueError(f"Unknown pivot dimension(s): {', '.join(unknown)}")
+    
+    # Closing journals are bookkeeping, not activity
+    entries = LedgerEntry.objects.filter(journal_entry__status='posted', **(dimensions or {})).exclude(
+        journal_entry__reference_type=CLOSING_REFERENCE_TYPE
+    )
+    if date_from is not None:
+        entries = entries.filter(journal_entry__date__gte=date_from)
+    if date_to is not None:
+        entries = entries.filter(journal_entry__date__lte=date_to)
+    if account_type is not None:
+        entries = entries.filter(account__account_type=account_type)
+    
+    # Aliased so they cannot clash with the model's own field names
+    aliases = {f'pivot_{name}': PIVOT_GROUPS[name]() for name in group_by}
+    if aliases:
+        rows = entries.values(**aliases).annotate(
+            debits=SumCents('debit'),
+            credits=SumCents('credit')
+        ).order_by(*aliases)
+    else:
+        rows = [entries.aggregate(debits=SumCents('debit'), credits=SumCents('credit'))]
+    
+    archived = _archived_pivot_totals(group_by, date_from, date_to, account_type, dimensions)
+    if archived:
+        merged = {tuple(row[alias] for alias in aliases): (row['debits'], row['credits']) for row in rows}
+        merged = _add_totals(merged, archived)
+        rows = [
+            {**dict(zip(aliases, key)), 'debits': debits, 'credits': credits}
+            for key, (debits, credits) in sorted(merged.items())
+        ]
+        if not rows and not aliases:
+            rows = [{'debits': 0, 'credits': 0}]
+    
+    result = []
+    for row in rows:
+        item = {}
+        for name in group_by:
+            value = row[f'pivot_{name}']
+            if name == 'month':
+                value = value.strftime('%Y-%m')
+            elif name == 'year':
+                value = value.strftime('%Y')
+            elif name == 'date':
+                value = value.isoformat()
+            item[name] = value
+        item['debits'] = row['debits']
+        item['credits'] = row['credits']
+        item['net'] = row['credits'] - row['debits']
+        result.append(item)
+    return result
+
+
+def _archived_pivot_totals(group_by, date_from, date_to, account_type, dimensions):
+    """pivot_totals groups of archived lines: {group values: (debits, credits)}."""
+    totals = {}
+    accounts = None
+    for line in archive.archived_lines(date_from, date_to, account_type, dimensions):
+        if accounts is None:
+            accounts = Account.objects.in_bulk()
+        account = accounts[line['account']]
+        key = tuple(PIVOT_LINE_KEYS[name](line, account) for name in group_by)
+        debits, credits = totals.get(key, (0, 0))
+        totals[key] = (debits + to_cents(line['debit']), credits + to_cents(line['credit']))
+    return totals
+
+
+# Vendor sub-ledger
+
+def apply_vendor_balances(journals):
+    """
+    Add the vendor-tagged lines of newly posted journals to VendorBalance.
+    
+    Incremental: one UPDATE per (vendor, account) pair touched, no ledger scan.
+    Must run in the same database transaction as the posting.
+    
+    Args:
+        journals: Iterable of ValidatedJournal
+    """
+    deltas = {}
+    for journal in journals:
+        for line in journal.lines:
+            if not line.vendor_id:
+                continue
+            key = (line.vendor_id, line.account.id)
+            debits, credits = deltas.get(key, (0, 0))
+            deltas[key] = (debits + line.debit, credits + line.credit)
+    
+    # Sorted so concurrent postings lock rows in the same order
+    for (vendor_id, account_id), (debits, credits) in sorted(deltas.items()):
+        VendorBalance.objects.get_or_create(vendor_id=vendor_id, account_id=account_id)
+        VendorBalance.objects.filter(vendor_id=vendor_id, account_id=account_id).update(
+            debit_total=F('debit_total') + debits,
+            credit_total=F('credit_total') + credits,
+            last_updated=timezone.now()
+        )
+
+
+def update_vendor_balance(vendor_id):
+    """
+    Recompute a vendor's balances from its posted ledger lines.
+    
+    Used after edits that bypass posting (e.g. the admin) and for repair.
+    Archived lines count through the archive manifests.
+    """
+    rows = LedgerEntry.objects.filter(
+        vendor_id=vendor_id,
+        journal_entry__status='posted'
+    ).values('account_id').annotate(
+        debits=SumCents('debit'),
+        credits=SumCents('credit')
+    ).order_by()
+    totals = {row['account_id']: (row['debits'], row['credits']) for row in rows}
+    totals = _add_totals(totals, {
+        account_id: pair
+        for (_, account_id), pair in archive.archived_vendor_totals_cents(vendor_id).items()
+    })
+    
+    with transaction.atomic():
+        VendorBalance.objects.filter(vendor_id=vendor_id).exclude(account_id__in=totals).delete()
+        for account_id, (debits, credits) in totals.items():
+            VendorBalance.objects.update_or_create(
+                vendor_id=vendor_id,
+                account_id=account_id,
+                defaults={
+                    'debit_total': from_cents(debits),
+                    'credit_total': from_cents(credits)
+                }
+            )
+
+
+def journal_changed(journal_entry, previous_status, account_ids=(), vendor_ids=(), edited=True):
+    """
+    Bring balances and the change feed up to date after a journal was edited
+    in place (the admin or the API) rather than posted through
+    record_transaction.
+    
+    Args:
+        journal_entry: The saved JournalEntry
+        previous_status: Its status before the edit
+        account_ids: Accounts whose lines the edit added, changed or removed
+        vendor_ids: Vendors whose lines the edit added, changed or removed
+        edited: Whether a posted journal changed in a way feed consumers
+            should hear about even if no line did (e.g. its date)
+    """
+    if journal_entry.status != 'posted' and previous_status != 'posted':
+        return  # Drafts don't affect balances
+    
+    account_ids = set(account_ids)
+    vendor_ids = set(vendor_ids)
+    if journal_entry.status != previous_status:
+        # Posting or un-posting affects every line
+        account_ids |= set(journal_entry.ledger_entries.values_list('account_id', flat=True))
+        vendor_ids |= set(journal_entry.ledger_entries.values_list('vendor_id', flat=True))
+    for account in Account.objects.filter(id__in=account_ids).order_by('id'):
+        update_account_balance(account)
+    for vendor_id in sorted(vendor_ids - {'', None}):
+        update_vendor_balance(vendor_id)
+    
+    if journal_entry.status == 'posted' and previous_status != 'posted':
+        record_journal_events([(journal_entry, None)], 'journal.posted')
+    elif journal_entry.status != 'posted':
+        record_journal_events([(journal_entry, None)], 'journal.unposted')
+    elif edited or account_ids or vendor_ids:
+        record_journal_events([(journal_entry, None)], 'journal.updated')
+
+
+def delete_journal(journal_entry):
+    """
+    Delete a journal, recomputing the balances it touched.
+    
+    A posted journal is announced on the change feed as journal.unposted
+    first, so the balance index and analytics store drop its lines.
+    
+    Raises:
+        ValueError: If the journal is dated in a closed period
+    """
+    error = closed_date_errors([journal_entry.date])[0]
+    if error is not None:
+        raise ValueError(error['message'])
+    with transaction.atomic():
+        lines = list(journal_entry.ledger_entries.values_list('account_id', 'vendor_id'))
+        if journal_entry.status == 'posted':
+            record_journal_events([(journal_entry, None)], 'journal.unposted')
+        journal_entry.delete()
+        if journal_entry.status != 'posted':
+            return
+        for account in Account.objects.filter(id__in={account_id for account_id, _ in lines}).order_by('id'):
+            update_account_balance(account)
+        for vendor_id in sorted({vendor_id for _, vendor_id in lines} - {'', None}):
+            update_vendor_balance(vendor_id)
+
+
+def get_vendor_balance(vendor_id):
+    """
+    What we owe a vendor, read from the materialized vendor balances.
+    
+    Returns:
+        Dict with the vendor's Vendor Payables (2100) balance in cents
+        ('payable') and per-account rows {account, debits, credits, balance}
+        in cents, or None if the vendor has no posted lines
+    """
+    balances = list(
+        VendorBalance.objects.filter(vendor_id=vendor_id).select_related('account')
+    )
+    if not balances:
+        return None
+    
+    accounts = []
+    payable = 0
+    for vendor_balance in balances:
+        account = vendor_balance.account
+        debits = to_cents(vendor_balance.debit_total)
+        credits = to_cents(vendor_balance.credit_total)
+        balance = signed_balance_cents(account.account_type, debits, credits)
+        if account.account_number == '2100':
+            payable = balance
+        accounts.append({
+            'account': account,
+            'debits': debits,
+            'credits': credits,
+            'balance': balance
+        })
+    return {'payable': payable, 'accounts': accounts}
+
+
+# Dashboard summary
+
+DASHBOARD_CACHE_TIMEOUT = 60 * 60
+DASHBOARD_RECENT_JOURNALS = 5
+
+
+def get_ledger_state():
+    """
+    Cheap token describing the current ledger state.
+    
+    Changes whenever a journal entry is created or saved, or a ledger event
+    is recorded. Every change to posted lines records one: posting, refunds,
+    period close and reopen, and edits and deletes through journal_changed()
+    and delete_journal(). Each part is a MAX over an index (the primary keys
+    and JournalEntry.updated_at), so reading it costs a few index seeks
+    however large the ledger is.
+    """
+    from django.db.models import Max
+    
+    journals = JournalEntry.objects.aggregate(last_entry=Max('entry_number'), last_updated=Max('updated_at'))
+    last_event = LedgerEvent.objects.aggregate(last=Max('sequence'))['last']
+    last_updated = journals['last_updated'].timestamp() if journals['last_updated'] else 0
+    return f"{journals['last_entry'] or 0}-{last_updated}-{last_event or 0}"
+
+
+def get_dashboard_summary(today=None):
+    """
+    Figures for the ledger home page, computed by aggregate queries and
+    cached against the ledger state.
+    
+    Returns:
+        Dict with totals by account type, recent journals and today's /
+        this month's revenue, plus the 'state' token it was computed for
+    """
+    from django.db.models import Q
+    
+    if today is None:
+        today = date.today()
+    state = f"{today.isoformat()}:{get_ledger_state()}"
+    cache_key = f'ledger:dashboard:{state}'
+    summary = cache.get(cache_key)
+    if summary is not None:
+        return summary
+    
+    # Totals by account type (sum of absolute account balances), from the
+    # latest period checkpoint plus the lines since
+    totals = {account_type: 0 for account_type, _ in Account.ACCOUNT_TYPES}
+    account_types = dict(Account.objects.filter(is_active=True).values_list('id', 'account_type'))
+    for account_id, (debits, credits) in account_totals_cents().items():
+        if account_id in account_types:
+            totals[account_types[account_id]] += abs(debits - credits)
+    
+    # Revenue for today and month to date, one conditional aggregate
+    month_start = today.replace(day=1)
+    revenue = LedgerEntry.objects.filter(
+        account__account_type='Revenue',
+        journal_entry__status='posted',
+        journal_entry__date__gte=month_start,
+        journal_entry__date__lte=today
+    ).aggregate(
+        month_credits=SumCents('credit'),
+        month_debits=SumCents('debit'),
+        today_credits=SumCents('credit', filter=Q(journal_entry__date=today)),
+        today_debits=SumCents('debit', filter=Q(journal_entry__date=today))
+    )
+    
+    # Recent journals with totals annotated
+    recent = JournalEntry.objects.annotate(
+        debit_total=SumCents('ledger_entries__debit')
+    ).order_by('-date', '-entry_number')[:DASHBOARD_RECENT_JOURNALS]
+    
+    summary = {
+        'state': state,
+        'totals': {account_type: cents_to_float(total) for account_type, total in totals.items()},
+        'revenue': {
+            'today': cents_to_float(revenue['today_credits'] - revenue['today_debits']),
+            'month_to_date': cents_to_float(revenue['month_credits'] - revenue['month_debits']),
+        },
+        'recent_journals': [
+            {
+                'entry_number': entry.entry_number,
+                'date': entry.date.isoformat(),
+                'description': entry.description,
+                'reference_type': entry.reference_type,
+                'status': entry.status,
+                'total_debits': cents_to_float(entry.debit_total),
+            }
+            for entry in recent
+        ],
+    }
+    cache.set(cache_key, summary, DASHBOARD_CACHE_TIMEOUT)
+    return summary
+
+
+# Product catalog lookups
+
+def _product_cache_key(slug):
+    return f'ledger:product:{slug}'
+
+
+def get_product(slug):
+    """
+    Look up an active product by slug, cached.
+    
+    Args:
+        slug: Product slug
+    
+    Returns:
+        Product instance, or None if not found
+    """
+    key = _product_cache_key(slug)
+    product = cache.get(key)
+    if product is None:
+        product = Product.objects.filter(slug=slug, is_active=True).first()
+        if product is not None:
+            cache.set(key, product, PRODUCT_CACHE_TIMEOUT)
+    return product
+
+
+def invalidate_product_cache(slug):
+    """Drop the cached catalog entry for a product slug."""
+    cache.delete(_product_cache_key(slug))
+
+
+# Inventory stock ledger
+
+@retry_on_conflict
+def record_stock_movement(product, quantity, movement_type, date=None, unit_cost=None,
+                          journal_entry=None, description='', total_cost=None):
+    """
+    Record a stock movement and update the product's running totals.
+    
+    Incoming stock (quantity > 0) is valued at unit_cost; outgoing stock is
+    valued at the current weighted average cost. Sales add to the product's
+    quantity sold and COGS, returns take them back off.
+    
+    The movement does not post to the general ledger itself: callers that
+    do (record_stock_receipt, record_order_payment, record_refund) lock the
+    stock level here first and post the movement's total_cost after.
+    
+    Args:
+        product: Product instance
+        quantity: Signed quantity (positive into stock, negative out)
+        movement_type: One of StockMovement.MOVEMENT_TYPES
+        date: Movement date (default: today)
+        unit_cost: Cost per unit for incoming stock (default: current average cost)
+        journal_entry: Optional JournalEntry this movement belongs to
+        description: Optional description
+        total_cost: Valuation of incoming stock when it is not quantity x
+            unit_cost (e.g. a return valued at what its sale cost)
+    
+    Returns:
+        StockMovement instance
+    """
+    from datetime import date as date_cls
+    
+    if quantity == 0:
+        raise ValueError("A stock movement must have a non-zero quantity")
+    
+    with transaction.atomic():
+        level, _ = StockLevel.objects.select_for_update().get_or_create(product=product)
+        
+        if quantity > 0 and unit_cost is not None:
+            unit_cost = Decimal(str(unit_cost)).quantize(Decimal('0.01'))
+        else:
+            unit_cost = level.average_cost
+        if quantity > 0 and total_cost is not None:
+            total_cost = Decimal(str(total_cost)).quantize(Decimal('0.01'))
+        else:
+            total_cost = (unit_cost * quantity).quantize(Decimal('0.01'))
+        if quantity < 0 and level.quantity_on_hand + quantity == 0:
+            # Clear any rounding residue when stock runs out
+            total_cost = -level.inventory_value
+        
+        movement = StockMovement.objects.create(
+            product=product,
+            journal_entry=journal_entry,
+            movement_type=movement_type,
+            date=date or date_cls.today(),
+            quantity=quantity,
+            unit_cost=unit_cost,
+            total_cost=total_cost,
+            description=description
+        )
+        
+        level.quantity_on_hand += quantity
+        level.inventory_value += total_cost
+        if movement_type in ('sale', 'return'):
+            # Sales are negative movements, returns positive
+            level.quantity_sold -= quantity
+            level.cogs_total -= total_cost
+        level.save()
+    
+    return movement
+
+
+@retry_on_conflict
+def record_stock_receipt(product, quantity, unit_cost, date=None, description=''):
+    """
+    Record stock received into inventory at a given unit cost.
+    
+    The receipt is posted to the general ledger too: Inventory (1300) is
+    debited and Accounts Payable (2000) credited with the movement's cost,
+    so the Inventory account matches the products' inventory value.
+    """
+    with transaction.atomic():
+        # Stock level first, then balances: the global lock order
+        movement = record_stock_movement(
+            product, quantity, 'receipt', date=date, unit_cost=unit_cost,
+            description=description or 'Stock received'
+        )
+        if movement.total_cost:
+            inventory = Account.objects.get(account_number=INVENTORY_ACCOUNT)
+            accounts_payable = Account.objects.get(account_number='2000')
+            movement.journal_entry = record_transaction(
+                date=movement.date,
+                description=f'Stock received: {quantity} x {product.name}',
+                reference_type='stock',
+                reference_id=product.slug,
+                entries=[
+                    {'account_id': inventory.id, 'debit': movement.total_cost, 'credit': 0, 'description': 'Inventory received', 'category': product.category},
+                    {'account_id': accounts_payable.id, 'debit': 0, 'credit': movement.total_cost, 'description': f'Owed for {product.name}'},
+                ]
+            )
+            movement.save(update_fields=['journal_entry'])
+    return movement
+
+
+def get_stock_level(product):
+    """
+    Get the running stock totals for a product.
+    
+    Returns:
+        StockLevel instance (unsaved and zeroed if the product has no movements)
+    """
+    try:
+        return StockLevel.objects.get(product=product)
+    except StockLevel.DoesNotExist:
+        return StockLevel(product=product)
+
+
 # Helper functions for external integration
 
-def record_order_payment(order_id, amount, platform_fee, vendor_amount):
+@retry_on_conflict
+def record_order_payment(order_id, amount, platform_fee, vendor_amount, items=None, vendor_id=None,
+                         market='', event=''):
     """
     Record order payment transaction.
     
@@ -170,6 +1190,18 @@ def record_order_payment(order_id, amount, platform_fee, vendor_amount):
     - Platform Fee Expense (5100)
     - Platform Fee Payable (2200)
     - Vendor Payable (2100)
+    - Vendor Share of Sales (5300)
+    - Cost of Goods Sold (5200) and Inventory (1300), for items sold
+    
+    Args:
+        items: Optional list of {'product': Product or slug, 'quantity': int}.
+            A sale stock movement is recorded for each item in the same
+            database transaction as the journal entry, and the movements'
+            cost is posted from Inventory to Cost of Goods Sold.
+        vendor_id: Vendor whose payable and share lines these are (default:
+            the vendor of the items' products, when they all share one)
+        market, event: Optional dimension tags for every line of the sale.
+            The product category is tagged too when all items share one.
     """
     from datetime import date
     
@@ -179,6 +1211,23 @@ def record_order_payment(order_id, amount, platform_fee, vendor_amount):
     platform_fee_expense = Account.objects.get(account_number='5100')
     platform_fee_payable = Account.objects.get(account_number='2200')
     vendor_payable = Account.objects.get(account_number='2100')
+    vendor_share = Account.objects.get(account_number=VENDOR_SHARE_ACCOUNT)
+    
+    products = []
+    for item in items or []:
+        product = item['product']
+        if not isinstance(product, Product):
+            product = Product.objects.get(slug=product)
+        products.append((product, item['quantity']))
+    if vendor_id is None:
+        vendor_ids = {product.vendor_id for product, _ in products}
+        vendor_id = vendor_ids.pop() if len(vendor_ids) == 1 else ''
+    categories = {product.category for product, _ in products}
+    tags = {
+        'market': market,
+        'event': event,
+        'category': categories.pop() if len(categories) == 1 else '',
+    }
     
     # Total amount = vendor_amount + platform_fee
     # Double-entry: Debit Cash, Credit Revenue; Debit Expense, Credit Payables
@@ -187,16 +1236,58 @@ def record_order_payment(order_id, amount, platform_fee, vendor_amount):
         {'account_id': sales_revenue.id, 'debit': 0, 'credit': amount, 'description': 'Sales revenue'},  # Sales Revenue (credit)
         {'account_id': platform_fee_expense.id, 'debit': platform_fee, 'credit': 0, 'description': 'Platform fee expense'},  # Platform Fee Expense (debit)
         {'account_id': platform_fee_payable.id, 'debit': 0, 'credit': platform_fee, 'description': 'Platform fee payable'},  # Platform Fee Payable (credit)
-        {'account_id': vendor_payable.id, 'debit': 0, 'credit': vendor_amount, 'description': 'Vendor payable'},  # Vendor Payable (credit)
+        {'account_id': vendor_share.id, 'debit': vendor_amount, 'credit': 0, 'description': 'Vendor share of sales', 'vendor_id': vendor_id},  # Vendor Share (debit)
+        {'account_id': vendor_payable.id, 'debit': 0, 'credit': vendor_amount, 'description': 'Vendor payable', 'vendor_id': vendor_id},  # Vendor Payable (credit)
     ]
     
-    return record_transaction(
-        date=date.today(),
-        description=f'Order payment for order {order_id}',
-        reference_type='order',
-        reference_id=str(order_id),
-        entries=entries
-    )
+    with transaction.atomic():
+        # Stock levels are locked (in product id order) before the balances,
+        # and the movements' cost is what the journal posts as COGS
+        movements = [
+            record_stock_movement(
+                product,
+                -int(quantity),
+                'sale',
+                date=date.today(),
+                description=f'Sold in order {order_id}'
+            )
+            for product, quantity in sorted(products, key=lambda item: item[0].id)
+        ]
+        cost = -sum(movement.total_cost for movement in movements)
+        entries += _stock_cost_entries(cost, vendor_id)
+        
+        # Skip zero lines (e.g. no platform fee)
+        entries = [dict(e, **tags) for e in entries if e['debit'] or e['credit']]
+        journal_entry = record_transaction(
+            date=date.today(),
+            description=f'Order payment for order {order_id}',
+            reference_type='order',
+            reference_id=str(order_id),
+            entries=entries,
+            amount=amount
+        )
+        
+        StockMovement.objects.filter(pk__in=[movement.pk for movement in movements]).update(
+            journal_entry=journal_entry
+        )
+    
+    return journal_entry
+
+
+def _stock_cost_entries(cost, vendor_id=''):
+    """
+    Journal lines moving stock cost from Inventory to Cost of Goods Sold.
+    
+    A negative cost (stock coming back on a refund) reverses them.
+    """
+    if not cost:
+        return []
+    cost_of_goods_sold = Account.objects.get(account_number=COGS_ACCOUNT)
+    inventory = Account.objects.get(account_number=INVENTORY_ACCOUNT)
+    return [
+        {'account_id': cost_of_goods_sold.id, 'debit': max(cost, 0), 'credit': max(-cost, 0), 'description': 'Cost of goods sold', 'vendor_id': vendor_id},  # COGS (debit)
+        {'account_id': inventory.id, 'debit': max(-cost, 0), 'credit': max(cost, 0), 'description': 'Inventory sold'},  # Inventory (credit)
+    ]
 
 
 def record_vendor_payout(vendor_id, amount):
@@ -211,7 +1302,7 @@ def record_vendor_payout(vendor_id, amount):
     vendor_payable = Account.objects.get(account_number='2100')
     
     entries = [
-        {'account_id': vendor_payable.id, 'debit': amount, 'credit': 0, 'description': f'Payout to vendor {vendor_id}'},  # Vendor Payable (debit - reduces liability)
+        {'account_id': vendor_payable.id, 'debit': amount, 'credit': 0, 'description': f'Payout to vendor {vendor_id}', 'vendor_id': vendor_id},  # Vendor Payable (debit - reduces liability)
         {'account_id': cash_account.id, 'debit': 0, 'credit': amount, 'description': f'Cash paid to vendor {vendor_id}'}  # Cash (credit - reduces asset)
     ]
     
@@ -249,36 +1340,238 @@ def record_subscription_payment(subscription_id, amount):
     )
 
 
-def record_refund(reference_type, reference_id, amount):
+def _allocate_cents(amounts, part, total):
     """
-    Record refund transaction (reverse the original transaction).
+    Split part cents across amounts in proportion to amount / total.
+    
+    Largest-remainder rounding, so the shares sum to exactly part and
+    allocating the whole total returns the amounts unchanged.
     """
-    from datetime import date
+    shares = [amount * part // total for amount in amounts]
+    remainders = sorted(
+        range(len(amounts)),
+        key=lambda i: (-(amounts[i] * part % total), i)
+    )
+    for i in remainders[:part - sum(shares)]:
+        shares[i] += 1
+    return shares
+
+
+def find_refundable_entry(reference_type, reference_id):
+    """
+    The original posted journal for an external reference.
     
-    # Get original transaction
-    original_entry = JournalEntry.objects.filter(
+    Refunds themselves are never returned. When several journals share a
+    reference, the earliest posted one is the original.
+    
+    Returns:
+        JournalEntry instance, or None if not found
+    """
+    return JournalEntry.objects.filter(
         reference_type=reference_type,
-        reference_id=str(reference_id)
-    ).first()
-    
-    if not original_entry:
-        raise ValueError(f"Original transaction not found: {reference_type} {reference_id}")
-    
-    # Reverse entries
-    entries = []
-    for ledger_entry in original_entry.ledger_entries.all():
-        entries.append({
-            'account_id': ledger_entry.account.id,
-            'debit': ledger_entry.credit,  # Reverse
-            'credit': ledger_entry.debit,  # Reverse
-            'description': f'Refund: {ledger_entry.description}'
-        })
+        reference_id=str(reference_id),
+        status='posted',
+        reverses__isnull=True
+    ).order_by('entry_number').first()
+
+
+@retry_on_conflict
+def record_refund(reference_type, reference_id, amount=None, items=None):
+    """
+    Record refund transaction (reverse all or part of the original transaction).
     
-    return record_transaction(
-        date=date.today(),
-        description=f'Refund for {reference_type} {reference_id}',
-        reference_type='refund',
-        reference_id=f"{reference_type}_{reference_id}",
-        entries=entries
-    )
+    A partial refund reverses every line of the original in proportion to
+    amount / original amount, in whole cents. Shares are allocated on the
+    cumulative refunded amount, so refunds that add up to the original
+    reverse each line exactly.
+    
+    amount is measured against the original's gross amount (for an order
+    payment, what the customer paid), not its total debits.
+    
+    Stock sold by the original comes back with return movements, valued at
+    what its sale cost; their cost is posted back from Cost of Goods Sold
+    to Inventory instead of the proportional share of those lines. A refund
+    that completes the original returns all stock not yet returned.
+    
+    Args:
+        reference_type: Reference type of the original transaction
+        reference_id: Reference ID of the original transaction
+        amount: Amount to refund (default: everything not yet refunded)
+        items: Optional list of {'product': Product or slug, 'quantity': int}
+            returned to stock with this refund
+    
+    Returns:
+        JournalEntry instance for the refund
+    
+    Raises:
+        ValueError: If the original is not found, the amount is not
+            positive or exceeds what is left to refund, or more of an item
+            is returned than the original sold
+    """
+    from datetime import date
+    
+    with transaction.atomic():
+        original_entry = find_refundable_entry(reference_type, reference_id)
+        if not original_entry:
+            raise ValueError(f"Original transaction not found: {reference_type} {reference_id}")
+        
+        # Lock the original so concurrent refunds see each other's rollup
+        original_entry = JournalEntry.objects.select_for_update().get(pk=original_entry.pk)
+        
+        total = to_cents(original_entry.amount)
+        refunded = to_cents(original_entry.refunded_amount)
+        refund = total - refunded if amount is None else to_cents(amount)
+        if refund <= 0:
+            raise ValueError(f"Refund amount must be positive: {from_cents(refund)}")
+        if refunded + refund > total:
+            raise ValueError(
+                f"Refund of {from_cents(refund)} exceeds the refundable amount "
+                f"{from_cents(total - refunded)} for {reference_type} {reference_id}"
+            )
+        
+        lines = list(original_entry.ledger_entries.select_related('account').order_by('id'))
+        stock_accounts = {COGS_ACCOUNT, INVENTORY_ACCOUNT}
+        if any(line.account.account_number == INVENTORY_ACCOUNT for line in lines):
+            # Stock cost comes back through the return movements below
+            cost_lines = [line for line in lines if line.account.account_number in stock_accounts]
+            lines = [line for line in lines if line.account.account_number not in stock_accounts]
+        else:
+            cost_lines = []  # Posted before stock cost was; every line is reversed in proportion
+        returns = _stock_returns(original_entry, items, complete=refunded + refund == total)
+        
+        debits = [to_cents(line.debit) for line in lines]
+        credits = [to_cents(line.credit) for line in lines]
+        side_total = sum(debits)
+        
+        def cumulative(refunded_cents):
+            # Each side's share for a cumulative refund; identical for debits
+            # and credits, so every refund journal balances
+            side = side_total * refunded_cents // total
+            return (
+                _allocate_cents(debits, side, side_total),
+                _allocate_cents(credits, side, side_total)
+            )
+        
+        # This refund's share of each line = cumulative share after it
+        # minus the cumulative share already refunded
+        debits_after, credits_after = cumulative(refunded + refund)
+        debits_before, credits_before = cumulative(refunded)
+        debit_shares = [after - before for after, before in zip(debits_after, debits_before)]
+        credit_shares = [after - before for after, before in zip(credits_after, credits_before)]
+        
+        # Reverse entries: original debits become credits and vice versa
+        entries = []
+        for line, debit_share, credit_share in zip(lines, debit_shares, credit_shares):
+            net = credit_share - debit_share
+            if net == 0:
+                continue
+            entries.append({
+                'account_id': line.account_id,
+                'debit': from_cents(max(net, 0)),
+                'credit': from_cents(max(-net, 0)),
+                'description': f'Refund: {line.description}',
+                **{field: getattr(line, field) for field in LedgerEntry.DIMENSIONS}
+            })
+        
+        description = f'Refund for {reference_type} {reference_id}'
+        if refunded + refund < total:
+            description = f'Partial refund ({from_cents(refund)}) for {reference_type} {reference_id}'
+        
+        # Stock levels before balances: the global lock order
+        movements = [
+            record_stock_movement(
+                product, quantity, 'return', date=date.today(), unit_cost=cost / quantity,
+                total_cost=cost, description=f'Returned: {description}'
+            )
+            for product, quantity, cost in returns
+        ]
+        if cost_lines:
+            cost = sum(movement.total_cost for movement in movements)
+            for entry in _stock_cost_entries(-cost, cost_lines[0].vendor_id):
+                line = next(line for line in cost_lines if line.account_id == entry['account_id'])
+                entries.append(dict(
+                    entry,
+                    description=f'Refund: {line.description}',
+                    **{field: getattr(line, field) for field in LedgerEntry.DIMENSIONS}
+                ))
+        
+        refund_entry = record_transaction(
+            date=date.today(),
+            description=description,
+            reference_type='refund',
+            reference_id=f"{reference_type}_{reference_id}",
+            entries=entries,
+            reverses=original_entry,
+            amount=from_cents(refund)
+        )
+        
+        StockMovement.objects.filter(pk__in=[movement.pk for movement in movements]).update(
+            journal_entry=refund_entry
+        )
+        original_entry.refunded_amount = from_cents(refunded + refund)
+        original_entry.save(update_fields=['refunded_amount', 'updated_at'])
+    
+    return refund_entry
+
 
+def _stock_returns(original_entry, items, complete):
+    """
+    Stock coming back with a refund of original_entry.
+    
+    Each returned quantity is valued at its share of what the original's
+    sale of the product cost; returning the last units returns the rest of
+    that cost exactly.
+    
+    Args:
+        items: List of {'product', 'quantity'} being returned, or None
+        complete: Whether the refund completes the original (then, without
+            items, everything not yet returned comes back)
+    
+    Returns:
+        List of (product, quantity, cost Decimal) in product id order
+    
+    Raises:
+        ValueError: If an item was not sold by the original or more of it
+            is returned than is left
+    """
+    sold = {}  # product id -> [product, quantity, cost cents], less earlier returns
+    for movement in original_entry.stock_movements.filter(movement_type='sale').select_related('product'):
+        entry = sold.setdefault(movement.product_id, [movement.product, 0, 0])
+        entry[1] -= movement.quantity
+        entry[2] -= to_cents(movement.total_cost)
+    returned = StockMovement.objects.filter(
+        movement_type='return', journal_entry__reverses=original_entry
+    ).values_list('product_id', 'quantity', 'total_cost')
+    left = {product_id: [product, quantity, cost] for product_id, (product, quantity, cost) in sold.items()}
+    for product_id, quantity, cost in returned:
+        if product_id in left:
+            left[product_id][1] -= quantity
+            left[product_id][2] -= to_cents(cost)
+    
+    if items is None:
+        wanted = {product_id: entry[1] for product_id, entry in left.items()} if complete else {}
+    else:
+        wanted = {}
+        for item in items:
+            product = item['product']
+            product_id = product.id if isinstance(product, Product) else (
+                Product.objects.filter(slug=product).values_list('id', flat=True).first()
+            )
+            if product_id not in left:
+                raise ValueError(f"{product} was not sold by journal {original_entry.entry_number}")
+            wanted[product_id] = wanted.get(product_id, 0) + int(item['quantity'])
+    
+    returns = []
+    for product_id in sorted(wanted):
+        product, quantity_left, cost_left = left[product_id]
+        quantity = wanted[product_id]
+        if quantity <= 0:
+            continue
+        if quantity > quantity_left:
+            raise ValueError(
+                f"Cannot return {quantity} of {product.slug}: {quantity_left} left to return "
+                f"from journal {original_entry.entry_number}"
+            )
+        cost = cost_left if quantity == quantity_left else cost_left * quantity // quantity_left
+        returns.append((product, quantity, from_cents(cost)))
+    return returns
@@ -0,0 +1,312 @@
+"""
+Monthly vendor statements
+
+A statement shows what we owe a vendor (Vendor Payables, 2100) over a month:
+the opening balance, then every journal that moved it - order credits with
+the order's gross sales and platform fee, refunds, payouts and any other
+adjustments - and the closing balance.
+
+collect_statements() gathers the data for every vendor in four set-based
+queries, however many vendors there are. render_statements() turns a batch
+of statements into CSV and HTML files. It touches neither the database nor
+Django settings, so generate_statements() runs it in a pool of worker
+processes. Run it with ``manage.py generate_vendor_statements``.
+
+Models are imported inside the functions so that spawned worker processes can
+import this module before Django is set up.
+"""
+import csv
+import hashlib
+import html
+import io
+import multiprocessing
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .money import from_cents, to_cents
+
+PAYABLE_ACCOUNT = '2100'
+SALES_ACCOUNT = '4000'
+FEE_ACCOUNT = '5100'
+BATCH_VENDORS = 50  # Statements per worker task
+ACTIVITY_KINDS = {'order': 'order_credits', 'refund': 'refunds', 'payment': 'payouts'}
+RESERVED_STEMS = {'index'}  # index.csv sits next to the statements
+HASH_SUFFIX = re.compile(r'-[0-9a-f]{8}$')
+CSV_HEADER = ['date', 'entry_number', 'type', 'reference', 'description', 'gross_sales', 'platform_fee', 'amount',
+              'balance']
+
+
+def collect_statements(start, end, vendor_ids=None):
+    """
+    Statement data for every vendor with a payable balance or activity.
+
+    Queries: current payables (VendorBalance), payable movements since
+    start, the month's payable lines with their journals, and the sales and
+    fee lines of those journals.
+
+    Args:
+        start, end: The statement period (inclusive)
+        vendor_ids: Optional list of vendors (default: all)
+
+    Returns:
+        List of dicts sorted by vendor_id, amounts in cents: vendor_id,
+        start, end, opening, closing, totals {order_credits, refunds,
+        payouts, adjustments, gross_sales, platform_fees} and activity rows
+        {date, entry_number, reference_type, reference_id, description,
+        gross_sales, platform_fee, amount}. amount is the change in what we
+        owe the vendor.
+
+    Raises:
+        ValueError: If the period is archived (its journals are no longer in
+            the database)
+    """
+    from django.db.models import Q
+    from . import archive
+    from .models import Account, LedgerEntry, VendorBalance
+    from .money import SumCents
+
+    archived_through = archive.archived_through()
+    if archived_through is not None and start <= archived_through:
+        raise ValueError(f'{start:%Y-%m} is archived; statements need its journals in the database')
+
+    payable = Account.objects.get(account_number=PAYABLE_ACCOUNT)
+    vendor_filter = Q(vendor_id__in=vendor_ids) if vendor_ids is not None else ~Q(vendor_id='')
+
+    # What we owe each vendor now, less what moved since start = opening
+    balances = {}
+    for row in VendorBalance.objects.filter(vendor_filter, account=payable).values(
+        'vendor_id', 'debit_total', 'credit_total'
+    ):
+        balances[row['vendor_id']] = to_cents(row['credit_total']) - to_cents(row['debit_total'])
+    since = LedgerEntry.objects.filter(
+        vendor_filter, account=payable, journal_entry__status='posted', journal_entry__date__gte=start
+    ).values('vendor_id').annotate(debits=SumCents('debit'), credits=SumCents('credit')).order_by()
+    opening = dict(balances)
+    for row in since:
+        opening[row['vendor_id']] = opening.get(row['vendor_id'], 0) - (row['credits'] - row['debits'])
+
+    # The month's payable lines, with their journals
+    lines = LedgerEntry.objects.filter(
+        vendor_filter, account=payable, journal_entry__status='posted',
+        journal_entry__date__gte=start, journal_entry__date__lte=end
+    )
+    activity = {}
+    for row in lines.values_list(
+        'vendor_id', 'journal_entry__date', 'journal_entry_id', 'journal_entry__reference_type',
+        'journal_entry__reference_id', 'journal_entry__description', 'debit', 'credit'
+    ).order_by('vendor_id', 'journal_entry__date', 'journal_entry_id', 'id').iterator(chunk_size=2000):
+        vendor_id, day, entry_number, reference_type, reference_id, description, debit, credit = row
+        activity.setdefault(vendor_id, []).append({
+            'date': day,
+            'entry_number': entry_number,
+            'reference_type': reference_type,
+            'reference_id': reference_id,
+            'description': description,
+            'gross_sales': 0,
+            'platform_fee': 0,
+            'amount': to_cents(credit) - to_cents(debit),
+        })
+
+    # Gross sales and platform fee of the same journals (not vendor-tagged)
+    per_journal = {}
+    for row in LedgerEntry.objects.filter(
+        journal_entry__in=lines.values('journal_entry_id'),
+        account__account_number__in=[SALES_ACCOUNT, FEE_ACCOUNT]
+    ).values('journal_entry_id', 'account__account_number').annotate(
+        debits=SumCents('debit'), credits=SumCents('credit')
+    ).order_by():
+        sales, fee = per_journal.get(row['journal_entry_id'], (0, 0))
+        if row['account__account_number'] == SALES_ACCOUNT:
+            sales += row['credits'] - row['debits']
+        else:
+            fee += row['debits'] - row['credits']
+        per_journal[row['journal_entry_id']] = (sales, fee)
+
+    statements = []
+    for vendor_id in sorted(set(opening) | set(activity)):
+        rows = activity.get(vendor_id, [])
+        if not rows and not opening.get(vendor_id):
+            continue
+        totals = {'order_credits': 0, 'refunds': 0, 'payouts': 0, 'adjustments': 0, 'gross_sales': 0,
+                  'platform_fees': 0}
+        for row in rows:
+            row['gross_sales'], row['platform_fee'] = per_journal.get(row['entry_number'], (0, 0))
+            totals[ACTIVITY_KINDS.get(row['reference_type'], 'adjustments')] += row['amount']
+            totals['gross_sales'] += row['gross_sales']
+            totals['platform_fees'] += row['platform_fee']
+        statements.append({
+            'vendor_id': vendor_id,
+            'start': start,
+            'end': end,
+            'opening': opening.get(vendor_id, 0),
+            'closing': opening.get(vendor_id, 0) + sum(row['amount'] for row in rows),
+            'totals': totals,
+            'activity': rows,
+        })
+    return statements
+
+
+def statement_filename(vendor_id):
+    """
+    A safe file name stem for a vendor, unique even when characters are replaced.
+
+    Stems are lowercase, so 'Brewery' and 'brewery' stay apart on
+    case-insensitive file systems. A stem that differs from the vendor ID,
+    names the index file, or already ends like a hash suffix gets a hash of
+    the vendor ID, so no vendor's stem can equal another's.
+    """
+    stem = re.sub(r'[^a-z0-9._-]', '_', vendor_id.lower()).strip('.') or 'vendor'
+    if stem != vendor_id or stem in RESERVED_STEMS or HASH_SUFFIX.search(stem):
+        stem += '-' + hashlib.sha1(vendor_id.encode('utf-8')).hexdigest()[:8]
+    return stem
+
+
+def statement_csv(statement):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['vendor_id', statement['vendor_id']])
+    writer.writerow(['period', statement['start'].isoformat(), statement['end'].isoformat()])
+    writer.writerow([])
+    writer.writerow(CSV_HEADER)
+    balance = statement['opening']
+    writer.writerow([statement['start'].isoformat(), '', 'opening', '', 'Opening balance', '', '', '',
+                     from_cents(balance)])
+    for row in statement['activity']:
+        balance += row['amount']
+        writer.writerow([
+            row['date'].isoformat(), row['entry_number'], row['reference_type'], row['reference_id'],
+            row['description'], from_cents(row['gross_sales']), from_cents(row['platform_fee']),
+            from_cents(row['amount']), from_cents(balance)
+        ])
+    writer.writerow([statement['end'].isoformat(), '', 'closing', '', 'Closing balance', '', '', '',
+                     from_cents(statement['closing'])])
+    return out.getvalue()
+
+
+def statement_html(statement):
+    def cell(value, numeric=False):
+        return f'<td class="num">{value}</td>' if numeric else f'<td>{html.escape(str(value))}</td>'
+
+    totals = statement['totals']
+    vendor = html.escape(statement['vendor_id'])
+    rows = []
+    balance = statement['opening']
+    for row in statement['activity']:
+        balance += row['amount']
+        rows.append('<tr>' + ''.join([
+            cell(row['date'].isoformat()), cell(row['entry_number']), cell(row['reference_type']),
+            cell(row['reference_id']), cell(row['description']), cell(from_cents(row['gross_sales']), True),
+            cell(from_cents(row['platform_fee']), True), cell(from_cents(row['amount']), True),
+            cell(from_cents(balance), True),
+        ]) + '</tr>')
+    summary = [
+        ('Opening balance', statement['opening']),
+        ('Order credits', totals['order_credits']),
+        ('Refunds', totals['refunds']),
+        ('Payouts', totals['payouts']),
+        ('Adjustments', totals['adjustments']),
+        ('Closing balance', statement['closing']),
+        ('Gross sales', totals['gross_sales']),
+        ('Platform fees', totals['platform_fees']),
+    ]
+    return (
+        '<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+        f'<title>Statement {vendor} {statement["start"]:%Y-%m}</title>'
+        '<style>body{font-family:sans-serif}table{border-collapse:collapse}'
+        'td,th{padding:2px 8px;border-bottom:1px solid #ddd}.num{text-align:right}</style></head><body>\n'
+        f'<h1>Statement for {vendor}</h1>\n'
+        f'<p>{statement["start"].isoformat()} to {statement["end"].isoformat()}</p>\n'
+        '<table>' + ''.join(f'<tr><th>{label}</th>{cell(from_cents(value), True)}</tr>' for label, value in summary)
+        + '</table>\n<h2>Activity</h2>\n<table><tr>'
+        + ''.join(f'<th>{name}</th>' for name in CSV_HEADER) + '</tr>\n'
+        + '\n'.join(rows) + '\n</table>\n</body></html>\n'
+    )
+
+
+def _write(path, text):
+    # Never leave a half-written statement behind
+    temporary = path.with_name(path.name + '.tmp')
+    temporary.write_text(text, encoding='utf-8')
+    os.replace(temporary, path)
+
+
+def render_statements(statements, output_dir, formats=('csv', 'html')):
+    """
+    Write a batch of statements to output_dir.
+
+    Returns:
+        List of (vendor_id, activity rows, seconds, bytes written)
+    """
+    output_dir = Path(output_dir)
+    results = []
+    for statement in statements:
+        started = time.perf_counter()
+        stem = statement_filename(statement['vendor_id'])
+        written = 0
+        if 'csv' in formats:
+            text = statement_csv(statement)
+            _write(output_dir / f'{stem}.csv', text)
+            written += len(text)
+        if 'html' in formats:
+            text = statement_html(statement)
+            _write(output_dir / f'{stem}.html', text)
+            written += len(text)
+        results.append((statement['vendor_id'], len(statement['activity']), time.perf_counter() - started, written))
+    return results
+
+
+def generate_statements(start, end, output_dir, vendor_ids=None, workers=None, formats=('csv', 'html')):
+    """
+    Collect and render statements for a period.
+
+    Args:
+        workers: Worker processes (default: CPU count; 0 or 1 renders in
+            this process)
+
+    Returns:
+        Dict with 'statements' (list of (vendor_id, rows, seconds, bytes) in
+        vendor order), 'collect' and 'render' (seconds) and 'output_dir'
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    started = time.perf_counter()
+    statements = collect_statements(start, end, vendor_ids)
+    collected = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batches = [statements[index:index + BATCH_VENDORS] for index in range(0, len(statements), BATCH_VENDORS)]
+    workers = os.cpu_count() if workers is None else workers
+    if workers <= 1 or len(batches) <= 1:
+        results = [render_statements(batch, output_dir, formats) for batch in batches]
+    else:
+        # Spawned, not forked: workers never share the parent's database connection
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)), mp_context=context) as pool:
+            results = list(pool.map(render_statements, batches, [output_dir] * len(batches),
+                                    [formats] * len(batches)))
+    rendered = time.perf_counter() - started
+
+    results = [result for batch in results for result in batch]
+    _write_index(output_dir, statements, results)
+    return {'statements': results, 'collect': collected, 'render': rendered, 'output_dir': output_dir}
+
+
+def _write_index(output_dir, statements, results):
+    """index.csv: one row per statement with its totals and render time."""
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['vendor_id', 'file', 'opening', 'order_credits', 'refunds', 'payouts', 'adjustments',
+                     'closing', 'gross_sales', 'platform_fees', 'rows', 'seconds'])
+    for statement, (vendor_id, rows, seconds, _) in zip(statements, results):
+        totals = statement['totals']
+        writer.writerow([
+            vendor_id, statement_filename(vendor_id), from_cents(statement['opening']),
+            from_cents(totals['order_credits']), from_cents(totals['refunds']), from_cents(totals['payouts']),
+            from_cents(totals['adjustments']), from_cents(statement['closing']), from_cents(totals['gross_sales']),
+            from_cents(totals['platform_fees']), rows, f'{seconds:.4f}'
+        ])
+    _write(output_dir / 'index.csv', out.getvalue())
@@ -1,3 +1,1322 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import io
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+
+from localmarket_backend.docs_server import DocsServer, accepts_gzip
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from . import (
+    analytics, archive, balance_index, billing, feed, loadtest, periods, reconciliation, search, statements, views_async,
+    webhooks
+)
+from .models import (
+    Account, AccountBalance, AccountBalanceSlot, AccountingPeriod, BalanceCheckpoint, BankStatementLine,
+    BillingRunFailure, JournalEntry, LedgerEntry, LedgerEvent, Product, StockLevel, StockMovement, Subscription,
+    WebhookEvent
+)
+from .money import from_cents, to_cents
+from .validation import JournalValidationError
+from .services import (
+    account_totals_cents, calculate_account_balance, compact_balance_slots, delete_journal, get_account_balance,
+    get_account_tree, get_dashboard_summary, get_ledger_state, journal_changed, pivot_totals, record_order_payment, record_refund,
+    record_stock_receipt, record_transaction, record_transactions, record_vendor_payout, rollup_totals_cents
+)
+
+
+def post(amount, day=None, debit='1000', credit='4000', **line):
+    """Post a two-line journal of amount from credit to debit account."""
+    accounts = dict(Account.objects.filter(account_number__in=[debit, credit]).values_list('account_number', 'id'))
+    return record_transaction(day or date.today(), 'Test journal', 'manual', 'test', [
+        {'account_id': accounts[debit], 'debit': amount, 'credit': 0, **line},
+        {'account_id': accounts[credit], 'debit': 0, 'credit': amount, **line},
+    ])
+
+
+def account_net_cents(account_number, **filters):
+    """Debits minus credits of an account's posted lines, in cents."""
+    account = Account.objects.get(account_number=account_number)
+    debits, credits = account_totals_cents(**filters).get(account.id, (0, 0))
+    return debits - credits
+
+
+def month_start(months_ago):
+    """First day of the month months_ago before this one."""
+    today = date.today()
+    month = today.year * 12 + today.month - 1 - months_ago
+    return date(month // 12, month % 12 + 1, 1)
+
+
+class MoneyTests(SimpleTestCase):
+    """Conversions between amounts and integer cents."""
+
+    def test_to_cents_is_exact(self):
+        self.assertEqual(to_cents(Decimal('12.34')), 1234)
+        self.assertEqual(to_cents(0.1), 10)
+        self.assertEqual(to_cents('-4.50'), -450)
+        self.assertEqual(to_cents(3), 300)
+        self.assertEqual(from_cents(1234), Decimal('12.34'))
+
+    def test_to_cents_rejects_fractions_of_a_cent(self):
+        with self.assertRaises(ValueError):
+            to_cents(Decimal('0.001'))
+        with self.assertRaises(ValueError):
+            to_cents('ten')
+
+
+class IntegerCentsStorageTests(TestCase):
+    """Money columns hold integer cents; models see 2-place Decimals."""
+
+    def test_amounts_are_stored_as_cents(self):
+        journal = post(Decimal('0.10'))
+        post(Decimal('0.20'))
+        product = Product.objects.create(slug='cents', name='Cents', vendor_id='v', price=Decimal('12.99'))
+        record_stock_receipt(product, 3, Decimal('4.51'))
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT debit FROM ledger_ledgerentry WHERE journal_entry_id = %s AND debit > 0',
+                           [journal.pk])
+            self.assertEqual(cursor.fetchone()[0], 10)
+            cursor.execute('SELECT price FROM ledger_product WHERE id = %s', [product.pk])
+            self.assertEqual(cursor.fetchone()[0], 1299)
+            cursor.execute('SELECT inventory_value FROM ledger_stocklevel WHERE product_id = %s', [product.pk])
+            self.assertEqual(cursor.fetchone()[0], 1353)
+        self.assertEqual(Product.objects.get(pk=product.pk).price, Decimal('12.99'))
+        self.assertEqual(account_net_cents('1000'), 30)  # 0.10 + 0.20, no float drift
+
+
+class JournalValidationTests(TestCase):
+    """Posting validates every journal and line field before the bulk insert."""
+
+    def setUp(self):
+        accounts = dict(Account.objects.filter(account_number__in=['1000', '4000']).values_list('account_number', 'id'))
+        self.entries = [
+            {'account_id': accounts['1000'], 'debit': '10.00', 'credit': 0},
+            {'account_id': accounts['4000'], 'debit': 0, 'credit': '10.00'},
+        ]
+
+    def test_text_longer_than_its_column_is_rejected(self):
+        self.entries[1]['description'] = 'x' * 501
+        self.entries[1]['market'] = 'm' * 101
+        with self.assertRaises(JournalValidationError) as caught:
+            record_transaction(date.today(), 'd' * 501, 'manual', 'r' * 101, self.entries)
+        self.assertEqual(
+            [(error['line'], error['field']) for error in caught.exception.errors],
+            [(None, 'description'), (None, 'reference_id')]
+        )
+        self.assertEqual(caught.exception.errors[0]['message'], 'Must be at most 500 characters')
+
+        with self.assertRaises(JournalValidationError) as caught:
+            record_transaction(date.today(), 'Fits', 'manual', 'r1', self.entries)
+        self.assertEqual(
+            [(error['line'], error['field']) for error in caught.exception.errors],
+            [(1, 'description'), (1, 'market')]
+        )
+        self.assertFalse(JournalEntry.objects.exists())
+
+    def test_batch_errors_name_the_journal(self):
+        transactions = [
+            {'date': date.today(), 'description': 'Fits', 'reference_type': 'subscription',
+             'reference_id': 'sub-1', 'entries': self.entries},
+            {'date': date.today(), 'description': 'Fits', 'reference_type': 's' * 51,
+             'reference_id': 'sub-2', 'entries': self.entries},
+        ]
+        with self.assertRaises(JournalValidationError) as caught:
+            record_transactions(transactions)
+        self.assertEqual(
+            [(error['journal'], error['field']) for error in caught.exception.errors], [(1, 'reference_type')]
+        )
+        self.assertEqual(len(record_transactions(transactions[:1])), 1)
+
+
+class StockLedgerTests(TestCase):
+    """The stock sub-ledger and the Inventory / Cost of Goods Sold accounts agree."""
+
+    def setUp(self):
+        self.product = Product.objects.create(
+            slug='test-ale', name='Test Ale', vendor_id='brewery', category='beer', price=Decimal('12.00')
+        )
+        record_stock_receipt(self.product, 10, Decimal('3.00'))
+        record_stock_receipt(self.product, 5, Decimal('4.00'))
+
+    def assertReconciles(self):
+        level = StockLevel.objects.get(product=self.product)
+        self.assertEqual(account_net_cents('1300'), int(level.inventory_value * 100))
+        self.assertEqual(account_net_cents('5200'), int(level.cogs_total * 100))
+
+    def sell(self, order_id, quantity):
+        return record_order_payment(
+            order_id, Decimal('12.00') * quantity, Decimal('1.00') * quantity, Decimal('11.00') * quantity,
+            items=[{'product': self.product, 'quantity': quantity}]
+        )
+
+    def test_sale_posts_stock_cost_as_cogs(self):
+        journal = self.sell('o1', 3)
+        self.assertReconciles()
+        movement = journal.stock_movements.get()
+        cogs = journal.ledger_entries.get(account__account_number='5200')
+        self.assertEqual(cogs.debit, -movement.total_cost)
+        self.assertEqual(journal.ledger_entries.get(account__account_number='5300').debit, Decimal('33.00'))
+        self.assertEqual(journal.total_debits, journal.total_credits)
+
+    def test_full_refund_returns_stock(self):
+        self.sell('o1', 3)
+        refund = record_refund('order', 'o1')
+        self.assertReconciles()
+        movement = StockMovement.objects.get(movement_type='return')
+        self.assertEqual(movement.journal_entry, refund)
+        self.assertEqual(movement.quantity, 3)
+        level = StockLevel.objects.get(product=self.product)
+        self.assertEqual((level.quantity_on_hand, level.quantity_sold, level.cogs_total), (15, 0, Decimal('0.00')))
+
+    def test_partial_refunds_return_items_at_sale_cost(self):
+        self.sell('o1', 3)
+        record_refund('order', 'o1', Decimal('12.00'), items=[{'product': 'test-ale', 'quantity': 1}])
+        self.assertReconciles()
+        record_refund('order', 'o1', Decimal('5.00'))  # Money only
+        self.assertEqual(StockMovement.objects.filter(movement_type='return').count(), 1)
+        record_refund('order', 'o1')  # The rest comes back with the final refund
+        self.assertReconciles()
+        level = StockLevel.objects.get(product=self.product)
+        self.assertEqual((level.quantity_sold, level.cogs_total), (0, Decimal('0.00')))
+        self.assertEqual(account_net_cents('5300'), 0)
+
+    def test_returning_more_than_sold_fails(self):
+        self.sell('o1', 2)
+        with self.assertRaises(ValueError):
+            record_refund('order', 'o1', Decimal('12.00'), items=[{'product': self.product, 'quantity': 3}])
+        self.assertFalse(JournalEntry.objects.filter(reference_type='refund').exists())
+
+
+class DashboardSummaryTests(TestCase):
+    """The cached dashboard summary follows every change to the ledger."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_deleting_the_newest_journal_refreshes_the_summary(self):
+        post(Decimal('10.00'))
+        newest = post(Decimal('5.00'))
+        self.assertEqual(get_dashboard_summary()['revenue']['today'], 15.0)
+        delete_journal(newest)
+        self.assertEqual(get_dashboard_summary()['revenue']['today'], 10.0)
+
+    def test_editing_a_line_refreshes_the_summary(self):
+        journal = post(Decimal('10.00'))
+        before = get_dashboard_summary()['state']
+        line = journal.ledger_entries.get(account__account_number='4000')
+        line.description = 'Corrected'
+        line.save()
+        journal_changed(journal, journal.status, {line.account_id})
+        self.assertNotEqual(get_dashboard_summary()['state'], before)
+
+    def test_state_reads_no_counts(self):
+        post(Decimal('10.00'))
+        with CaptureQueriesContext(connection) as queries:
+            get_ledger_state()
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql'].upper()])
+
+
+class RefundTests(TestCase):
+    """Refunds are measured against the gross order amount and reverse it exactly."""
+
+    def setUp(self):
+        self.order = record_order_payment('o1', Decimal('100.00'), Decimal('10.00'), Decimal('90.00'), vendor_id='v1')
+
+    def test_order_amount_is_what_the_customer_paid(self):
+        self.assertEqual(self.order.amount, Decimal('100.00'))
+        self.assertEqual(self.order.total_debits, Decimal('200.00'))
+
+    def test_partial_refunds_add_up_to_the_original(self):
+        for amount in (Decimal('33.33'), Decimal('33.33'), Decimal('33.34')):
+            refund = record_refund('order', 'o1', amount)
+            self.assertEqual(refund.reverses, self.order)
+            self.assertEqual(refund.total_debits, refund.total_credits)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.refunded_amount, Decimal('100.00'))
+        for account_number in ('1000', '4000', '5100', '2200', '5300', '2100'):
+            self.assertEqual(account_net_cents(account_number), 0, account_number)
+
+    def test_refunding_more_than_is_left_fails(self):
+        record_refund('order', 'o1', Decimal('60.00'))
+        with self.assertRaises(ValueError):
+            record_refund('order', 'o1', Decimal('40.01'))
+        record_refund('order', 'o1')
+        with self.assertRaises(ValueError):
+            record_refund('order', 'o1', Decimal('0.01'))
+
+
+class FeedGapTests(TestCase):
+    """Reads hold back at a sequence gap for a grace period from when it is first seen."""
+
+    def setUp(self):
+        feed._gaps_seen.clear()
+
+    def event(self, sequence, age):
+        event = LedgerEvent.objects.create(sequence=sequence, event_type='journal.posted', payload={})
+        LedgerEvent.objects.filter(pk=sequence).update(created_at=event.created_at - age)
+
+    def test_gap_is_held_from_when_it_is_first_seen(self):
+        self.event(1, timedelta(seconds=30))
+        self.event(3, timedelta(seconds=30))  # Written well before the gap is seen
+        self.assertEqual([event.sequence for event in feed.get_events(0)], [1])
+        with mock.patch.object(feed.time, 'monotonic', return_value=time.monotonic() + 6):
+            self.assertEqual([event.sequence for event in feed.get_events(0)], [1, 3])
+
+    def test_gap_before_old_events_is_skipped(self):
+        self.event(1, timedelta(hours=1))
+        self.event(3, timedelta(hours=1))
+        self.assertEqual([event.sequence for event in feed.get_events(0)], [1, 3])
+
+
+class FeedLongPollTests(TransactionTestCase):
+    """The long-poll endpoint waits on the event loop and wakes on a commit."""
+    serialized_rollback = True
+    reset_sequences = True  # Events start at 1, so reading after 0 sees no gap
+
+    async def test_wait_returns_when_a_posting_commits(self):
+        async def post_later():
+            await asyncio.sleep(0.3)
+            await sync_to_async(post, thread_sensitive=False)(Decimal('1.00'))
+
+        started = time.monotonic()
+        response, _ = await asyncio.gather(
+            self.async_client.get('/ledger/api/feed/', {'after': 0, 'wait': 10}),
+            post_later(),
+        )
+        self.assertLess(time.monotonic() - started, 5)
+        body = response.json()
+        self.assertEqual(len(body['events']), 1)
+        self.assertEqual(body['cursor'], body['events'][0]['sequence'])
+
+    async def test_waiting_readers_do_not_hold_the_sync_thread(self):
+        waits = [
+            asyncio.ensure_future(self.async_client.get('/ledger/api/feed/', {'after': 0, 'wait': 2}))
+            for _ in range(5)
+        ]
+        await asyncio.sleep(0.1)
+        started = time.monotonic()
+        await sync_to_async(Account.objects.count)()  # Runs on the shared sync thread
+        self.assertLess(time.monotonic() - started, 1)
+        responses = await asyncio.gather(*waits)
+        self.assertTrue(all(response.json()['events'] == [] for response in responses))
+
+    def test_bad_cursor(self):
+        self.assertEqual(self.client.get('/ledger/api/feed/', {'after': -1}).status_code, 400)
+
+
+def invoice_event(event_id, amount_paid=1999, **invoice):
+    return WebhookEvent.objects.create(event_id=event_id, event_type='invoice.paid', payload={
+        'id': event_id,
+        'type': 'invoice.paid',
+        'created': 1760000000,
+        'data': {'object': {'id': f'in_{event_id}', 'subscription': 'sub_1', 'currency': 'usd',
+                            'amount_paid': amount_paid, **invoice}},
+    })
+
+
+class WebhookProcessingTests(TestCase):
+    """Bad payment events fail on their own and never block the queue."""
+
+    def test_malformed_events_fail_and_the_rest_post(self):
+        good = invoice_event('evt_good')
+        huge_paid_at = invoice_event('evt_paid_at', status_transitions={'paid_at': 10 ** 20})
+        not_a_dict = WebhookEvent.objects.create(
+            event_id='evt_data', event_type='invoice.paid', payload={'id': 'evt_data', 'data': 'oops'}
+        )
+        bad_transitions = invoice_event('evt_transitions', status_transitions=['x'])
+        counts = webhooks.process_pending_events()
+        self.assertEqual(counts, {'posted': 1, 'ignored': 0, 'failed': 3})
+        for event in (good, huge_paid_at, not_a_dict, bad_transitions):
+            event.refresh_from_db()
+        self.assertEqual(good.status, 'posted')
+        self.assertEqual(good.journal_entry.total_debits, Decimal('19.99'))
+        self.assertIn('paid_at', huge_paid_at.error)
+        self.assertEqual(not_a_dict.status, 'failed')
+        self.assertEqual(bad_transitions.status, 'failed')
+        self.assertFalse(WebhookEvent.objects.filter(status='pending').exists())
+
+    def test_worker_can_restart_after_an_unexpected_error(self):
+        with self.settings(PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND=True), \
+                mock.patch.object(webhooks, 'drain_pending_events', side_effect=RuntimeError('boom')) as drain, \
+                self.assertLogs('ledger.webhooks', 'ERROR'):
+            for _ in range(2):
+                webhooks.schedule_processing()
+                worker = webhooks._worker
+                if worker is not None:
+                    worker.join(5)
+                self.assertIsNone(webhooks._worker)
+        self.assertEqual(drain.call_count, 2)
+
+
+class AsyncReportTests(TransactionTestCase):
+    """Async report sections run side by side, not on the shared sync thread."""
+    serialized_rollback = True
+
+    async def test_sections_run_concurrently(self):
+        await sync_to_async(post)(Decimal('25.00'))
+        totals = views_async.account_totals_cents
+
+        def slow_totals(*args, **kwargs):
+            time.sleep(0.5)
+            return totals(*args, **kwargs)
+
+        with mock.patch.object(views_async, 'account_totals_cents', slow_totals):
+            started = time.monotonic()
+            response = await self.async_client.get('/ledger/api/async/reports/balance-sheet/')
+            elapsed = time.monotonic() - started
+        self.assertLess(elapsed, 1.2)  # Three sections of 0.5s each
+        self.assertEqual(response.json()['assets']['total'], 25.0)
+
+
+class ShardedBalanceTests(TestCase):
+    """A hot account's balance slots add up to its ledger totals, before and after compaction."""
+
+    def setUp(self):
+        self.cash = Account.objects.get(account_number='1000')
+        post(Decimal('80.00'))  # Lands on the AccountBalance row before sharding
+        Account.objects.filter(id=self.cash.id).update(counter_slots=4)
+        self.cash.refresh_from_db()
+
+    def assertBalanced(self):
+        self.assertEqual(loadtest.check_balances(), [])
+        self.assertEqual(to_cents(get_account_balance(self.cash)), account_net_cents('1000'))
+
+    def test_slots_add_up_to_the_ledger(self):
+        for cents in range(1, 21):
+            post(from_cents(cents * 101))
+        post(Decimal('12.34'), debit='5100', credit='1000')
+        self.assertTrue(AccountBalanceSlot.objects.filter(account=self.cash).exists())
+        self.assertBalanced()
+        self.assertEqual(account_net_cents('1000'), 8000 + 101 * 210 - 1234)
+
+    def test_compaction_folds_slots_without_losing_postings(self):
+        for cents in range(1, 21):
+            post(from_cents(cents * 101))
+        slots = AccountBalanceSlot.objects.filter(account=self.cash).exclude(debit_total=0, credit_total=0).count()
+
+        self.assertEqual(compact_balance_slots(self.cash), slots)
+        self.assertFalse(
+            AccountBalanceSlot.objects.filter(account=self.cash).exclude(debit_total=0, credit_total=0).exists()
+        )
+        balance = AccountBalance.objects.get(account=self.cash)
+        self.assertEqual(to_cents(balance.net_balance), account_net_cents('1000'))
+        self.assertBalanced()
+        self.assertEqual(compact_balance_slots(self.cash), 0)
+
+        post(Decimal('5.00'))  # Postings after compaction land on the slots again
+        self.assertBalanced()
+        compact_balance_slots(self.cash)
+        self.assertBalanced()
+
+
+class AccountHierarchyTests(TestCase):
+    """Materialized paths follow the account tree, and subtotals roll up along them."""
+
+    def setUp(self):
+        self.cash = Account.objects.get(account_number='1000')
+        self.bank = Account.objects.get(account_number='1100')
+        self.market = self.account('1010', self.cash)
+        self.north = self.account('1011', self.market)
+        self.till = self.account('1012', self.north)
+
+    def account(self, number, parent):
+        return Account.objects.create(
+            account_number=number, account_name=f'Account {number}', account_type='Asset', normal_balance='Debit',
+            parent=parent
+        )
+
+    def assertPath(self, account, *ancestors):
+        account.refresh_from_db()
+        self.assertEqual(account.path, ''.join(f'{ancestor.id}/' for ancestor in ancestors + (account,)))
+        self.assertEqual(account.depth, len(ancestors))
+
+    def test_paths_follow_the_parent(self):
+        self.assertPath(self.cash)
+        self.assertPath(self.till, self.cash, self.market, self.north)
+        self.assertEqual(set(self.market.subtree()), {self.market, self.north, self.till})
+        self.assertEqual(self.till.ancestor_ids(), [self.cash.id, self.market.id, self.north.id, self.till.id])
+
+    def test_reparenting_moves_the_subtree(self):
+        self.market.parent = self.bank
+        self.market.save()
+        self.assertPath(self.market, self.bank)
+        self.assertPath(self.north, self.bank, self.market)
+        self.assertPath(self.till, self.bank, self.market, self.north)
+        self.assertEqual(set(self.cash.subtree()), {self.cash})
+
+        self.north.parent = None
+        self.north.save()
+        self.assertPath(self.north)
+        self.assertPath(self.till, self.north)
+        self.assertEqual(set(self.bank.subtree()), {self.bank, self.market})
+
+    def test_reparenting_a_stale_instance_moves_the_subtree(self):
+        north = Account.objects.get(pk=self.north.pk)
+        self.market.parent = self.bank
+        self.market.save()  # Moves north too, behind the copy's back
+
+        north.parent = self.cash
+        north.save()
+        self.assertPath(north, self.cash)
+        self.assertPath(self.till, self.cash, north)
+
+    def test_cycles_are_rejected(self):
+        for parent in (self.market, self.till):
+            self.market.parent = parent
+            with self.assertRaises(ValidationError):
+                self.market.save()
+        self.market.parent = Account.objects.get(account_number='4000')
+        with self.assertRaises(ValidationError):
+            self.market.save()  # Another account type
+        self.assertPath(self.market, self.cash)
+        self.assertPath(self.till, self.cash, self.market, self.north)
+
+    def test_subtotals_roll_up(self):
+        for number, amount in [('1012', '10.00'), ('1011', '5.00'), ('1010', '2.00'), ('1000', '1.00')]:
+            post(Decimal(amount), debit=number)
+        rolled = rollup_totals_cents(account_totals_cents())
+        self.assertEqual(rolled[self.till.id], (1000, 0))
+        self.assertEqual(rolled[self.north.id], (1500, 0))
+        self.assertEqual(rolled[self.market.id], (1700, 0))
+        self.assertEqual(rolled[self.cash.id], (1800, 0))
+        self.assertNotIn(self.bank.id, rolled)
+
+        tree = get_account_tree(account_type='Asset')
+        self.assertEqual(
+            [(row['account_number'], row['parent'], row['depth'], row['debits'], row['subtotal_debits']) for row in tree],
+            [('1000', None, 0, 100, 1800), ('1010', '1000', 1, 200, 1700), ('1011', '1010', 2, 500, 1500),
+             ('1012', '1011', 3, 1000, 1000)]
+        )
+
+        self.market.parent = self.bank
+        self.market.save()
+        rolled = rollup_totals_cents(account_totals_cents())
+        self.assertEqual(rolled[self.cash.id], (100, 0))
+        self.assertEqual(rolled[self.bank.id], (1700, 0))
+
+
+class VendorStatementTests(TestCase):
+    """A vendor statement's figures, checked by hand, and its files."""
+
+    def setUp(self):
+        self.start = month_start(1)
+        self.end = month_start(0) - timedelta(days=1)
+        before = month_start(2) + timedelta(days=4)
+        self.dated(record_order_payment('A-1', Decimal('100.00'), Decimal('10.00'), Decimal('90.00'),
+                                        vendor_id='brewery'), before)
+        self.dated(record_vendor_payout('brewery', Decimal('30.00')), before)
+        self.order = self.dated(record_order_payment('B-1', Decimal('50.00'), Decimal('5.00'), Decimal('45.00'),
+                                                     vendor_id='brewery'), self.start + timedelta(days=2))
+        self.refund = self.dated(record_refund('order', 'B-1', Decimal('20.00')), self.start + timedelta(days=9))
+        self.payout = self.dated(record_vendor_payout('brewery', Decimal('25.00')), self.start + timedelta(days=14))
+        self.adjustment = self.dated(
+            post(Decimal('1.50'), credit='2100', vendor_id='brewery'), self.start + timedelta(days=20)
+        )
+        # After the period: in the current balance, not in the statement
+        record_order_payment('C-1', Decimal('20.00'), Decimal('2.00'), Decimal('18.00'), vendor_id='brewery')
+        record_order_payment('D-1', Decimal('10.00'), Decimal('1.00'), Decimal('9.00'), vendor_id='bakery')
+
+    def dated(self, journal, day):
+        JournalEntry.objects.filter(pk=journal.pk).update(date=day)
+        journal.refresh_from_db()
+        return journal
+
+    def test_figures_match_the_hand_computed_statement(self):
+        statement, = statements.collect_statements(self.start, self.end, ['brewery'])
+        self.assertEqual(statement['opening'], 9000 - 3000)
+        self.assertEqual(statement['totals'], {
+            'order_credits': 4500,
+            'refunds': -1800,  # 20 of the 50.00 order: 40% of the vendor's 45.00
+            'payouts': -2500,
+            'adjustments': 150,
+            'gross_sales': 5000 - 2000,
+            'platform_fees': 500 - 200,
+        })
+        self.assertEqual(statement['closing'], 6000 + 4500 - 1800 - 2500 + 150)
+        self.assertEqual(
+            [(row['entry_number'], row['reference_type'], row['amount']) for row in statement['activity']],
+            [(self.order.pk, 'order', 4500), (self.refund.pk, 'refund', -1800), (self.payout.pk, 'payment', -2500),
+             (self.adjustment.pk, 'manual', 150)]
+        )
+
+        # The current balance less this month and later gives back the opening
+        self.assertEqual(
+            [statement['vendor_id'] for statement in statements.collect_statements(self.start, self.end)],
+            ['brewery']
+        )
+        later, = statements.collect_statements(month_start(0), date.today(), ['brewery'])
+        self.assertEqual(later['opening'], statement['closing'])
+        self.assertEqual(later['closing'], 6350 + 1800)
+
+    def test_csv_and_html(self):
+        statement, = statements.collect_statements(self.start, self.end, ['brewery'])
+        rows = list(csv.reader(io.StringIO(statements.statement_csv(statement))))
+        self.assertEqual(rows[3], statements.CSV_HEADER)
+        self.assertEqual(rows[4], [self.start.isoformat(), '', 'opening', '', 'Opening balance', '', '', '', '60.00'])
+        self.assertEqual(rows[5][1:], [
+            str(self.order.pk), 'order', 'B-1', 'Order payment for order B-1', '50.00', '5.00', '45.00', '105.00'
+        ])
+        self.assertEqual([row[-1] for row in rows[5:-1]], ['105.00', '87.00', '62.00', '63.50'])
+        self.assertEqual(rows[-1], [self.end.isoformat(), '', 'closing', '', 'Closing balance', '', '', '', '63.50'])
+
+        page = statements.statement_html(statement)
+        for label, value in [('Opening balance', '60.00'), ('Refunds', '-18.00'), ('Payouts', '-25.00'),
+                             ('Closing balance', '63.50'), ('Gross sales', '30.00'), ('Platform fees', '3.00')]:
+            self.assertIn(f'<tr><th>{label}</th><td class="num">{value}</td></tr>', page)
+
+    def test_file_names_never_collide(self):
+        vendor_ids = ['brewery', 'Brewery', 'a/b', 'a_b', 'index', '.hidden', 'hidden']
+        vendor_ids.append(statements.statement_filename('a/b'))
+        stems = [statements.statement_filename(vendor_id) for vendor_id in vendor_ids]
+        self.assertEqual(len({stem.lower() for stem in stems}), len(vendor_ids))
+        self.assertEqual(statements.statement_filename('brewery'), 'brewery')
+        self.assertNotIn('index', stems)
+
+        for vendor_id in ('index', 'Brewery'):
+            post(Decimal('4.00'), self.start, credit='2100', vendor_id=vendor_id)
+        with tempfile.TemporaryDirectory() as output_dir:
+            result = statements.generate_statements(self.start, self.end, output_dir, workers=0)
+            files = sorted(os.listdir(output_dir))
+            with open(os.path.join(output_dir, 'index.csv'), encoding='utf-8') as f:
+                index = list(csv.reader(f))
+        self.assertEqual([vendor_id for vendor_id, *_ in result['statements']], ['Brewery', 'brewery', 'index'])
+        self.assertEqual(len(files), 1 + 2 * 3)
+        self.assertEqual([row[0] for row in index[1:]], ['Brewery', 'brewery', 'index'])
+
+
+class ArchiveTests(TestCase):
+    """Archiving moves a closed month's journals into column files without changing any total."""
+
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        settings = override_settings(LEDGER_ARCHIVE_DIR=self.archive_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_as_of_balance_counts_archived_lines(self):
+        month = month_start(2)
+        post(Decimal('700.00'), month, debit='1000', credit='2100', vendor_id='vendor-1')
+        post(Decimal('303.50'), month_start(1), debit='1000', credit='2100', vendor_id='vendor-1')
+        period = periods.close_period(month.year, month.month)
+        archive.archive_period(period)
+
+        response = self.client.get(
+            '/ledger/api/vendors/vendor-1/balance/', {'as_of_date': date.today().isoformat()}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['payable'], 1003.5)
+
+        response = self.client.get('/ledger/api/vendors/vendor-1/balance/', {'as_of_date': month.isoformat()})
+        self.assertEqual(response.json()['payable'], 700.0)
+
+    def test_archived_journals_leave_the_database_and_totals_stay(self):
+        month = month_start(2)
+        post(Decimal('250.00'), month + timedelta(days=1), vendor_id='vendor-1', event='market-day')
+        post(Decimal('40.00'), month + timedelta(days=5), debit='5100', credit='1000')
+        post(Decimal('10.00'), month_start(1))
+        period = periods.close_period(month.year, month.month)
+        totals = account_totals_cents()
+        activity = account_totals_cents(date_from=month, date_to=period.end, closing_entries=False)
+        tagged = account_totals_cents(dimensions={'event': 'market-day'})
+
+        archive.archive_period(period)
+        period.refresh_from_db()
+        self.assertIsNotNone(period.archived_at)
+        self.assertEqual(list(JournalEntry.objects.filter(date__lte=period.end)), [period.closing_entry])
+        self.assertEqual(archive.verify_archive(period), [])
+        self.assertEqual(account_totals_cents(), totals)
+        self.assertEqual(account_totals_cents(date_from=month, date_to=period.end, closing_entries=False), activity)
+        self.assertEqual(account_totals_cents(dimensions={'event': 'market-day'}), tagged)
+
+        response = self.client.get(f'/ledger/api/periods/{period}/archive/')
+        self.assertEqual(response.status_code, 200)
+        journals = response.json()['journals']
+        self.assertEqual(len(journals), 2)
+        self.assertEqual(journals[0]['lines'][0]['debit'], '250.00')
+
+        response = self.client.get(f'/ledger/api/periods/{period}/archive/', {'export': 'csv'})
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 1 + 4)  # Header and one row per line
+
+    def test_periods_archive_in_order_and_once(self):
+        for months_ago in (3, 2):
+            month = month_start(months_ago)
+            post(Decimal('5.00'), month)
+            periods.close_period(month.year, month.month)
+        earlier, later = AccountingPeriod.objects.order_by('start')
+        with self.assertRaises(ValueError):
+            archive.archive_period(later)
+        archive.archive_period(earlier)
+        archive.archive_period(later)
+        with self.assertRaises(ValueError):
+            archive.archive_period(later)
+        with self.assertRaises(ValueError):
+            periods.reopen_latest_period()  # Its journals are gone
+
+
+class SearchTests(TestCase):
+    """Full-text search over journals and lines, through FTS5 and the icontains fallback."""
+
+    def setUp(self):
+        accounts = dict(Account.objects.values_list('account_number', 'id'))
+        self.rent = record_transaction(date.today(), 'Market stall rent', 'invoice', 'INV-2031', [
+            {'account_id': accounts['1000'], 'debit': Decimal('40.00'), 'credit': 0, 'description': 'Cash float'},
+            {'account_id': accounts['2100'], 'debit': 0, 'credit': Decimal('40.00'), 'vendor_id': 'vendor-7'},
+        ])
+        self.payment = record_transaction(date.today(), 'Order payment for order 12345', 'order', '12345', [
+            {'account_id': accounts['1000'], 'debit': Decimal('25.00'), 'credit': 0},
+            {'account_id': accounts['4000'], 'debit': 0, 'credit': Decimal('25.00'), 'description': 'Honey jars'},
+        ])
+        self.cash_line, self.vendor_line = self.rent.ledger_entries.order_by('id')
+
+    def journals(self, text):
+        return set(search.search_journals(JournalEntry.objects.all(), text))
+
+    def lines(self, text):
+        return set(search.search_lines(LedgerEntry.objects.all(), text))
+
+    def indexed(self, sql, text):
+        """Rowids the FTS5 index itself returns, stale or not."""
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [search.match_expression(search.search_terms(text))])
+            return {row[0] for row in cursor.fetchall()}
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.journals('order pay 123'), {self.payment})
+        self.assertEqual(self.journals('ORDER'), {self.payment})
+        self.assertEqual(self.journals('inv 2031'), {self.rent})
+        self.assertEqual(self.journals('payments'), set())
+        self.assertEqual(self.journals('ment'), set())  # Not a prefix
+        self.assertEqual(self.journals('"order" AND NEAR'), set())  # Not FTS5 syntax
+        self.assertEqual(self.journals('  '), set(JournalEntry.objects.all()))
+
+    def test_fallback_matches_the_same_documents(self):
+        searches = [
+            'order pay 123', 'stall', 'rent cash', 'cash float', 'vendor 7', 'honey', 'honey order',
+            'stall honey', 'invoice', 'float vendor', 'rent vendor 7',
+        ]
+        with mock.patch('ledger.search.uses_fts', return_value=False):
+            fallback = [(self.journals(text), self.lines(text)) for text in searches]
+        self.assertEqual([(self.journals(text), self.lines(text)) for text in searches], fallback)
+
+    def test_words_must_match_one_document(self):
+        for fts in (True, False):
+            with self.subTest(fts=fts), mock.patch('ledger.search.uses_fts', return_value=fts):
+                # Journal text and its line text together are not one document
+                self.assertEqual(self.journals('stall cash'), set())
+                self.assertEqual(self.lines('stall cash'), set())
+                # Nor are two lines of one journal
+                self.assertEqual(self.journals('float vendor'), set())
+                self.assertEqual(self.journals('cash float'), {self.rent})
+                self.assertEqual(self.lines('cash float'), {self.cash_line})
+                self.assertEqual(self.lines('vendor 7'), {self.vendor_line})
+                # A line matches on its journal's text
+                self.assertEqual(self.lines('stall rent'), set(self.rent.ledger_entries.all()))
+                self.assertEqual(self.lines('invoice'), set(self.rent.ledger_entries.all()))
+
+    def test_edits_and_deletes_reach_the_index(self):
+        JournalEntry.objects.filter(pk=self.rent.pk).update(description='Pitch fee')
+        self.assertEqual(self.journals('stall'), set())
+        self.assertEqual(self.journals('pitch'), {self.rent})
+        self.cash_line.description = 'Till top-up'
+        self.cash_line.save()
+        self.assertEqual(self.indexed(search.LINE_MATCH_SQL, 'float'), set())
+        self.assertEqual(self.lines('till top'), {self.cash_line})
+
+        delete_journal(self.payment)
+        self.assertEqual(self.indexed(search.JOURNAL_ONLY_MATCH_SQL, 'order'), set())
+        self.assertEqual(self.indexed(search.LINE_MATCH_SQL, 'honey'), set())
+
+    def test_archived_journals_leave_the_index(self):
+        archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(archive_dir.cleanup)
+        month = month_start(2)
+        accounts = dict(Account.objects.values_list('account_number', 'id'))
+        old = record_transaction(month, 'Harvest fair deposit', 'manual', 'fair', [
+            {'account_id': accounts['1000'], 'debit': Decimal('60.00'), 'credit': 0, 'description': 'Marquee'},
+            {'account_id': accounts['4000'], 'debit': 0, 'credit': Decimal('60.00')},
+        ])
+        self.assertEqual(self.journals('harvest'), {old})
+        with override_settings(LEDGER_ARCHIVE_DIR=archive_dir.name):
+            archive.archive_period(periods.close_period(month.year, month.month))
+
+        self.assertEqual(self.indexed(search.JOURNAL_ONLY_MATCH_SQL, 'harvest'), set())
+        self.assertEqual(self.indexed(search.LINE_MATCH_SQL, 'marquee'), set())
+        self.assertEqual(self.journals('order'), {self.payment})
+
+
+class BalanceIndexTests(TransactionTestCase):
+    """The Fenwick index agrees with the SQL totals as the ledger changes."""
+    serialized_rollback = True
+    reset_sequences = True
+
+    def setUp(self):
+        self.archive_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.archive_dir.cleanup)
+        settings = override_settings(LEDGER_ARCHIVE_DIR=self.archive_dir.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        balance_index.reset_index()
+        self.addCleanup(balance_index.reset_index)
+
+    def assertMatchesSql(self):
+        index = balance_index.get_index(force=True)
+        today = date.today()
+        days = [None, today, month_start(3), month_start(2) - timedelta(days=1), month_start(1) + timedelta(days=9)]
+        for day in days:
+            self.assertEqual(index.range_totals_cents(date_to=day), account_totals_cents(date_to=day), day)
+        for date_from, date_to in [(month_start(2), today), (month_start(3), month_start(1)), (today, None)]:
+            self.assertEqual(
+                index.range_totals_cents(date_from, date_to),
+                account_totals_cents(date_from, date_to),
+                (date_from, date_to)
+            )
+        for account in Account.objects.all():
+            for day in days:
+                self.assertEqual(
+                    index.totals_cents(account.id, day),
+                    account_totals_cents(date_to=day).get(account.id, (0, 0)),
+                    (account.account_number, day)
+                )
+
+    def test_index_follows_posting_reversing_and_archiving(self):
+        post(Decimal('120.00'), month_start(3) + timedelta(days=4))
+        post(Decimal('45.50'), month_start(2) + timedelta(days=10), debit='5100', credit='1000')
+        self.assertMatchesSql()  # Loaded from the ledger
+
+        post(Decimal('80.25'), month_start(1) + timedelta(days=2))
+        record_order_payment('o1', Decimal('100.00'), Decimal('10.00'), Decimal('90.00'), vendor_id='v1')
+        self.assertMatchesSql()  # Caught up from the feed
+
+        record_refund('order', 'o1', Decimal('40.00'))
+        self.assertMatchesSql()
+
+        month = month_start(3)
+        period = periods.close_period(month.year, month.month)
+        self.assertMatchesSql()
+        archive.archive_period(period)
+        self.assertFalse(JournalEntry.objects.filter(date__lte=period.end).exclude(pk=period.closing_entry_id).exists())
+        self.assertMatchesSql()
+
+        balance_index.reset_index()
+        self.assertMatchesSql()  # Reloaded with the archive
+
+    def test_api_edits_and_deletes_reach_the_index(self):
+        journal = post(Decimal('60.00'), month_start(1))
+        kept = post(Decimal('15.00'), month_start(2))
+        self.assertMatchesSql()
+
+        response = self.client.patch(
+            f'/ledger/api/transactions/{journal.pk}/', {'date': str(month_start(2))}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(LedgerEvent.objects.last().event_type, 'journal.updated')
+        self.assertMatchesSql()
+
+        response = self.client.patch(
+            f'/ledger/api/transactions/{kept.pk}/', {'status': 'draft'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(LedgerEvent.objects.last().event_type, 'journal.unposted')
+        self.assertMatchesSql()
+
+        response = self.client.delete(f'/ledger/api/transactions/{journal.pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(LedgerEvent.objects.last().event_type, 'journal.unposted')
+        self.assertMatchesSql()
+        cash = AccountBalance.objects.get(account__account_number='1000')
+        self.assertEqual(cash.debit_total, Decimal('0.00'))
+
+    def test_admin_deletes_reach_the_index(self):
+        journal = post(Decimal('60.00'), month_start(1))
+        line_journal = post(Decimal('25.00'), month_start(1), debit='5100', credit='1000')
+        self.assertMatchesSql()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+
+        response = self.client.post(f'/admin/ledger/journalentry/{journal.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(JournalEntry.objects.filter(pk=journal.pk).exists())
+        self.assertMatchesSql()
+
+        line = line_journal.ledger_entries.get(account__account_number='5100')
+        response = self.client.post(f'/admin/ledger/ledgerentry/{line.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(LedgerEvent.objects.last().event_type, 'journal.updated')
+        self.assertMatchesSql()
+
+    def test_journals_in_a_closed_period_cannot_be_deleted(self):
+        journal = post(Decimal('10.00'), month_start(2))
+        month = month_start(2)
+        periods.close_period(month.year, month.month)
+        response = self.client.delete(f'/ledger/api/transactions/{journal.pk}/')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.patch(
+            f'/ledger/api/transactions/{journal.pk}/', {'description': 'Edited'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertTrue(JournalEntry.objects.filter(pk=journal.pk, description='Test journal').exists())
+
+
+@skipUnless(analytics.np is not None, 'needs numpy')
+class AnalyticsSnapshotTests(TestCase):
+    """The NumPy snapshot agrees with the SQL totals through refreshes, edits and archiving."""
+
+    def setUp(self):
+        for name in ('LEDGER_ANALYTICS_DIR', 'LEDGER_ARCHIVE_DIR'):
+            directory = tempfile.TemporaryDirectory()
+            self.addCleanup(directory.cleanup)
+            settings = override_settings(**{name: directory.name})
+            settings.enable()
+            self.addCleanup(settings.disable)
+        self.payable = Account.objects.get(account_number='2100')
+
+    def post_month(self, months_ago, market='north'):
+        month = month_start(months_ago)
+        post(Decimal('120.00'), month, market=market, category='produce')
+        post(Decimal('45.50'), month + timedelta(days=3), debit='1000', credit='2100', vendor_id='vendor-1')
+        post(Decimal('19.99'), month + timedelta(days=7), debit='5100', credit='1000', market=market)
+
+    def assertMatchesLedger(self, snapshot):
+        self.assertEqual(snapshot.trial_balance(), account_totals_cents())
+        day = month_start(1) - timedelta(days=1)
+        self.assertEqual(snapshot.trial_balance(day), account_totals_cents(date_to=day))
+        for groups in ([], ['account'], ['market', 'month'], ['vendor_id', 'account_type'], ['category', 'year']):
+            self.assertEqual(snapshot.group_totals(groups), pivot_totals(groups), groups)
+        self.assertEqual(
+            snapshot.group_totals(['month'], account_type='Revenue'), pivot_totals(['month'], account_type='Revenue')
+        )
+
+    def test_refresh_appends_new_journals(self):
+        self.post_month(2)
+        snapshot = analytics.LedgerSnapshot.open()
+        self.assertEqual(snapshot.rows, 6)
+        self.assertMatchesLedger(snapshot)
+
+        self.post_month(0, market='south')
+        self.assertEqual(snapshot.refresh(), 6)
+        self.assertEqual(snapshot.rows, 12)
+        self.assertMatchesLedger(snapshot)
+        self.assertEqual(snapshot.refresh(), 0)
+
+        cached = analytics.LedgerSnapshot.open(refresh=False)
+        self.assertEqual(cached.rows, 12)
+        self.assertMatchesLedger(cached)
+
+    def test_unposted_journal_rebuilds(self):
+        self.post_month(1)
+        journal = post(Decimal('300.00'), market='north')
+        snapshot = analytics.LedgerSnapshot.open()
+        self.assertEqual(snapshot.rows, 8)
+
+        delete_journal(journal)
+        self.assertIsNone(snapshot.refresh())
+        self.assertEqual(snapshot.rows, 6)
+        self.assertMatchesLedger(snapshot)
+
+    def test_archiving_rebuilds_with_archived_lines(self):
+        self.post_month(2)
+        self.post_month(1)
+        month = month_start(2)
+        period = periods.close_period(month.year, month.month)
+        snapshot = analytics.LedgerSnapshot.open()
+        self.assertMatchesLedger(snapshot)
+        totals = snapshot.trial_balance()
+        rows = snapshot.rows
+
+        archive.archive_period(period)
+        self.assertIsNone(snapshot.refresh())
+        self.assertEqual(snapshot.rows, rows)
+        self.assertEqual(snapshot.trial_balance(), totals)
+        self.assertMatchesLedger(snapshot)
+
+    def test_cohort_totals(self):
+        earlier, later = month_start(2), month_start(1)
+        post(Decimal('100.00'), earlier, debit='1000', credit='2100', vendor_id='vendor-1')
+        post(Decimal('50.00'), later, debit='1000', credit='2100', vendor_id='vendor-1')
+        post(Decimal('30.00'), later, debit='1000', credit='2100', vendor_id='vendor-2')
+        post(Decimal('30.00'), later, debit='1000', credit='2100', vendor_id='vendor-2')
+        snapshot = analytics.LedgerSnapshot.open()
+
+        earlier, later = earlier.strftime('%Y-%m'), later.strftime('%Y-%m')
+        self.assertEqual(snapshot.cohort_totals(accounts=[self.payable.id]), [
+            {'cohort': earlier, 'month': earlier, 'entities': 1, 'net': 10000},
+            {'cohort': earlier, 'month': later, 'entities': 1, 'net': 5000},
+            {'cohort': later, 'month': later, 'entities': 1, 'net': 6000},
+        ])
+
+    def test_distribution(self):
+        for vendor_id, amount in [('vendor-1', '40.00'), ('vendor-2', '10.00'), ('vendor-3', '25.00')]:
+            post(Decimal(amount), debit='2100', credit='1000', vendor_id=vendor_id)
+        post(Decimal('5.00'), debit='2100', credit='1000')  # Untagged lines are not an entity
+        snapshot = analytics.LedgerSnapshot.open()
+
+        spread = snapshot.distribution(accounts=[self.payable.id], percentiles=(50,))
+        self.assertEqual(spread, {
+            'count': 3, 'total': 7500, 'mean': 2500.0, 'min': 1000, 'max': 4000, 'percentiles': {'50': 2500.0},
+        })
+        self.assertEqual(snapshot.distribution(market='nowhere')['count'], 0)
+
+
+class PeriodCloseTests(TestCase):
+    """Closing a month locks it, rolls P&L into retained earnings and checkpoints balances."""
+
+    def setUp(self):
+        self.month = month_start(2)
+        post(Decimal('500.00'), self.month + timedelta(days=3))
+        post(Decimal('120.00'), self.month + timedelta(days=8), debit='5100', credit='1000')
+        post(Decimal('75.00'), month_start(1))
+
+    def close(self):
+        return periods.close_period(self.month.year, self.month.month)
+
+    def test_close_rolls_net_income_into_retained_earnings(self):
+        period = self.close()
+        end = period.end
+        self.assertEqual(period.closing_entry.date, end)
+        self.assertEqual(account_net_cents('4000', date_to=end), 0)
+        self.assertEqual(account_net_cents('5100', date_to=end), 0)
+        self.assertEqual(account_net_cents('3100', date_to=end), -38000)  # 380.00 credit
+        # Activity reports leave the closing journal out
+        self.assertEqual(account_net_cents('4000', date_to=end, closing_entries=False), -50000)
+
+    def test_checkpoints_hold_cumulative_totals(self):
+        period = self.close()
+        self.assertEqual(AccountingPeriod.objects.get().pk, period.pk)
+        checkpoints = {
+            checkpoint.account_id: (to_cents(checkpoint.debit_total), to_cents(checkpoint.credit_total))
+            for checkpoint in BalanceCheckpoint.objects.filter(period=period)
+        }
+        self.assertEqual(checkpoints, account_totals_cents(date_to=period.end))
+        # Totals after the close start from the checkpoint and match a full scan
+        cash = Account.objects.get(account_number='1000')
+        self.assertEqual(calculate_account_balance(cash), Decimal('455.00'))
+        self.assertEqual(calculate_account_balance(cash, period.end), Decimal('380.00'))
+
+    def test_closed_period_is_locked(self):
+        self.close()
+        with self.assertRaises(JournalValidationError):
+            post(Decimal('1.00'), self.month + timedelta(days=1))
+        with self.assertRaises(ValueError):
+            self.close()
+        later = month_start(0)
+        with self.assertRaises(ValueError):
+            periods.close_period(later.year, later.month)  # Not ended yet
+
+    def test_months_close_in_order(self):
+        earlier, later = month_start(3), month_start(1)
+        periods.close_period(earlier.year, earlier.month)
+        with self.assertRaisesMessage(ValueError, f'Close {self.month:%Y-%m} first'):
+            periods.close_period(later.year, later.month)
+        self.close()
+        periods.close_period(later.year, later.month)
+        self.assertEqual(AccountingPeriod.objects.count(), 3)
+
+    def test_line_admin_cannot_touch_closed_lines(self):
+        period = self.close()
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+        journal = JournalEntry.objects.filter(date__lte=period.end).exclude(pk=period.closing_entry_id).first()
+        line = journal.ledger_entries.first()
+        lines = journal.ledger_entries.count()
+
+        response = self.client.post(f'/admin/ledger/ledgerentry/{line.pk}/change/', {
+            'journal_entry': journal.pk, 'account': line.account_id, 'debit': '1.00', 'credit': '0.00'
+        })
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post(f'/admin/ledger/ledgerentry/{line.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 403)
+        response = self.client.post('/admin/ledger/ledgerentry/', {
+            'action': 'delete_selected', '_selected_action': [line.pk], 'post': 'yes'
+        })
+        self.assertEqual(journal.ledger_entries.count(), lines)
+
+        response = self.client.post('/admin/ledger/ledgerentry/add/', {
+            'journal_entry': journal.pk, 'account': line.account_id, 'debit': '1.00', 'credit': '0.00'
+        })
+        self.assertContains(response, 'The period is closed through')
+        self.assertEqual(journal.ledger_entries.count(), lines)
+
+    def test_reopen_removes_the_close(self):
+        period = self.close()
+        closing_id = period.closing_entry_id
+        periods.reopen_latest_period()
+        self.assertFalse(AccountingPeriod.objects.exists())
+        self.assertFalse(BalanceCheckpoint.objects.exists())
+        self.assertFalse(JournalEntry.objects.filter(pk=closing_id).exists())
+        self.assertEqual(account_net_cents('4000'), -57500)
+        self.assertEqual(AccountBalance.objects.get(account__account_number='3100').net_balance, Decimal('0.00'))
+        post(Decimal('1.00'), self.month + timedelta(days=1))  # Open again
+
+
+class ReconciliationTests(TestCase):
+    """Bank statement import and matching against the cash account's lines."""
+
+    def setUp(self):
+        self.cash = Account.objects.get(account_number='1000')
+        self.day = month_start(1) + timedelta(days=10)
+
+    def import_csv(self, text):
+        return reconciliation.import_statement(self.cash, io.StringIO(text), 'statement.csv')
+
+    def cash_line(self, journal):
+        return journal.ledger_entries.get(account=self.cash)
+
+    def test_statement_formats(self):
+        lines = list(reconciliation.read_statement(io.StringIO(
+            'Posting Date,Memo,Withdrawal,Deposit\n'
+            '01/15/2026,Coffee,4.50,\n'
+            '01/15/2026,Coffee,4.50,\n'
+            '2026-01-16,Sales,,"1,234.50"\n'
+        )))
+        self.assertEqual([line['amount'] for line in lines], [-450, -450, 123450])
+        self.assertEqual(lines[0]['date'], date(2026, 1, 15))
+        self.assertNotEqual(lines[0]['fingerprint'], lines[1]['fingerprint'])  # Same row twice, two payments
+
+        amounts = reconciliation.read_statement(io.StringIO('date,amount\n2026-01-16,(12.00)\n'))
+        self.assertEqual(next(amounts)['amount'], -1200)
+        with self.assertRaises(reconciliation.StatementFormatError):
+            list(reconciliation.read_statement(io.StringIO('when,what\n2026-01-16,1\n')))
+        with self.assertRaisesMessage(reconciliation.StatementFormatError, 'Row 3'):
+            list(reconciliation.read_statement(io.StringIO('date,amount\n2026-01-16,1\n2026-01-17,ten\n')))
+
+    def test_reimport_skips_known_lines(self):
+        text = 'date,amount,reference\n2026-01-15,10.00,A1\n2026-01-16,-3.00,A2\n'
+        self.assertEqual(self.import_csv(text).line_count, 2)
+        self.assertEqual(self.import_csv(text + '2026-01-17,5.00,A3\n').line_count, 1)
+        self.assertEqual(BankStatementLine.objects.count(), 3)
+
+    def test_reconcile_passes(self):
+        exact = post(Decimal('100.00'), self.day)
+        late = post(Decimal('42.00'), self.day + timedelta(days=2))
+        close = post(Decimal('19.99'), self.day)
+        post(Decimal('7.00'), self.day, debit='5100', credit='1000')  # Never cleared
+        self.import_csv(
+            'date,amount\n'
+            f'{self.day},100.00\n'
+            f'{self.day},42.00\n'
+            f'{self.day},20.00\n'
+            f'{self.day},-900.00\n'
+        )
+
+        counts = reconciliation.reconcile(self.cash, window=3, tolerance=Decimal('0.05'))
+        self.assertEqual(counts, {'exact': 1, 'window': 1, 'tolerance': 1, 'unmatched': 1})
+        matched = dict(BankStatementLine.objects.filter(status='matched').values_list('match_method', 'matched_entry'))
+        self.assertEqual(matched, {
+            'exact': self.cash_line(exact).id,
+            'window': self.cash_line(late).id,
+            'tolerance': self.cash_line(close).id
+        })
+
+        report = reconciliation.unmatched_report(self.cash)
+        self.assertEqual([line['amount'] for line in report['statement_lines']], [-90000])
+        self.assertEqual([line['amount'] for line in report['ledger_lines']], [-700])
+
+        # A second run finds nothing new; unmatching frees both sides
+        self.assertEqual(reconciliation.reconcile(self.cash)['unmatched'], 1)
+        line = BankStatementLine.objects.get(match_method='window')
+        reconciliation.unmatch(line)
+        self.assertFalse(self.cash_line(late).reconciled)
+        self.assertEqual(reconciliation.reconcile(self.cash, window=1)['window'], 0)
+        self.assertEqual(reconciliation.reconcile(self.cash, window=2)['window'], 1)
+
+
+class BillingRunTests(TestCase):
+    """Billing runs post each due subscription once, resuming after a stop."""
+
+    def setUp(self):
+        self.run_date = date.today()
+        start = self.run_date
+        for number in range(5):
+            Subscription.objects.create(
+                subscription_id=f'sub-{number}',
+                amount=Decimal('9.99'),
+                start_date=start,
+                next_billing_date=self.run_date
+            )
+        Subscription.objects.create(
+            subscription_id='paused', amount=Decimal('5.00'), start_date=start, next_billing_date=self.run_date,
+            status='paused'
+        )
+
+    def billed_journals(self):
+        return JournalEntry.objects.filter(reference_type='subscription').order_by('reference_id')
+
+    def test_run_resumes_after_the_checkpoint(self):
+        result = billing.run_billing(self.run_date, chunk_size=2, max_chunks=1)
+        self.assertEqual(result['posted'], 2)
+        self.assertEqual(result['run'].status, 'running')
+
+        result = billing.run_billing(self.run_date, chunk_size=2)
+        self.assertEqual((result['posted'], result['chunks']), (3, 2))
+        run = result['run']
+        self.assertEqual((run.status, run.posted, run.chunks, run.amount), ('completed', 5, 3, Decimal('49.95')))
+        self.assertEqual(
+            list(self.billed_journals().values_list('reference_id', flat=True)),
+            [f'sub-{number}' for number in range(5)]
+        )
+        self.assertEqual(account_net_cents('4100'), -4995)
+        self.assertFalse(billing.due_subscriptions(self.run_date).exists())
+        self.assertEqual(
+            Subscription.objects.get(subscription_id='sub-0').next_billing_date,
+            billing.add_months(self.run_date, 1, self.run_date.day)
+        )
+
+        self.assertEqual(billing.run_billing(self.run_date)['posted'], 0)
+        self.assertEqual(self.billed_journals().count(), 5)
+
+    def test_crashed_chunk_rolls_back_and_is_retried(self):
+        record = billing.record_transactions
+        calls = []
+
+        def crash_on_second_chunk(transactions):
+            calls.append(len(transactions))
+            if len(calls) == 2:
+                raise RuntimeError('worker killed')
+            return record(transactions)
+
+        with mock.patch.object(billing, 'record_transactions', crash_on_second_chunk):
+            with self.assertRaises(RuntimeError):
+                billing.run_billing(self.run_date, chunk_size=2)
+        self.assertEqual(self.billed_journals().count(), 2)
+        self.assertEqual(Subscription.objects.filter(last_billed_date=self.run_date).count(), 2)
+
+        result = billing.run_billing(self.run_date, chunk_size=2)
+        self.assertEqual(result['run'].posted, 5)
+        self.assertEqual(self.billed_journals().count(), 5)
+
+    def test_subscriptions_that_fail_stay_due(self):
+        Subscription.objects.filter(subscription_id='sub-2').update(amount=Decimal('0.00'))
+        run = billing.run_billing(self.run_date)['run']
+        self.assertEqual((run.posted, run.failed), (4, 1))
+        failure = BillingRunFailure.objects.get()
+        self.assertEqual(failure.subscription.subscription_id, 'sub-2')
+        self.assertEqual(failure.subscription.next_billing_date, self.run_date)
+        self.assertIsNone(failure.subscription.last_billed_date)
+
+    def test_next_billing_date_keeps_the_anchor_day(self):
+        self.assertEqual(billing.add_months(date(2025, 1, 31), 1, 31), date(2025, 2, 28))
+        self.assertEqual(billing.add_months(date(2025, 2, 28), 1, 31), date(2025, 3, 31))
+        self.assertEqual(billing.add_months(date(2024, 11, 15), 3, 15), date(2025, 2, 15))
+
+
+class DocsServerTests(SimpleTestCase):
+    """Docs responses keep the gzip and identity representations apart."""
+
+    def setUp(self):
+        self.docs_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.docs_dir.cleanup)
+        self.root = self.docs_dir.name
+        with open(os.path.join(self.root, 'index.html'), 'w') as f:
+            f.write('<h1>Docs</h1>' * 50)
+        with open(os.path.join(self.root, 'big.bin'), 'wb') as f:
+            f.write(b'x' * 2048)
+        with open(os.path.join(self.root, 'big.bin.gz'), 'wb') as f:
+            f.write(gzip.compress(b'x' * 2048))
+        self.server = DocsServer(self.root, max_cache_bytes=1 << 20, max_file_size=1024, max_age=60)
+
+    def get(self, path, **headers):
+        return self.server.serve(RequestFactory().get(f'/docs/{path}', **headers), path)
+
+    def test_accept_encoding_is_parsed(self):
+        self.assertTrue(accepts_gzip('gzip, deflate, br'))
+        self.assertTrue(accepts_gzip('br;q=1.0, GZIP;q=0.5'))
+        self.assertTrue(accepts_gzip('*'))
+        self.assertFalse(accepts_gzip('gzip;q=0'))
+        self.assertFalse(accepts_gzip('gzip;q=0, *'))
+        self.assertFalse(accepts_gzip('identity'))
+        self.assertFalse(accepts_gzip(None))
+
+    def test_gzip_variant_has_its_own_etag(self):
+        plain = self.get('index.html')
+        zipped = self.get('index.html', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(zipped['Content-Encoding'], 'gzip')
+        self.assertNotEqual(plain['ETag'], zipped['ETag'])
+        self.assertEqual(plain['Vary'], 'Accept-Encoding')
+        refused = self.get('index.html', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+        for etag in (plain['ETag'], zipped['ETag'], f'W/{zipped["ETag"]}'):
+            response = self.get('index.html', HTTP_IF_NONE_MATCH=etag, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], zipped['ETag'])
+
+    def test_large_file_served_from_its_gz_sibling(self):
+        response = self.get('big.bin', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')  # Not a compressible type, but has a .gz
+        self.assertTrue(response['ETag'].endswith('-gz"'))
+        response.close()
+
+    def test_stale_gz_sibling_is_ignored(self):
+        source = os.path.join(self.root, 'big.bin')
+        stat = os.stat(source + '.gz')
+        os.utime(source, (stat.st_atime, stat.st_mtime + 10))
+        response = self.get('big.bin', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertFalse(response.has_header('Vary'))
+        response.close()
+
+
+class AdminChangelistTests(TestCase):
+    """Changelist filters read their choices from small tables, not the large ones they filter."""
+
+    def setUp(self):
+        self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x'))
+
+    def changelist_queries(self, url, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries]
+
+    def assertNoAccountScan(self, queries):
+        # A filter over every account shows up as an unfiltered SELECT from ledger_account
+        self.assertFalse([
+            sql for sql in queries if sql.startswith('SELECT "ledger_account"."id"') and ' WHERE ' not in sql
+        ])
+
+    def test_line_filters_do_not_scan_the_lines(self):
+        Product.objects.create(slug='ale', name='Ale', vendor_id='v1', category='beer', price=Decimal('5.00'))
+        post(Decimal('5.00'), category='beer')
+        post(Decimal('7.00'), category='cider')
+        queries = self.changelist_queries('/admin/ledger/ledgerentry/')
+        self.assertFalse([sql for sql in queries if 'DISTINCT' in sql and 'ledger_ledgerentry' in sql])
+
+        response = self.client.get('/admin/ledger/ledgerentry/', {'category': 'beer'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+
+    def test_vendor_balance_filter_does_not_load_every_account(self):
+        post(Decimal('5.00'), debit='1000', credit='2100', vendor_id='v1')
+        self.assertNoAccountScan(self.changelist_queries('/admin/ledger/vendorbalance/'))
+        response = self.client.get('/admin/ledger/vendorbalance/', {'account__account_type__exact': 'Liability'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_slot_filter_offers_only_sharded_accounts(self):
+        Account.objects.filter(account_number='1000').update(counter_slots=4)
+        post(Decimal('5.00'))
+        self.assertNoAccountScan(self.changelist_queries('/admin/ledger/accountbalanceslot/'))
+        response = self.client.get('/admin/ledger/accountbalanceslot/')
+        choices = [choice['display'] for choice in response.context['cl'].filter_specs[0].choices(response.context['cl'])]
+        self.assertEqual(choices[1:], ['1000 Cash'])
+
+    def test_statement_filters_offer_only_statement_accounts(self):
+        cash = Account.objects.get(account_number='1000')
+        reconciliation.import_statement(cash, io.StringIO('date,amount\n2026-01-15,10.00\n'), 'statement.csv')
+        for url in ('/admin/ledger/bankstatementimport/', '/admin/ledger/bankstatementline/'):
+            self.assertNoAccountScan(self.changelist_queries(url))
+            response = self.client.get(url, {'account': cash.id})
+            self.assertEqual(response.context['cl'].result_count, 1)
@@ -1,8 +1,10 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    AccountViewSet, TransactionViewSet, TrialBalanceView,
-    ProfitLossView, BalanceSheetView
+    AccountViewSet, TransactionViewSet, ProductViewSet, DashboardView, VendorBalanceView,
+    PaymentWebhookView, ReconciliationImportView,
+    UnmatchedReportView, AccountingPeriodView, ReopenPeriodView, ArchivedJournalsView, PivotReportView,
+    AccountTreeView, TrialBalanceView, ProfitLossView, BalanceSheetView
 )
 from .views_web import (
     IndexView, AccountsView, TransactionsView, CreateTransactionView,
@@ -12,12 +14,14 @@ from .views_web import (
     BalanceSheetView as BalanceSheetWebView,
     InventoryView
 )
+from . import views_async
 
 app_name = 'ledger'
 
 router = DefaultRouter()
 router.register(r'accounts', AccountViewSet, basename='account')
 router.register(r'transactions', TransactionViewSet, basename='transaction')
+router.register(r'products', ProductViewSet, basename='product')
 
 urlpatterns = [
     # Web views
@@ -33,8 +37,26 @@ urlpatterns = [
     
     # API endpoints
     path('api/', include(router.urls)),
+    path('api/dashboard/', DashboardView.as_view(), name='api-dashboard'),
+    path('api/vendors/<str:vendor_id>/balance/', VendorBalanceView.as_view(), name='api-vendor-balance'),
+    path('api/feed/', views_async.ledger_feed, name='api-feed'),
+    path('api/feed/stream/', views_async.ledger_feed_stream, name='api-feed-stream'),
+    path('api/webhooks/payments/', PaymentWebhookView.as_view(), name='api-payment-webhook'),
+    path('api/reconciliation/<str:account_number>/import/', ReconciliationImportView.as_view(), name='api-reconciliation-import'),
+    path('api/reconciliation/<str:account_number>/unmatched/', UnmatchedReportView.as_view(), name='api-reconciliation-unmatched'),
+    path('api/periods/', AccountingPeriodView.as_view(), name='api-periods'),
+    path('api/periods/reopen/', ReopenPeriodView.as_view(), name='api-periods-reopen'),
+    path('api/periods/<str:month>/archive/', ArchivedJournalsView.as_view(), name='api-periods-archive'),
     path('api/reports/trial-balance/', TrialBalanceView.as_view(), name='api-trial-balance'),
     path('api/reports/profit-loss/', ProfitLossView.as_view(), name='api-profit-loss'),
     path('api/reports/balance-sheet/', BalanceSheetView.as_view(), name='api-balance-sheet'),
+    path('api/reports/pivot/', PivotReportView.as_view(), name='api-pivot'),
+    path('api/reports/account-tree/', AccountTreeView.as_view(), name='api-account-tree'),
+    
+    # Async API endpoints (for ASGI deployments)
+    path('api/async/accounts/<int:pk>/balance/', views_async.account_balance, name='api-async-account-balance'),
+    path('api/async/reports/trial-balance/', views_async.trial_balance, name='api-async-trial-balance'),
+    path('api/async/reports/profit-loss/', views_async.profit_loss, name='api-async-profit-loss'),
+    path('api/async/reports/balance-sheet/', views_async.balance_sheet, name='api-async-balance-sheet'),
 ]
 
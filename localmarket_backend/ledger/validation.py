@@ -0,0 +1,227 @@
+"""
+Journal validation pipeline
+
+Validates one journal, or a batch of journals, with a single account lookup
+and exact integer-cent arithmetic. Lines that pass are returned normalized
+(account instance + cents), so posting can bulk insert them without running
+LedgerEntry.full_clean() per row. Text is checked against the model column
+lengths here, since nothing else checks it before the insert.
+"""
+from .models import Account, JournalEntry, LedgerEntry
+from .money import to_cents, from_cents
+
+JOURNAL_TEXT_FIELDS = ('description', 'reference_type', 'reference_id')
+
+
+def _max_length(model, field):
+    return model._meta.get_field(field).max_length
+
+
+def _length_error(line, field, max_length):
+    return {'line': line, 'field': field, 'message': f'Must be at most {max_length} characters'}
+
+
+class JournalValidationError(ValueError):
+    """
+    Raised when a journal fails validation.
+
+    errors is a list of dicts: {'line': index or None, 'field': name or None,
+    'message': text}. Journal-level errors have line None.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__('; '.join(_format_error(e) for e in errors))
+
+
+def _format_error(error):
+    message = error['message']
+    if error['line'] is not None:
+        message = f"Line {error['line'] + 1}: {message}"
+    if error.get('journal') is not None:
+        message = f"Journal {error['journal'] + 1}: {message}"
+    return message
+
+
+class ValidatedLine:
+    __slots__ = ('account', 'debit', 'credit', 'description', 'tags')
+
+    def __init__(self, account, debit, credit, description, tags=None):
+        self.account = account
+        self.debit = debit  # cents
+        self.credit = credit  # cents
+        self.description = description
+        self.tags = tags or {}  # non-blank LedgerEntry.DIMENSIONS values
+
+    @property
+    def vendor_id(self):
+        return self.tags.get('vendor_id', '')
+
+
+class ValidatedJournal:
+    """Normalized journal lines that passed validation."""
+
+    def __init__(self, lines):
+        self.lines = lines
+
+    @property
+    def total_cents(self):
+        return sum(line.debit for line in self.lines)
+
+    @property
+    def accounts(self):
+        """Distinct accounts touched, in first-seen order."""
+        return list({line.account.id: line.account for line in self.lines}.values())
+
+
+def _account_ids(entries):
+    ids = set()
+    for entry in entries:
+        try:
+            ids.add(int(entry.get('account_id')))
+        except (TypeError, ValueError):
+            pass
+    return ids
+
+
+def load_accounts(journals):
+    """One query for every account referenced by a batch of journals."""
+    ids = set()
+    for entries in journals:
+        ids |= _account_ids(entries)
+    return Account.objects.in_bulk(ids)
+
+
+def _check_journal(entries, accounts):
+    errors = []
+    lines = []
+
+    if not entries or len(entries) < 2:
+        errors.append({'line': None, 'field': None, 'message': "A transaction must have at least two entries"})
+        return None, errors
+
+    total_debits = 0
+    total_credits = 0
+    for index, entry in enumerate(entries):
+        line_errors = []
+
+        account = None
+        try:
+            account = accounts.get(int(entry.get('account_id')))
+        except (TypeError, ValueError):
+            pass
+        if account is None:
+            line_errors.append({'line': index, 'field': 'account_id', 'message': 'Invalid account ID'})
+        elif not account.is_active:
+            line_errors.append({'line': index, 'field': 'account_id', 'message': f'Account {account.account_number} is inactive'})
+
+        amounts = {}
+        for field in ('debit', 'credit'):
+            try:
+                amounts[field] = to_cents(entry.get(field, 0))
+            except ValueError as e:
+                line_errors.append({'line': index, 'field': field, 'message': str(e)})
+                continue
+            if amounts[field] < 0:
+                line_errors.append({'line': index, 'field': field, 'message': 'Amount must not be negative'})
+
+        debit = amounts.get('debit', 0)
+        credit = amounts.get('credit', 0)
+        if len(amounts) == 2:
+            if debit > 0 and credit > 0:
+                line_errors.append({'line': index, 'field': None, 'message': 'An entry cannot have both debit and credit amounts'})
+            elif debit == 0 and credit == 0:
+                line_errors.append({'line': index, 'field': None, 'message': 'An entry must have either a debit or credit amount'})
+
+        description = entry.get('description', '') or ''
+        max_length = _max_length(LedgerEntry, 'description')
+        if len(description) > max_length:
+            line_errors.append(_length_error(index, 'description', max_length))
+
+        tags = {}
+        for field in LedgerEntry.DIMENSIONS:
+            value = str(entry.get(field) or '').strip()
+            max_length = _max_length(LedgerEntry, field)
+            if len(value) > max_length:
+                line_errors.append(_length_error(index, field, max_length))
+            elif value:
+                tags[field] = value
+
+        if line_errors:
+            errors.extend(line_errors)
+            continue
+
+        total_debits += debit
+        total_credits += credit
+        lines.append(ValidatedLine(account, debit, credit, description, tags))
+
+    if not errors and total_debits != total_credits:
+        errors.append({
+            'line': None,
+            'field': None,
+            'message': f"Debits ({from_cents(total_debits)}) must equal credits ({from_cents(total_credits)})"
+        })
+
+    if errors:
+        return None, errors
+    return ValidatedJournal(lines), []
+
+
+def journal_header_errors(description, reference_type, reference_id):
+    """
+    Errors for journal header text longer than its JournalEntry column.
+
+    Returns:
+        List of error dicts (line None), empty if the header fits
+    """
+    values = {'description': description, 'reference_type': reference_type, 'reference_id': reference_id}
+    errors = []
+    for field in JOURNAL_TEXT_FIELDS:
+        max_length = _max_length(JournalEntry, field)
+        if len(str(values[field] or '')) > max_length:
+            errors.append(_length_error(None, field, max_length))
+    return errors
+
+
+def validate_journal(entries, accounts=None):
+    """
+    Validate the lines of one journal.
+
+    Args:
+        entries: List of dicts with {account_id, debit, credit, description} and
+            optional dimension tags (vendor_id, market, event, category)
+        accounts: Optional {id: Account} map (default: loaded in one query)
+
+    Returns:
+        ValidatedJournal
+
+    Raises:
+        JournalValidationError: With structured per-line errors
+    """
+    if accounts is None:
+        accounts = load_accounts([entries])
+    journal, errors = _check_journal(entries, accounts)
+    if errors:
+        raise JournalValidationError(errors)
+    return journal
+
+
+def validate_journals(journals):
+    """
+    Validate a batch of journals with one account query.
+
+    Args:
+        journals: List of entry lists
+
+    Returns:
+        (validated, errors) where validated[i] is a ValidatedJournal or None
+        and errors[i] is the list of errors for journal i (empty if valid)
+    """
+    accounts = load_accounts(journals)
+    validated = []
+    errors = []
+    for entries in journals:
+        journal, journal_errors = _check_journal(entries, accounts)
+        validated.append(journal)
+        errors.append(journal_errors)
+    return validated, errors
@@ -1,18 +1,29 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db import transaction
 from django.db.models import Q, Sum
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import date, datetime
 from decimal import Decimal
+import csv
+import itertools
 
-from .models import Account, JournalEntry, LedgerEntry, AccountBalance
+from .models import Account, AccountingPeriod, JournalEntry, LedgerEntry, AccountBalance, Product
 from .serializers import (
     AccountSerializer, JournalEntrySerializer, TransactionCreateSerializer,
-    AccountBalanceSerializer
+    AccountBalanceSerializer, ProductSerializer, StockLevelSerializer
 )
-from .services import record_transaction, get_account_balance, update_all_balances
+from .services import (
+    record_transaction, get_account_balance, update_all_balances, get_stock_level,
+    get_dashboard_summary, account_totals_cents, signed_balance_cents, get_vendor_balance,
+    pivot_totals, get_account_tree, journal_changed, delete_journal
+)
+from .money import cents_to_float
+from . import archive, periods, reconciliation, search, webhooks
 
 
 class AccountViewSet(viewsets.ModelViewSet):
@@ -70,6 +81,18 @@ class TransactionViewSet(viewsets.ModelViewSet):
         if reference_id:
             queryset = queryset.filter(reference_id=reference_id)
         
+        # Refunds of a given journal, or journals that have been refunded
+        reverses = self.request.query_params.get('reverses')
+        if reverses and reverses.isdigit():
+            queryset = queryset.filter(reverses_id=int(reverses))
+        if self.request.query_params.get('refunded') == 'true':
+            queryset = queryset.filter(refunded_amount__gt=0)
+        
+        # Full-text search over journal and line descriptions and references
+        q = self.request.query_params.get('q')
+        if q:
+            queryset = search.search_journals(queryset, q)
+        
         # Filter by date range
         date_from = self.request.query_params.get('date_from')
         date_to = self.request.query_params.get('date_to')
@@ -108,23 +131,14 @@ class TransactionViewSet(viewsets.ModelViewSet):
         
         data = serializer.validated_data
         
-        # Convert entries to proper format
-        entries = []
-        for entry in data['entries']:
-            entries.append({
-                'account_id': int(entry['account_id']),
-                'debit': Decimal(str(entry.get('debit', 0))),
-                'credit': Decimal(str(entry.get('credit', 0))),
-                'description': entry.get('description', '')
-            })
-        
         try:
+            # Entries were validated by the serializer; post them without re-validating
             journal_entry = record_transaction(
                 date=data['date'],
                 description=data['description'],
                 reference_type=data['reference_type'],
                 reference_id=data['reference_id'],
-                entries=entries
+                entries=data['journal']
             )
             
             response_serializer = JournalEntrySerializer(journal_entry)
@@ -133,6 +147,475 @@ class TransactionViewSet(viewsets.ModelViewSet):
             return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Account.DoesNotExist as e:
             return Response({'error': 'Invalid account ID'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    def perform_update(self, serializer):
+        # Journals in a closed period are frozen, and none can be moved into one
+        instance = serializer.instance
+        dates = [instance.date, serializer.validated_data.get('date', instance.date)]
+        errors = [error for error in periods.closed_date_errors(dates) if error is not None]
+        if errors:
+            raise ValidationError({'date': [errors[0]['message']]})
+        
+        previous_status = instance.status
+        with transaction.atomic():
+            journal_entry = serializer.save()
+            journal_changed(journal_entry, previous_status)
+    
+    def perform_destroy(self, instance):
+        try:
+            delete_journal(instance)
+        except ValueError as e:
+            raise ValidationError({'error': str(e)})
+
+
+class ProductViewSet(viewsets.ModelViewSet):
+    """
+    ViewSet for the product catalog (paginated inventory API)
+    """
+    queryset = Product.objects.filter(is_active=True)
+    serializer_class = ProductSerializer
+    lookup_field = 'slug'
+    
+    def get_queryset(self):
+        queryset = Product.objects.filter(is_active=True)
+        
+        # Filter by vendor_id (uses the vendor_id/is_active/name index)
+        vendor_id = self.request.query_params.get('vendor_id')
+        if vendor_id:
+            queryset = queryset.filter(vendor_id=vendor_id)
+        
+        # Prefix search on name
+        name = self.request.query_params.get('name')
+        if name:
+            queryset = queryset.filter(name__istartswith=name)
+        
+        return queryset
+    
+    @action(detail=True, methods=['get'])
+    def stock(self, request, slug=None):
+        """Get running stock level, valuation and COGS for a product"""
+        product = self.get_object()
+        return Response(StockLevelSerializer(get_stock_level(product)).data)
+
+
+class DashboardView(APIView):
+    """
+    Compact summary for the ledger home page
+    """
+    def get(self, request):
+        summary = get_dashboard_summary()
+        etag = f'"{summary["state"]}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        return Response(summary, headers={'ETag': etag, 'Cache-Control': 'private, no-cache'})
+
+
+class VendorBalanceView(APIView):
+    """
+    What we owe a vendor, from the vendor sub-ledger
+    
+    Reads the materialized per-vendor balances; with ?as_of_date= the
+    vendor's lines up to that date, live and archived, are summed instead.
+    """
+    def get(self, request, vendor_id):
+        as_of_date = request.query_params.get('as_of_date')
+        if as_of_date:
+            try:
+                as_of_date = datetime.strptime(as_of_date, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            summary = self._as_of(vendor_id, as_of_date)
+        else:
+            summary = get_vendor_balance(vendor_id)
+        
+        if summary is None:
+            return Response({'error': 'Vendor not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'vendor_id': vendor_id,
+            'payable': cents_to_float(summary['payable']),
+            'accounts': [
+                {
+                    'account_number': row['account'].account_number,
+                    'account_name': row['account'].account_name,
+                    'debit_total': cents_to_float(row['debits']),
+                    'credit_total': cents_to_float(row['credits']),
+                    'balance': cents_to_float(row['balance'])
+                }
+                for row in summary['accounts']
+            ],
+            'as_of_date': as_of_date or date.today()
+        })
+    
+    def _as_of(self, vendor_id, as_of_date):
+        # Includes the vendor's lines in archived periods
+        totals = account_totals_cents(date_to=as_of_date, dimensions={'vendor_id': vendor_id})
+        if not totals:
+            return None
+        
+        accounts = []
+        payable = 0
+        for account in Account.objects.filter(id__in=totals).order_by('account_number'):
+            debits, credits = totals[account.id]
+            balance = signed_balance_cents(account.account_type, debits, credits)
+            if account.account_number == '2100':
+                payable = balance
+            accounts.append({'account': account, 'debits': debits, 'credits': credits, 'balance': balance})
+        return {'payable': payable, 'accounts': accounts}
+
+
+class PaymentWebhookView(APIView):
+    """
+    Stripe-style payment webhook
+    
+    Verifies the Stripe-Signature header against PAYMENT_WEBHOOK_SECRET,
+    stores the event (duplicate ids are acknowledged without storing) and
+    returns 200 at once. Posting to the ledger happens off the request path.
+    """
+    authentication_classes = []
+    
+    def post(self, request):
+        from django.conf import settings
+        
+        payload = request.body
+        try:
+            webhooks.verify_signature(
+                payload,
+                request.headers.get('Stripe-Signature'),
+                getattr(settings, 'PAYMENT_WEBHOOK_SECRET', ''),
+                tolerance=getattr(settings, 'PAYMENT_WEBHOOK_TOLERANCE', 300)
+            )
+        except webhooks.SignatureError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            event_id, created = webhooks.store_event(payload)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if created:
+            webhooks.schedule_processing()
+        return Response({'received': True, 'event_id': event_id, 'duplicate': not created})
+
+
+def _parse_date_params(request, *names):
+    """Parse optional YYYY-MM-DD query params; raises ValueError if invalid."""
+    values = {}
+    for name in names:
+        value = request.query_params.get(name)
+        values[name] = datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    return values
+
+
+class ReconciliationImportView(APIView):
+    """
+    Import a bank statement CSV for an account and match it to the ledger
+    
+    POST multipart with 'file'; optional 'window' (days, default 3),
+    'tolerance' (amount, default 0) and 'date_format' (strptime format).
+    """
+    def post(self, request, account_number):
+        try:
+            account = Account.objects.get(account_number=account_number, is_active=True)
+        except Account.DoesNotExist:
+            return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'error': 'A statement file is required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            window = int(request.data.get('window', 3))
+            tolerance = Decimal(str(request.data.get('tolerance', '0')))
+        except (ValueError, ArithmeticError):
+            return Response({'error': 'window and tolerance must be numbers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            statement = reconciliation.import_statement(
+                account, upload.file, filename=upload.name,
+                date_format=request.data.get('date_format') or None
+            )
+        except reconciliation.StatementFormatError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        counts = reconciliation.reconcile(account, window=max(window, 0), tolerance=abs(tolerance))
+        return Response({
+            'import_id': statement.id,
+            'lines_imported': statement.line_count,
+            'matched': {method: counts[method] for method in ('exact', 'window', 'tolerance')},
+            'unmatched': counts['unmatched']
+        }, status=status.HTTP_201_CREATED)
+
+
+class UnmatchedReportView(APIView):
+    """
+    Unmatched statement lines and unreconciled ledger lines for an account
+    """
+    def get(self, request, account_number):
+        try:
+            account = Account.objects.get(account_number=account_number, is_active=True)
+        except Account.DoesNotExist:
+            return Response({'error': 'Account not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            dates = _parse_date_params(request, 'date_from', 'date_to')
+        except ValueError:
+            return Response(
+                {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        report = reconciliation.unmatched_report(account, **dates)
+        for key in ('statement_lines', 'ledger_lines'):
+            for line in report[key]:
+                line['amount'] = cents_to_float(line['amount'])
+        
+        return Response({
+            'account_number': account.account_number,
+            'account_name': account.account_name,
+            'period': {'from': dates['date_from'], 'to': dates['date_to']},
+            'statement_lines': report['statement_lines'],
+            'ledger_lines': report['ledger_lines'],
+            'statement_total': cents_to_float(report['statement_total']),
+            'ledger_total': cents_to_float(report['ledger_total']),
+            'difference': cents_to_float(report['statement_total'] - report['ledger_total'])
+        })
+
+
+def _period_data(period):
+    return {
+        'period': str(period),
+        'start': period.start,
+        'end': period.end,
+        'closing_entry': period.closing_entry_id,
+        'closed_at': period.closed_at,
+        'archived_at': period.archived_at,
+    }
+
+
+class AccountingPeriodView(APIView):
+    """
+    Closed accounting periods
+    
+    GET lists closed months, newest first. POST {"month": "YYYY-MM"} closes
+    the next month: it locks the month against posting, rolls revenue and
+    expense into Retained Earnings and writes balance checkpoints.
+    """
+    def get(self, request):
+        return Response({
+            'closed_through': periods.closed_through(),
+            'periods': [_period_data(period) for period in AccountingPeriod.objects.all()]
+        })
+    
+    def post(self, request):
+        try:
+            month = datetime.strptime(str(request.data.get('month', '')), '%Y-%m')
+        except ValueError:
+            return Response({'error': 'month must be YYYY-MM'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            period = periods.close_period(month.year, month.month)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(_period_data(period), status=status.HTTP_201_CREATED)
+
+
+class ReopenPeriodView(APIView):
+    """
+    Reopen the most recently closed month (deletes its closing journal and
+    checkpoints)
+    """
+    def post(self, request):
+        try:
+            period = periods.reopen_latest_period()
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'reopened': str(period), 'closed_through': periods.closed_through()})
+
+
+class _Echo:
+    """File-like object whose write() returns the line, for streaming csv.writer output"""
+    def write(self, value):
+        return value
+
+
+class ArchivedJournalsView(APIView):
+    """
+    Journals of an archived month, read from the columnar archive
+    
+    Filters: ?entry=, ?reference_type=, ?reference_id=; pages with ?offset=
+    and ?limit= (default 100, max 1000). ?export=csv streams every line of
+    the month as CSV instead.
+    """
+    page_size = 100
+    max_page_size = 1000
+    
+    def get(self, request, month):
+        try:
+            start = datetime.strptime(month, '%Y-%m').date()
+            period = AccountingPeriod.objects.get(start=start)
+        except (ValueError, AccountingPeriod.DoesNotExist):
+            return Response({'error': 'Closed period not found'}, status=status.HTTP_404_NOT_FOUND)
+        if period.archived_at is None:
+            return Response(
+                {'error': f'{period} is not archived; its journals are at /ledger/api/transactions/'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        if request.query_params.get('export') == 'csv':
+            writer = csv.writer(_Echo())
+            response = StreamingHttpResponse(
+                (writer.writerow(row) for row in archive.export_rows(period)),
+                content_type='text/csv'
+            )
+            response['Content-Disposition'] = f'attachment; filename="ledger-{period}.csv"'
+            return response
+        
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            limit = min(max(int(request.query_params.get('limit', self.page_size)), 1), self.max_page_size)
+            entry = request.query_params.get('entry')
+            entry = int(entry) if entry else None
+        except ValueError:
+            return Response({'error': 'offset, limit and entry must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        accounts = dict(Account.objects.values_list('id', 'account_number'))
+        with archive.open_archive(period) as period_archive:
+            matches = period_archive.journals(
+                entry_number=entry,
+                reference_type=request.query_params.get('reference_type') or None,
+                reference_id=request.query_params.get('reference_id') or None
+            )
+            page = list(itertools.islice(matches, offset, offset + limit + 1))
+            journals = []
+            for journal in page[:limit]:
+                lines = period_archive.journal_lines(journal)
+                for line in lines:
+                    line['account_number'] = accounts.get(line['account'])
+                    line['debit'] = str(line['debit'])
+                    line['credit'] = str(line['credit'])
+                journal['amount'] = str(journal['amount'])
+                journal['refunded_amount'] = str(journal['refunded_amount'])
+                journal['lines'] = lines
+                journals.append(journal)
+        
+        return Response({
+            'period': str(period),
+            'archived_at': period.archived_at,
+            'journals': journals,
+            'has_more': len(page) > limit
+        })
+
+
+def _dimension_filters(request):
+    """Line dimension filters from the query string, e.g. ?event=summer-music-festival"""
+    return {
+        field: request.query_params[field]
+        for field in LedgerEntry.DIMENSIONS
+        if request.query_params.get(field)
+    }
+
+
+class PivotReportView(APIView):
+    """
+    Totals pivoted by any combination of line dimensions
+    
+    ?group_by=market,month groups by market and month (see
+    services.PIVOT_GROUPS); ?account_type=, ?date_from=, ?date_to= and the
+    dimension fields (?market=, ?event=, ...) filter the lines.
+    """
+    def get(self, request):
+        group_by = [name.strip() for name in request.query_params.get('group_by', '').split(',') if name.strip()]
+        
+        dates = {}
+        for param in ('date_from', 'date_to'):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    dates[param] = datetime.strptime(value, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        
+        account_type = request.query_params.get('account_type') or None
+        dimensions = _dimension_filters(request)
+        try:
+            rows = pivot_totals(group_by, account_type=account_type, dimensions=dimensions, **dates)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        filters = dict(dimensions, **dates)
+        if account_type:
+            filters['account_type'] = account_type
+        
+        return Response({
+            'group_by': group_by,
+            'filters': filters,
+            'rows': [
+                dict(
+                    {name: row[name] for name in group_by},
+                    debit_total=cents_to_float(row['debits']),
+                    credit_total=cents_to_float(row['credits']),
+                    net=cents_to_float(row['net'])
+                )
+                for row in rows
+            ]
+        })
+
+
+class AccountTreeView(APIView):
+    """
+    Balances down the account hierarchy, with a subtotal at every level
+    
+    ?as_of_date= (default today) or ?date_from=&date_to= for the activity of
+    a period; ?account_type= and the dimension fields filter the lines.
+    """
+    def get(self, request):
+        dates = {}
+        for param in ('as_of_date', 'date_from', 'date_to'):
+            value = request.query_params.get(param)
+            if value:
+                try:
+                    dates[param] = datetime.strptime(value, '%Y-%m-%d').date()
+                except ValueError:
+                    return Response(
+                        {'error': 'Invalid date format. Use YYYY-MM-DD'},
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+        date_to = dates.get('date_to') or dates.get('as_of_date')
+        if date_to is None and 'date_from' not in dates:
+            date_to = date.today()
+        
+        account_type = request.query_params.get('account_type') or None
+        dimensions = _dimension_filters(request)
+        tree = get_account_tree(
+            date_from=dates.get('date_from'), date_to=date_to, account_type=account_type, dimensions=dimensions
+        )
+        
+        return Response({
+            'date_from': dates.get('date_from'),
+            'date_to': date_to,
+            'account_type': account_type,
+            'dimensions': dimensions,
+            'accounts': [
+                {
+                    'account_number': row['account_number'],
+                    'account_name': row['account_name'],
+                    'account_type': row['account_type'],
+                    'parent': row['parent'],
+                    'depth': row['depth'],
+                    'balance': cents_to_float(
+                        signed_balance_cents(row['account_type'], row['debits'], row['credits'])
+                    ),
+                    'subtotal': cents_to_float(
+                        signed_balance_cents(row['account_type'], row['subtotal_debits'], row['subtotal_credits'])
+                    ),
+                }
+                for row in tree
+            ]
+        })
 
 
 class TrialBalanceView(APIView):
@@ -153,33 +636,23 @@ class TrialBalanceView(APIView):
             as_of_date = date.today()
         
         accounts = Account.objects.filter(is_active=True)
+        totals = account_totals_cents(date_to=as_of_date)
         trial_balance = []
-        total_debits = Decimal('0.00')
-        total_credits = Decimal('0.00')
+        total_debits = 0
+        total_credits = 0
         
         for account in accounts:
-            ledger_entries = LedgerEntry.objects.filter(
-                account=account,
-                journal_entry__date__lte=as_of_date,
-                journal_entry__status='posted'
-            )
-            
-            debit_total = sum(entry.debit for entry in ledger_entries)
-            credit_total = sum(entry.credit for entry in ledger_entries)
-            
-            if account.account_type in ['Asset', 'Expense']:
-                balance = debit_total - credit_total
-            else:
-                balance = credit_total - debit_total
+            debit_total, credit_total = totals.get(account.id, (0, 0))
+            balance = signed_balance_cents(account.account_type, debit_total, credit_total)
             
             if debit_total > 0 or credit_total > 0:
                 trial_balance.append({
                     'account_number': account.account_number,
                     'account_name': account.account_name,
                     'account_type': account.account_type,
-                    'debit_total': float(debit_total),
-                    'credit_total': float(credit_total),
-                    'balance': float(balance)
+                    'debit_total': cents_to_float(debit_total),
+                    'credit_total': cents_to_float(credit_total),
+                    'balance': cents_to_float(balance)
                 })
                 
                 total_debits += debit_total
@@ -188,15 +661,18 @@ class TrialBalanceView(APIView):
         return Response({
             'as_of_date': as_of_date,
             'accounts': trial_balance,
-            'total_debits': float(total_debits),
-            'total_credits': float(total_credits),
-            'difference': float(total_debits - total_credits)
+            'total_debits': cents_to_float(total_debits),
+            'total_credits': cents_to_float(total_credits),
+            'difference': cents_to_float(total_debits - total_credits)
         })
 
 
 class ProfitLossView(APIView):
     """
     Simple Profit & Loss Report (Revenue - Expenses)
+    
+    Dimension filters (?event=, ?market=, ?category=, ?vendor_id=) restrict
+    it to tagged lines, e.g. the P&L of one event.
     """
     def get(self, request):
         date_from = request.query_params.get('date_from')
@@ -218,41 +694,38 @@ class ProfitLossView(APIView):
         else:
             date_to = date.today()
         
+        dimensions = _dimension_filters(request)
+        totals = account_totals_cents(
+            date_from=date_from, date_to=date_to, dimensions=dimensions, closing_entries=False
+        )
+        
         # Revenue accounts
         revenue_accounts = Account.objects.filter(account_type='Revenue', is_active=True)
-        total_revenue = Decimal('0.00')
+        total_revenue = 0
         revenue_details = []
         
         for account in revenue_accounts:
-            entries = LedgerEntry.objects.filter(
-                account=account,
-                journal_entry__date__range=[date_from, date_to],
-                journal_entry__status='posted'
-            )
-            revenue = sum(entry.credit - entry.debit for entry in entries)
+            debits, credits = totals.get(account.id, (0, 0))
+            revenue = credits - debits
             if revenue > 0:
                 revenue_details.append({
                     'account_name': account.account_name,
-                    'amount': float(revenue)
+                    'amount': cents_to_float(revenue)
                 })
                 total_revenue += revenue
         
         # Expense accounts
         expense_accounts = Account.objects.filter(account_type='Expense', is_active=True)
-        total_expenses = Decimal('0.00')
+        total_expenses = 0
         expense_details = []
         
         for account in expense_accounts:
-            entries = LedgerEntry.objects.filter(
-                account=account,
-                journal_entry__date__range=[date_from, date_to],
-                journal_entry__status='posted'
-            )
-            expense = sum(entry.debit - entry.credit for entry in entries)
+            debits, credits = totals.get(account.id, (0, 0))
+            expense = debits - credits
             if expense > 0:
                 expense_details.append({
                     'account_name': account.account_name,
-                    'amount': float(expense)
+                    'amount': cents_to_float(expense)
                 })
                 total_expenses += expense
         
@@ -263,15 +736,16 @@ class ProfitLossView(APIView):
                 'from': date_from,
                 'to': date_to
             },
+            'dimensions': dimensions,
             'revenue': {
                 'details': revenue_details,
-                'total': float(total_revenue)
+                'total': cents_to_float(total_revenue)
             },
             'expenses': {
                 'details': expense_details,
-                'total': float(total_expenses)
+                'total': cents_to_float(total_expenses)
             },
-            'net_income': float(net_income)
+            'net_income': cents_to_float(net_income)
         })
 
 
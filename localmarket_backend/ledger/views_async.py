@@ -0,0 +1,405 @@
+"""
+Async report views for ASGI deployments.
+
+These mirror the report endpoints in views.py but run on the event loop using
+Django's async ORM, so slow reports do not hold a worker thread while they
+wait on the database. Independent report sections (and multi-period columns)
+are computed concurrently with asyncio.gather; each section's queries run in
+a pool thread with its own connection, so they do not queue on the shared
+sync thread.
+
+The change feed's long-poll and Server-Sent Events endpoints live here too:
+a waiting consumer sleeps on the event loop instead of holding a worker.
+"""
+import asyncio
+from datetime import date, datetime
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponseBadRequest, JsonResponse, Http404, StreamingHttpResponse
+
+from . import feed
+from .models import Account, AccountBalance, AccountBalanceSlot
+from .money import SumCents, cents_to_float, to_cents
+from .services import account_totals_cents, calculate_account_balance, signed_balance_cents
+
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _bad_date():
+    return JsonResponse(
+        {'error': 'Invalid date format. Use YYYY-MM-DD'},
+        status=400
+    )
+
+
+async def _run_in_thread(func, *args, **kwargs):
+    """
+    Run a sync ORM function in a pool thread with its own connection.
+
+    thread_sensitive=False keeps the sections that asyncio.gather runs from
+    queueing on the single shared sync thread (and off any other async
+    view's use of it).
+    """
+    def run():
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return await sync_to_async(run, thread_sensitive=False)()
+
+
+def _account_rows(date_from, date_to, account_type, closing_entries):
+    totals = account_totals_cents(date_from, date_to, account_type, closing_entries=closing_entries)
+    accounts = Account.objects.filter(id__in=totals, is_active=True).order_by('account_number')
+    return [
+        {
+            'account__account_number': account.account_number,
+            'account__account_name': account.account_name,
+            'account__account_type': account.account_type,
+            'debit_total': totals[account.id][0],
+            'credit_total': totals[account.id][1],
+        }
+        for account in accounts
+    ]
+
+
+async def _account_totals(date_from=None, date_to=None, account_type=None, closing_entries=True):
+    """
+    Debit/credit totals per active account, from the nearest period
+    checkpoint plus the ledger lines after it.
+
+    Returns a list of dicts with account fields plus debit_total/credit_total
+    in integer cents.
+    """
+    return await _run_in_thread(_account_rows, date_from, date_to, account_type, closing_entries)
+
+
+def _signed_balance(row):
+    return signed_balance_cents(row['account__account_type'], row['debit_total'], row['credit_total'])
+
+
+async def _trial_balance(as_of_date):
+    rows = await _account_totals(date_to=as_of_date)
+    trial_balance = []
+    total_debits = 0
+    total_credits = 0
+
+    for row in rows:
+        debit_total = row['debit_total']
+        credit_total = row['credit_total']
+        if debit_total > 0 or credit_total > 0:
+            trial_balance.append({
+                'account_number': row['account__account_number'],
+                'account_name': row['account__account_name'],
+                'account_type': row['account__account_type'],
+                'debit_total': cents_to_float(debit_total),
+                'credit_total': cents_to_float(credit_total),
+                'balance': cents_to_float(_signed_balance(row))
+            })
+            total_debits += debit_total
+            total_credits += credit_total
+
+    return {
+        'as_of_date': as_of_date,
+        'accounts': trial_balance,
+        'total_debits': cents_to_float(total_debits),
+        'total_credits': cents_to_float(total_credits),
+        'difference': cents_to_float(total_debits - total_credits)
+    }
+
+
+async def _pl_section(account_type, date_from, date_to):
+    rows = await _account_totals(date_from, date_to, account_type, closing_entries=False)
+    details = []
+    total = 0
+    for row in rows:
+        amount = _signed_balance(row)
+        if amount > 0:
+            details.append({
+                'account_name': row['account__account_name'],
+                'amount': cents_to_float(amount)
+            })
+            total += amount
+    return details, total
+
+
+async def _profit_loss(date_from, date_to):
+    (revenue_details, total_revenue), (expense_details, total_expenses) = await asyncio.gather(
+        _pl_section('Revenue', date_from, date_to),
+        _pl_section('Expense', date_from, date_to),
+    )
+    return {
+        'period': {
+            'from': date_from,
+            'to': date_to
+        },
+        'revenue': {
+            'details': revenue_details,
+            'total': cents_to_float(total_revenue)
+        },
+        'expenses': {
+            'details': expense_details,
+            'total': cents_to_float(total_expenses)
+        },
+        'net_income': cents_to_float(total_revenue - total_expenses)
+    }
+
+
+async def _bs_section(account_type, as_of_date):
+    rows = await _account_totals(date_to=as_of_date, account_type=account_type)
+    details = []
+    total = 0
+    for row in rows:
+        balance = _signed_balance(row)
+        if balance == 0:
+            continue
+        if account_type == 'Asset':
+            details.append({'account_name': row['account__account_name'], 'balance': cents_to_float(balance)})
+            total += balance
+        else:
+            details.append({'account_name': row['account__account_name'], 'balance': cents_to_float(abs(balance))})
+            total += abs(balance)
+    return details, total
+
+
+async def _balance_sheet(as_of_date):
+    (assets, total_assets), (liabilities, total_liabilities), (equity, total_equity) = await asyncio.gather(
+        _bs_section('Asset', as_of_date),
+        _bs_section('Liability', as_of_date),
+        _bs_section('Equity', as_of_date),
+    )
+    return {
+        'as_of_date': as_of_date,
+        'assets': {
+            'details': assets,
+            'total': cents_to_float(total_assets)
+        },
+        'liabilities': {
+            'details': liabilities,
+            'total': cents_to_float(total_liabilities)
+        },
+        'equity': {
+            'details': equity,
+            'total': cents_to_float(total_equity)
+        },
+        'total_liabilities_equity': cents_to_float(total_liabilities + total_equity),
+        'difference': cents_to_float(total_assets - (total_liabilities + total_equity))
+    }
+
+
+def _parse_date_list(value):
+    """Parse a comma-separated list of YYYY-MM-DD dates."""
+    return [_parse_date(part.strip()) for part in value.split(',') if part.strip()]
+
+
+def _parse_period_list(value):
+    """Parse a comma-separated list of YYYY-MM-DD:YYYY-MM-DD ranges."""
+    periods = []
+    for part in value.split(','):
+        if not part.strip():
+            continue
+        date_from, date_to = part.strip().split(':')
+        periods.append((_parse_date(date_from), _parse_date(date_to)))
+    return periods
+
+
+async def trial_balance(request):
+    """
+    Trial Balance Report (async).
+
+    Accepts ?as_of_date=YYYY-MM-DD, or ?as_of_dates=d1,d2,... to return one
+    column per date, computed concurrently.
+    """
+    try:
+        if request.GET.get('as_of_dates'):
+            dates = _parse_date_list(request.GET['as_of_dates'])
+            columns = await asyncio.gather(*(_trial_balance(d) for d in dates))
+            return JsonResponse({'columns': list(columns)})
+        as_of_date = request.GET.get('as_of_date')
+        as_of_date = _parse_date(as_of_date) if as_of_date else date.today()
+    except ValueError:
+        return _bad_date()
+    return JsonResponse(await _trial_balance(as_of_date))
+
+
+async def profit_loss(request):
+    """
+    Profit & Loss Report (async).
+
+    Accepts ?date_from/?date_to like the sync view, or
+    ?periods=from:to,from:to,... to return one column per period.
+    """
+    if request.GET.get('periods'):
+        try:
+            periods = _parse_period_list(request.GET['periods'])
+        except ValueError:
+            return _bad_date()
+        columns = await asyncio.gather(*(_profit_loss(f, t) for f, t in periods))
+        return JsonResponse({'columns': list(columns)})
+
+    date_from = request.GET.get('date_from')
+    date_to = request.GET.get('date_to')
+
+    if date_from:
+        try:
+            date_from = _parse_date(date_from)
+        except ValueError:
+            date_from = None
+    else:
+        date_from = date.today().replace(day=1)  # First day of current month
+
+    if date_to:
+        try:
+            date_to = _parse_date(date_to)
+        except ValueError:
+            date_to = date.today()
+    else:
+        date_to = date.today()
+
+    return JsonResponse(await _profit_loss(date_from, date_to))
+
+
+async def balance_sheet(request):
+    """
+    Balance Sheet Report (async).
+
+    Accepts ?as_of_date=YYYY-MM-DD, or ?as_of_dates=d1,d2,... to return one
+    column per date, computed concurrently.
+    """
+    try:
+        if request.GET.get('as_of_dates'):
+            dates = _parse_date_list(request.GET['as_of_dates'])
+            columns = await asyncio.gather(*(_balance_sheet(d) for d in dates))
+            return JsonResponse({'columns': list(columns)})
+        as_of_date = request.GET.get('as_of_date')
+        as_of_date = _parse_date(as_of_date) if as_of_date else date.today()
+    except ValueError:
+        return _bad_date()
+    return JsonResponse(await _balance_sheet(as_of_date))
+
+
+async def account_balance(request, pk):
+    """Get account balance (async)"""
+    try:
+        account = await Account.objects.aget(pk=pk, is_active=True)
+    except Account.DoesNotExist:
+        raise Http404("Account not found")
+
+    as_of_date = request.GET.get('as_of_date')
+    if as_of_date:
+        try:
+            as_of_date = _parse_date(as_of_date)
+        except ValueError:
+            return _bad_date()
+    else:
+        as_of_date = date.today()
+
+    # Cached balance if available and up to date
+    balance = None
+    if account.counter_slots:
+        # Sharded counters: the AccountBalance row plus the unfolded slots
+        if as_of_date >= date.today():
+            totals = await AccountBalanceSlot.objects.filter(account=account).aaggregate(
+                debit_total=SumCents('debit_total'), credit_total=SumCents('credit_total')
+            )
+            base = await AccountBalance.objects.filter(account=account).values_list(
+                'debit_total', 'credit_total'
+            ).afirst()
+            if base:
+                totals['debit_total'] += to_cents(base[0])
+                totals['credit_total'] += to_cents(base[1])
+            totals['account__account_type'] = account.account_type
+            balance = cents_to_float(_signed_balance(totals))
+    elif as_of_date >= date.today():
+        # The cached balance includes every posting so far
+        try:
+            cached_balance = await AccountBalance.objects.aget(account=account)
+            balance = float(cached_balance.net_balance)
+        except AccountBalance.DoesNotExist:
+            pass
+
+    if balance is None:
+        # Nearest period checkpoint plus the lines after it
+        balance = float(await _run_in_thread(calculate_account_balance, account, as_of_date))
+
+    return JsonResponse({
+        'account': account.account_name,
+        'account_number': account.account_number,
+        'balance': balance,
+        'as_of_date': as_of_date
+    })
+
+
+def _feed_cursor(value):
+    """Parse a feed cursor (last sequence seen); None if invalid."""
+    try:
+        cursor = int(value or 0)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor >= 0 else None
+
+
+FEED_MAX_WAIT = 30
+FEED_STREAM_KEEPALIVE = 15
+FEED_STREAM_MAX_DURATION = 300
+
+
+async def ledger_feed(request):
+    """
+    Change feed of ledger postings (long-poll)
+
+    ?after=<sequence> returns events after that cursor, oldest first;
+    ?limit= caps the page (default 100, max 1000). With ?wait=<seconds>
+    (max 30) the request is held until at least one event arrives.
+    Resume by passing the returned cursor as ?after=.
+    """
+    after = _feed_cursor(request.GET.get('after'))
+    if after is None:
+        return JsonResponse({'error': 'after must be a non-negative integer'}, status=400)
+    try:
+        limit = min(max(int(request.GET.get('limit', feed.FEED_PAGE_SIZE)), 1), feed.FEED_MAX_PAGE_SIZE)
+        wait = min(max(float(request.GET.get('wait', 0)), 0), FEED_MAX_WAIT)
+    except ValueError:
+        return JsonResponse({'error': 'limit and wait must be numbers'}, status=400)
+
+    events = await feed.wait_for_events(after, limit, timeout=wait)
+    return JsonResponse({
+        'events': [feed.serialize_event(event) for event in events],
+        'cursor': events[-1].sequence if events else after,
+        'has_more': len(events) == limit
+    })
+
+
+async def _feed_stream(after):
+    loop = asyncio.get_running_loop()
+    yield 'retry: 2000\n\n'
+    deadline = loop.time() + FEED_STREAM_MAX_DURATION
+    while loop.time() < deadline:
+        timeout = min(FEED_STREAM_KEEPALIVE, deadline - loop.time())
+        events = await feed.wait_for_events(after, feed.FEED_MAX_PAGE_SIZE, timeout=timeout)
+        if not events:
+            yield ': keep-alive\n\n'
+            continue
+        for event in events:
+            yield feed.format_sse(event)
+        after = events[-1].sequence
+
+
+async def ledger_feed_stream(request):
+    """
+    Change feed of ledger postings as Server-Sent Events
+
+    Resumes after the Last-Event-ID header (sent automatically by
+    EventSource on reconnect) or ?after=. Sends a keep-alive comment every
+    15 seconds and closes after 5 minutes; clients reconnect and resume.
+    """
+    after = _feed_cursor(request.headers.get('Last-Event-ID') or request.GET.get('after'))
+    if after is None:
+        return HttpResponseBadRequest('after must be a non-negative integer')
+    response = StreamingHttpResponse(_feed_stream(after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Don't let nginx buffer the stream
+    return response
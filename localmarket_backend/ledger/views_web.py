@@ -1,9 +1,19 @@
+from django.core.paginator import Paginator
 from django.shortcuts import render
 from django.views.generic import TemplateView
 
+from .models import Product
+from .services import get_product, get_dashboard_summary
+
 
 class IndexView(TemplateView):
     template_name = 'ledger/index.html'
+    
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Embed the dashboard summary so the page renders without extra API calls
+        context['dashboard'] = get_dashboard_summary()
+        return context
 
 
 class AccountsView(TemplateView):
@@ -19,47 +29,11 @@ class CreateTransactionView(TemplateView):
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Get product ID from query parameter
-        product_id = self.request.GET.get('product')
+        # Get product slug from query parameter
+        product_slug = self.request.GET.get('product')
         
-        if product_id:
-            # Get product data from the same list used in InventoryView
-            # In a real app, this would query a Product model
-            products = [
-                {
-                    'id': 'citrus-ipa',
-                    'name': 'Citrus IPA',
-                    'image': 'https://images.unsplash.com/photo-1608270586620-248524c67de9?w=300&h=200&fit=crop',
-                    'price': 12.99,
-                },
-                {
-                    'id': 'chocolate-stout',
-                    'name': 'Chocolate Stout',
-                    'image': 'https://images.unsplash.com/photo-1571613316887-6f8d5cbf7ef7?w=300&h=200&fit=crop',
-                    'price': 14.99,
-                },
-                {
-                    'id': 'golden-lager',
-                    'name': 'Golden Lager',
-                    'image': 'https://images.unsplash.com/photo-1581636625402-29b2a704ef13?w=300&h=200&fit=crop',
-                    'price': 11.99,
-                },
-                {
-                    'id': 'hefeweizen',
-                    'name': 'Hefeweizen',
-                    'image': 'https://images.unsplash.com/photo-1513475382585-d06e58bcb0e0?w=300&h=200&fit=crop',
-                    'price': 13.99,
-                },
-                {
-                    'id': 'pale-ale',
-                    'name': 'Pale Ale',
-                    'image': 'https://images.unsplash.com/photo-1608270586620-248524c67de9?w=300&h=200&fit=crop',
-                    'price': 12.49,
-                },
-            ]
-            
-            # Find the product by ID
-            product = next((p for p in products if p['id'] == product_id), None)
+        if product_slug:
+            product = get_product(product_slug)
             if product:
                 context['product'] = product
         
@@ -84,40 +58,21 @@ class BalanceSheetView(TemplateView):
 
 class InventoryView(TemplateView):
     template_name = 'ledger/inventory/index.html'
+    paginate_by = 24
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Placeholder product data - replace with actual product model queries when available
-        context['products'] = [
-            {
-                'id': 'citrus-ipa',
-                'name': 'Citrus IPA',
-                'image': 'https://images.unsplash.com/photo-1608270586620-248524c67de9?w=300&h=200&fit=crop',
-                'price': 12.99,
-            },
-            {
-                'id': 'chocolate-stout',
-                'name': 'Chocolate Stout',
-                'image': 'https://images.unsplash.com/photo-1571613316887-6f8d5cbf7ef7?w=300&h=200&fit=crop',
-                'price': 14.99,
-            },
-            {
-                'id': 'golden-lager',
-                'name': 'Golden Lager',
-                'image': 'https://images.unsplash.com/photo-1581636625402-29b2a704ef13?w=300&h=200&fit=crop',
-                'price': 11.99,
-            },
-            {
-                'id': 'hefeweizen',
-                'name': 'Hefeweizen',
-                'image': 'https://images.unsplash.com/photo-1513475382585-d06e58bcb0e0?w=300&h=200&fit=crop',
-                'price': 13.99,
-            },
-            {
-                'id': 'pale-ale',
-                'name': 'Pale Ale',
-                'image': 'https://images.unsplash.com/photo-1608270586620-248524c67de9?w=300&h=200&fit=crop',
-                'price': 12.49,
-            },
-        ]
+        products = Product.objects.filter(is_active=True).select_related('stock_level').only(
+            'slug', 'name', 'image', 'price', 'stock_level__quantity_on_hand'
+        )
+        
+        vendor_id = self.request.GET.get('vendor')
+        if vendor_id:
+            products = products.filter(vendor_id=vendor_id)
+        
+        paginator = Paginator(products, self.paginate_by)
+        page_obj = paginator.get_page(self.request.GET.get('page'))
+        context['page_obj'] = page_obj
+        context['products'] = page_obj.object_list
+        context['vendor'] = vendor_id or ''
         return context
@@ -0,0 +1,299 @@
+"""
+Payment webhook ingestion
+
+The webhook view verifies the Stripe-style signature, stores the event
+(deduplicated on its id) and acknowledges straight away. Stored events are
+posted to the ledger in batches by process_pending_events(), which runs in a
+background thread after each delivery or from ``manage.py process_webhooks``.
+"""
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import DatabaseError, close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Account, WebhookEvent
+from .money import from_cents
+from .services import record_transactions
+from .validation import JournalValidationError
+
+logger = logging.getLogger(__name__)
+
+# Event types that carry a subscription payment. invoice.payment_succeeded is
+# sent for the same invoices, so only one of the two is posted.
+PAYMENT_EVENT_TYPES = ('invoice.paid',)
+LEDGER_CURRENCY = 'usd'
+MAX_TIMESTAMP = 253402300799  # 9999-12-31T23:59:59Z, the last date a DateField holds
+
+
+class SignatureError(ValueError):
+    """Raised when a webhook signature header is missing, stale or wrong."""
+
+
+def sign_payload(payload, secret, timestamp=None):
+    """
+    Build a Stripe-Signature header value for a raw payload.
+
+    Used by the local fake sender; the provider does the same on its side.
+    """
+    if timestamp is None:
+        timestamp = int(time.time())
+    signed = f'{timestamp}.'.encode() + payload
+    signature = hmac.new(secret.encode(), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def verify_signature(payload, header, secret, tolerance=300, now=None):
+    """
+    Check a Stripe-Signature header ("t=<timestamp>,v1=<hex>[,v1=...]").
+
+    Raises:
+        SignatureError: If the header is malformed, too old or no v1
+            signature matches
+    """
+    if not secret:
+        raise SignatureError('Webhook secret is not configured')
+    timestamp = None
+    signatures = []
+    for part in (header or '').split(','):
+        key, _, value = part.strip().partition('=')
+        if key == 't':
+            timestamp = value
+        elif key == 'v1':
+            signatures.append(value)
+    if timestamp is None or not signatures:
+        raise SignatureError('Malformed signature header')
+    try:
+        timestamp = int(timestamp)
+    except ValueError:
+        raise SignatureError('Malformed signature timestamp')
+    if abs((now if now is not None else time.time()) - timestamp) > tolerance:
+        raise SignatureError('Signature timestamp outside the tolerance window')
+
+    expected = hmac.new(secret.encode(), f'{timestamp}.'.encode() + payload, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise SignatureError('No matching signature')
+
+
+def store_event(payload):
+    """
+    Store a verified event unless its id was seen before.
+
+    Args:
+        payload: Raw request body (bytes)
+
+    Returns:
+        (event_id, created) - created is False for a duplicate delivery
+
+    Raises:
+        ValueError: If the body is not a JSON event with an id and type
+    """
+    try:
+        event = json.loads(payload)
+        event_id = str(event['id'])
+        event_type = str(event['type'])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError('Body is not a JSON event with an id and type')
+
+    _, created = WebhookEvent.objects.get_or_create(
+        event_id=event_id,
+        defaults={'event_type': event_type, 'payload': event}
+    )
+    return event_id, created
+
+
+def _subscription_payment(event, cash_account, revenue_account):
+    """
+    Map a payment event to a record_transactions() item.
+
+    Returns:
+        Transaction dict, or None if the event does not post anything
+
+    Raises:
+        ValueError: If the event cannot be posted
+    """
+    if event.event_type not in PAYMENT_EVENT_TYPES:
+        return None
+    data = event.payload.get('data') or {}
+    invoice = data.get('object') if isinstance(data, dict) else None
+    if not isinstance(invoice, dict):
+        raise ValueError('Event data has no invoice object')
+    currency = str(invoice.get('currency', '')).lower()
+    if currency != LEDGER_CURRENCY:
+        raise ValueError(f"Unsupported currency: {currency or 'missing'}")
+    try:
+        amount_cents = int(invoice['amount_paid'])
+    except (KeyError, TypeError, ValueError):
+        raise ValueError('Invoice has no amount_paid')
+    if amount_cents <= 0:
+        return None  # e.g. a free trial invoice
+
+    subscription_id = invoice.get('subscription') or invoice.get('id') or event.event_id
+    transitions = invoice.get('status_transitions') or {}
+    if not isinstance(transitions, dict):
+        raise ValueError('Invoice status_transitions is not an object')
+    paid_at = transitions.get('paid_at') or event.payload.get('created')
+    if paid_at:
+        try:
+            paid_at = int(paid_at)
+            if not 0 < paid_at <= MAX_TIMESTAMP:
+                raise ValueError
+            posting_date = datetime.fromtimestamp(paid_at, tz=dt_timezone.utc).date()
+        except (TypeError, ValueError, OverflowError, OSError):
+            raise ValueError(f'Invalid paid_at timestamp: {paid_at!r}')
+    else:
+        posting_date = timezone.now().date()
+    amount = from_cents(amount_cents)
+
+    return {
+        'date': posting_date,
+        'description': f"Subscription payment for {subscription_id} (invoice {invoice.get('id', '')})",
+        'reference_type': 'subscription',
+        'reference_id': str(subscription_id),
+        'entries': [
+            {'account_id': cash_account.id, 'debit': amount, 'credit': 0, 'description': 'Cash received'},
+            {'account_id': revenue_account.id, 'debit': 0, 'credit': amount, 'description': 'Subscription revenue'},
+        ],
+    }
+
+
+def process_pending_events(batch_size=None):
+    """
+    Post one batch of pending webhook events to the ledger.
+
+    The batch is posted with a single record_transactions() call. Events
+    that cannot be posted, for any reason, are marked failed (with the
+    error) and the rest of the batch is posted without them, so one bad
+    event never holds up the queue.
+
+    Returns:
+        Dict of counts: {'posted', 'ignored', 'failed'}
+    """
+    batch_size = batch_size or getattr(settings, 'PAYMENT_WEBHOOK_BATCH_SIZE', 500)
+    counts = {'posted': 0, 'ignored': 0, 'failed': 0}
+
+    with transaction.atomic():
+        # skip_locked lets several workers drain the queue side by side
+        events = list(
+            WebhookEvent.objects.select_for_update(skip_locked=True)
+            .filter(status='pending').order_by('id')[:batch_size]
+        )
+        if not events:
+            return counts
+
+        cash_account = Account.objects.get(account_number='1000')
+        revenue_account = Account.objects.get(account_number='4100')
+        now = timezone.now()
+
+        postable = []
+        for event in events:
+            event.processed_at = now
+            try:
+                item = _subscription_payment(event, cash_account, revenue_account)
+            except Exception as e:
+                # Any payload the mapping chokes on fails just this event
+                event.status, event.error = 'failed', str(e) or type(e).__name__
+                continue
+            if item is None:
+                event.status = 'ignored'
+            else:
+                postable.append((event, item))
+
+        while postable:
+            try:
+                journal_entries = record_transactions([item for _, item in postable])
+            except JournalValidationError as e:
+                bad = {error['journal'] for error in e.errors}
+                for index in bad:
+                    event = postable[index][0]
+                    event.status = 'failed'
+                    event.error = '; '.join(error['message'] for error in e.errors if error['journal'] == index)
+                postable = [pair for index, pair in enumerate(postable) if index not in bad]
+                continue
+            for (event, _), journal_entry in zip(postable, journal_entries):
+                event.status = 'posted'
+                event.journal_entry = journal_entry
+            break
+
+        WebhookEvent.objects.bulk_update(events, ['status', 'error', 'journal_entry', 'processed_at'])
+
+    for event in events:
+        counts[event.status] += 1
+    return counts
+
+
+def drain_pending_events(batch_size=None):
+    """Process batches until no pending events are left; returns total counts."""
+    totals = {'posted': 0, 'ignored': 0, 'failed': 0}
+    while True:
+        counts = process_pending_events(batch_size)
+        if not any(counts.values()):
+            return totals
+        for key, value in counts.items():
+            totals[key] += value
+
+
+# Background draining after a delivery is acknowledged
+
+_worker_lock = threading.Lock()
+_worker_wakeup = threading.Event()
+_worker = None
+
+
+WORKER_MAX_RETRIES = 5
+
+
+def _run_worker():
+    global _worker
+    failures = 0
+    try:
+        while True:
+            _worker_wakeup.clear()
+            try:
+                drain_pending_events()
+                failures = 0
+            except DatabaseError:
+                # e.g. SQLite "database is locked" while requests are writing;
+                # the events stay pending, so back off and try again
+                failures += 1
+                logger.warning('Webhook posting failed (attempt %d)', failures, exc_info=True)
+                if failures < WORKER_MAX_RETRIES:
+                    _worker_wakeup.set()
+                    time.sleep(0.2 * 2 ** failures)
+            except Exception:
+                # Events stay pending; the next delivery starts a new worker
+                logger.exception('Webhook worker stopped')
+                return
+            finally:
+                close_old_connections()
+            with _worker_lock:
+                # Exit only if nothing arrived while we were draining
+                if not _worker_wakeup.is_set():
+                    _worker = None
+                    return
+    finally:
+        with _worker_lock:
+            if _worker is threading.current_thread():
+                _worker = None
+
+
+def schedule_processing():
+    """
+    Make sure a background thread is draining the queue.
+
+    A burst of deliveries shares one thread; each one only sets a flag.
+    """
+    global _worker
+    if not getattr(settings, 'PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND', True):
+        return
+    with _worker_lock:
+        _worker_wakeup.set()
+        if _worker is None:
+            _worker = threading.Thread(target=_run_worker, name='webhook-poster', daemon=True)
+            _worker.start()
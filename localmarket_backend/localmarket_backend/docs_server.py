@@ -0,0 +1,288 @@
+"""
+In-memory serving engine for the docs folder.
+
+Keeps an index of request path -> resolved file, a size-bounded LRU cache of
+small file contents (plain and gzipped), and builds responses with ETag,
+Last-Modified and Cache-Control headers. Large files are streamed with
+FileResponse so the WSGI server's file_wrapper can use sendfile().
+
+When serving the output of ``manage.py build_docs``, the manifest lists the
+content-hashed asset names; those are sent with immutable, far-future caching.
+"""
+import gzip
+import json
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, Http404
+from django.utils.http import http_date, parse_http_date_safe
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+
+class DocFile:
+    """Metadata for one resolved docs file."""
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'content_type', 'gzip_path', 'immutable')
+
+    def __init__(self, path, stat, immutable=False):
+        self.path = path
+        self.immutable = immutable
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        content_type, _ = mimetypes.guess_type(path.name)
+        self.content_type = content_type or 'application/octet-stream'
+        self.gzip_path = None
+        gzip_path = path.with_name(path.name + '.gz')
+        try:
+            # A .gz sibling older than its source is stale; ignore it
+            if gzip_path.is_file() and gzip_path.stat().st_mtime >= stat.st_mtime:
+                self.gzip_path = gzip_path
+        except OSError:
+            pass
+
+    @property
+    def compressible(self):
+        return self.content_type.startswith(COMPRESSIBLE_TYPES)
+
+    @property
+    def gzip_etag(self):
+        """ETag of the gzip representation, distinct from the identity one."""
+        return f'{self.etag[:-1]}-gz"'
+
+    def serves_gzip(self, accepts_gzip, large):
+        """Whether a response is gzipped (large files only from a .gz sibling)."""
+        if not accepts_gzip:
+            return False
+        return self.gzip_path is not None if large else self.compressible
+
+    @property
+    def has_gzip_variant(self):
+        return self.compressible or self.gzip_path is not None
+
+
+def accepts_gzip(accept_encoding):
+    """
+    Whether an Accept-Encoding header allows gzip.
+
+    gzip (or x-gzip) with q=0 refuses it; otherwise it is accepted when
+    listed, or when * is listed with q > 0.
+    """
+    qualities = {}
+    for item in (accept_encoding or '').split(','):
+        coding, _, params = item.partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding] = quality
+    for coding in ('gzip', 'x-gzip', '*'):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+class DocsServer:
+    """
+    Resolve and serve files from a docs directory.
+
+    max_cache_bytes bounds the total size of cached content; files larger
+    than max_file_size are never cached and are streamed from disk instead.
+    """
+
+    def __init__(self, docs_dir, max_cache_bytes, max_file_size, max_age, revalidate=False):
+        self.docs_dir = Path(docs_dir).resolve()
+        self.max_cache_bytes = max_cache_bytes
+        self.max_file_size = max_file_size
+        self.max_age = max_age
+        self.revalidate = revalidate
+        self._index = {}
+        self._content = OrderedDict()
+        self._content_bytes = 0
+        self._lock = threading.Lock()
+        self.hashed_paths = self._load_manifest()
+
+    def _load_manifest(self):
+        """Return the set of content-hashed paths listed in the build manifest."""
+        try:
+            manifest = json.loads((self.docs_dir / MANIFEST_NAME).read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            return frozenset()
+        return frozenset(manifest.values())
+
+    # Path resolution
+
+    @staticmethod
+    def normalize(path):
+        if not path:
+            return 'index.html'
+        if path.endswith('/'):
+            return path + 'index.html'
+        if not path.endswith('.html') and '.' not in os.path.basename(path):
+            # If it's a directory path without trailing slash, add index.html
+            return path + '/index.html'
+        return path
+
+    def _resolve(self, path):
+        file_path = self.docs_dir / path
+        try:
+            file_path = file_path.resolve()
+        except (OSError, ValueError):
+            return None
+        # Security: Make sure the resolved path is within docs_dir
+        if not file_path.is_relative_to(self.docs_dir):
+            return None
+        try:
+            stat = file_path.stat()
+        except OSError:
+            return None
+        if not file_path.is_file():
+            return None
+        return DocFile(file_path, stat, immutable=path in self.hashed_paths)
+
+    def lookup(self, path):
+        """Return the DocFile for a request path, or None if not found."""
+        path = self.normalize(path)
+        doc = self._index.get(path)
+        if doc is not None and self.revalidate:
+            try:
+                stat = doc.path.stat()
+            except OSError:
+                stat = None
+            if stat is None or stat.st_mtime != doc.mtime or stat.st_size != doc.size:
+                self.invalidate(path)
+                doc = None
+        if doc is None:
+            doc = self._resolve(path)
+            if doc is None:
+                return None
+            with self._lock:
+                self._index[path] = doc
+        return doc
+
+    def invalidate(self, path=None):
+        """Drop one path (or everything) from the index and content cache."""
+        with self._lock:
+            if path is None:
+                self._index.clear()
+                self._content.clear()
+                self._content_bytes = 0
+                return
+            doc = self._index.pop(path, None)
+            if doc is not None:
+                for key in [(doc.path, False), (doc.path, True)]:
+                    data = self._content.pop(key, None)
+                    if data is not None:
+                        self._content_bytes -= len(data)
+
+    # Content cache
+
+    def _cached(self, doc, gzipped):
+        key = (doc.path, gzipped)
+        with self._lock:
+            data = self._content.get(key)
+            if data is not None:
+                self._content.move_to_end(key)
+                return data
+
+        if gzipped:
+            if doc.gzip_path is not None:
+                data = doc.gzip_path.read_bytes()
+            else:
+                data = gzip.compress(self._cached(doc, False), compresslevel=9, mtime=0)
+        else:
+            data = doc.path.read_bytes()
+
+        with self._lock:
+            if key not in self._content:
+                self._content[key] = data
+                self._content_bytes += len(data)
+                while self._content_bytes > self.max_cache_bytes and self._content:
+                    _, evicted = self._content.popitem(last=False)
+                    self._content_bytes -= len(evicted)
+        return data
+
+    # Responses
+
+    def _not_modified(self, request, doc):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            # Either representation's tag: both change with the source file
+            etags = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+            return bool(etags & {'*', doc.etag, doc.gzip_etag})
+        if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+        if if_modified_since is not None:
+            since = parse_http_date_safe(if_modified_since)
+            return since is not None and int(doc.mtime) <= since
+        return False
+
+    def _set_headers(self, response, doc, gzipped=False):
+        response['ETag'] = doc.gzip_etag if gzipped else doc.etag
+        response['Last-Modified'] = http_date(doc.mtime)
+        if doc.immutable:
+            response['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        else:
+            response['Cache-Control'] = f'public, max-age={self.max_age}'
+        if doc.has_gzip_variant:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+    def serve(self, request, path):
+        doc = self.lookup(path)
+        if doc is None:
+            raise Http404("Page not found")
+
+        large = doc.size > self.max_file_size
+        gzipped = doc.serves_gzip(accepts_gzip(request.META.get('HTTP_ACCEPT_ENCODING')), large)
+
+        if self._not_modified(request, doc):
+            return self._set_headers(HttpResponseNotModified(), doc, gzipped)
+
+        if large:
+            # Large assets go through the server's file_wrapper (sendfile)
+            if gzipped:
+                response = FileResponse(open(doc.gzip_path, 'rb'), content_type=doc.content_type)
+                response['Content-Encoding'] = 'gzip'
+            else:
+                response = FileResponse(open(doc.path, 'rb'), content_type=doc.content_type)
+            return self._set_headers(response, doc, gzipped)
+
+        response = HttpResponse(self._cached(doc, gzipped), content_type=doc.content_type)
+        if gzipped:
+            response['Content-Encoding'] = 'gzip'
+        response['Content-Length'] = str(len(response.content))
+        return self._set_headers(response, doc, gzipped)
+
+
+_server = None
+
+
+def get_docs_server():
+    """Return the process-wide DocsServer configured from settings."""
+    global _server
+    if _server is None:
+        docs_dir = getattr(settings, 'DOCS_ROOT', settings.BASE_DIR.parent / 'docs')
+        build_dir = getattr(settings, 'DOCS_BUILD_DIR', None)
+        if build_dir is not None and (Path(build_dir) / MANIFEST_NAME).is_file():
+            docs_dir = build_dir
+        _server = DocsServer(
+            docs_dir=docs_dir,
+            max_cache_bytes=getattr(settings, 'DOCS_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+            max_file_size=getattr(settings, 'DOCS_CACHE_MAX_FILE_SIZE', 512 * 1024),
+            max_age=getattr(settings, 'DOCS_CACHE_MAX_AGE', 300),
+            revalidate=getattr(settings, 'DOCS_CACHE_REVALIDATE', settings.DEBUG),
+        )
+    return _server
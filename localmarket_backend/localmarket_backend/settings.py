@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -80,6 +81,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # WAL lets reads run alongside the writer. IMMEDIATE takes the
+            # write lock at BEGIN, so concurrent postings wait on the busy
+            # timeout instead of failing on a read-to-write lock upgrade.
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
@@ -123,6 +132,38 @@ STATICFILES_DIRS = [
     BASE_DIR.parent / 'docs',  # Include docs folder for images
 ]
 
+# Docs site serving (see localmarket_backend/docs_server.py)
+DOCS_ROOT = BASE_DIR.parent / 'docs'
+DOCS_BUILD_DIR = BASE_DIR / 'docs_build'  # Output of manage.py build_docs; served when present
+DOCS_CACHE_MAX_BYTES = 32 * 1024 * 1024  # Total in-memory content cache size
+DOCS_CACHE_MAX_FILE_SIZE = 512 * 1024  # Larger files are streamed with sendfile
+DOCS_CACHE_MAX_AGE = 300  # Cache-Control max-age in seconds
+DOCS_CACHE_REVALIDATE = DEBUG  # Re-stat cached files on each request
+
+# Payment webhooks (see ledger/webhooks.py)
+# Signing secret shared with the provider; a fixed value for local fake senders in DEBUG
+PAYMENT_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', 'whsec_local_dev' if DEBUG else '')
+PAYMENT_WEBHOOK_TOLERANCE = 300  # Max age of a signature timestamp, in seconds
+PAYMENT_WEBHOOK_BATCH_SIZE = 500  # Events posted per record_transactions() call
+# Drain the queue in a background thread after acknowledging; set False when
+# running manage.py process_webhooks as a separate worker
+PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND = True
+
+# Columnar archive of closed periods (see ledger/archive.py; manage.py archive_ledger)
+LEDGER_ARCHIVE_DIR = Path(os.environ.get('LEDGER_ARCHIVE_DIR', BASE_DIR / 'archive'))
+
+# In-process Fenwick index of balances per account and day (see ledger/balance_index.py)
+LEDGER_BALANCE_INDEX = os.environ.get('LEDGER_BALANCE_INDEX', '') == '1'
+
+# NumPy column cache of posted ledger lines (see ledger/analytics.py; manage.py analytics_snapshot)
+LEDGER_ANALYTICS_DIR = Path(os.environ.get('LEDGER_ANALYTICS_DIR', BASE_DIR / 'analytics'))
+
+# Month-end vendor statements (see ledger/statements.py; manage.py generate_vendor_statements)
+LEDGER_STATEMENTS_DIR = Path(os.environ.get('LEDGER_STATEMENTS_DIR', BASE_DIR / 'statements'))
+
+# Subscription billing runs (see ledger/billing.py; manage.py run_billing)
+SUBSCRIPTION_BILLING_CHUNK_SIZE = 500  # Subscriptions charged per transaction
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 